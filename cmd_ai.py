@@ -2,10 +2,12 @@ import os
 import argparse
 import sys
 from typing import Optional
-from mistralai import Mistral
 from mistralai.models import UserMessage, SystemMessage, AssistantMessage
 import contextlib
 
+from src.core.async_llm_client import AsyncMistralClient
+from src.core.rate_limiter import RateLimiter
+
 @contextlib.contextmanager
 def interactive_stdin_from_tty(is_piped: bool, should_redirect_tty: bool):
     """
@@ -75,6 +77,13 @@ class CLIAssistant:
         self.api_key = os.getenv("MISTRAL_API_KEY")
         if not self.api_key:
             raise RuntimeError("MISTRAL_API_KEY 环境变量未设置！")
+        # 可选的自定义 API 地址（如代理网关）
+        self.server_url = os.getenv("MISTRAL_SERVER_URL") or None
+        self.client = AsyncMistralClient({"api_key": self.api_key, "server_url": self.server_url})
+        # 与 ai 命令共享本机的限流状态（交互式请求）
+        self.client.policy.rate_limiter = RateLimiter()
+        # 不覆盖各模型的默认采样参数
+        self.client.default_params = {}
         self.history = []
 
     async def generate(self, prompt, mode="command"):
@@ -86,17 +95,18 @@ class CLIAssistant:
             UserMessage(content=prompt)  # 当前用户输入
         ]
 
-        async with Mistral(api_key=self.api_key) as client:
-            response = await client.chat.stream_async(
-                model=self.MODELS[mode],
-                messages=messages
-            )
-            async for chunk in response:
-                if content := chunk.data.choices[0].delta.content:
-                    yield content
+        # 整个会话共用一个连接池，每轮对话复用已建立的连接；中途断开时客户端自动续传
+        async for chunk in self.client.stream(messages, model=self.MODELS[mode]):
+            yield chunk
 
     # 修改 run 方法的签名，添加 initial_prompt_arg 参数
     async def run(self, mode: str, initial_prompt_arg: Optional[str] = None):
+        try:
+            await self._run(mode, initial_prompt_arg)
+        finally:
+            await self.client.aclose()
+
+    async def _run(self, mode: str, initial_prompt_arg: Optional[str] = None):
         internal_mode = self.MODE_MAPPING.get(mode, mode)
 
         is_piped_input = not sys.stdin.isatty() # 检查是否是管道输入
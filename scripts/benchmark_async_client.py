@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+连接复用基准测试
+比较交互式会话中每轮新建客户端（每轮都要重新握手）与 AsyncMistralClient 共享连接池的单轮延迟
+
+用法:
+    python scripts/benchmark_async_client.py                    # 本地模拟服务，模拟 50ms 握手
+    python scripts/benchmark_async_client.py --handshake-ms 120
+    MISTRAL_API_KEY=... python scripts/benchmark_async_client.py --server-url https://api.mistral.ai
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from contextlib import nullcontext
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core import llm_client
+from src.core.async_llm_client import AsyncMistralClient
+
+MESSAGES = [{"role": "user", "content": "用一句话解释 ls -la"}]
+
+
+async def per_turn_client(api_key, server_url, model, turns):
+    """旧的做法：每轮对话都新建 SDK 客户端"""
+    latencies = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        async with llm_client.Mistral(api_key=api_key, server_url=server_url) as client:
+            response = await client.chat.stream_async(model=model, messages=MESSAGES, max_tokens=16)
+            async with response:
+                async for _ in response:
+                    pass
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def pooled_client(api_key, server_url, model, turns):
+    """新的做法：整个会话共用 AsyncMistralClient 的连接池"""
+    latencies = []
+    async with AsyncMistralClient({"api_key": api_key, "server_url": server_url, "model": model}) as client:
+        for _ in range(turns):
+            start = time.perf_counter()
+            async for _ in client.stream(MESSAGES, max_tokens=16):
+                pass
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def summarize(name, latencies):
+    """输出延迟统计（首轮单独列出：两种做法的首轮都需要握手）"""
+    rest = latencies[1:] or latencies
+    print(f"{name:<12} 首轮 {latencies[0] * 1000:7.1f}ms  "
+          f"后续中位数 {statistics.median(rest) * 1000:7.1f}ms  平均 {statistics.mean(rest) * 1000:7.1f}ms")
+    return statistics.median(rest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较每轮新建客户端与共享连接池的单轮延迟")
+    parser.add_argument("--turns", type=int, default=10, help="对话轮数")
+    parser.add_argument("--server-url", help="API 地址，默认启动本地模拟服务")
+    parser.add_argument("--model", default="mistral-small-latest", help="模型名称")
+    parser.add_argument("--handshake-ms", type=float, default=50,
+                        help="本地模拟服务每个新连接的握手耗时(毫秒)")
+    args = parser.parse_args()
+
+    if args.server_url:
+        api_key = os.environ.get("MISTRAL_API_KEY")
+        if not api_key:
+            parser.error("使用 --server-url 时需要设置 MISTRAL_API_KEY")
+        server = nullcontext(None)
+    else:
+        from tests.fake_server import FakeChatServer
+        api_key = "benchmark"
+        server = FakeChatServer()
+        server.connect_delay = args.handshake_ms / 1000
+
+    with server as fake:
+        server_url = args.server_url or fake.url
+        print(f"目标: {server_url}，{args.turns} 轮")
+        before = summarize("每轮新建", asyncio.run(per_turn_client(api_key, server_url, args.model, args.turns)))
+        after = summarize("共享连接池", asyncio.run(pooled_client(api_key, server_url, args.model, args.turns)))
+        if fake is not None:
+            print(f"模拟服务共建立 {fake.connections} 个连接")
+
+    print(f"每轮节省: {(before - after) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
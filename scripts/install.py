@@ -5,9 +5,17 @@ AI Terminal 安装脚本
 """
 
 import os
+import re
 import sys
+import time
 import shutil
+import hashlib
+import zipfile
+import tempfile
+import compileall
 import subprocess
+import py_compile
+import importlib.metadata
 from pathlib import Path
 
 # 添加项目根目录到 Python 路径
@@ -16,6 +24,15 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from src.zsh_integration.install import install_zsh_integration, create_completion_script
 from src.utils.config_loader import create_default_config
 
+# 运行时依赖（其纯 Python 依赖会被打包进启动包）
+RUNTIME_REQUIREMENTS = ["mistralai", "pyyaml", "click"]
+
+# 校验启动包时导入的模块：入口模块和运行时依赖（--help 不会导入 mistralai 和 yaml）
+BUNDLE_CHECK_IMPORTS = ["src.main", "click", "yaml", "mistralai"]
+
+# 编译扩展的文件后缀，含有这些文件的依赖无法从 zip 中导入
+EXTENSION_SUFFIXES = (".so", ".pyd", ".dylib")
+
 
 def install_ai_terminal():
     """
@@ -65,6 +82,7 @@ def install_ai_terminal():
     
         # 创建可执行脚本
         create_executable_script(bin_dir)
+        create_daemon_scripts(bin_dir)
         
         # 创建默认配置
         config_path = os.path.join(ai_terminal_dir, "config.yaml")
@@ -78,6 +96,11 @@ def install_ai_terminal():
         # 安装依赖
         install_dependencies()
         
+        # 依赖安装完成后构建预编译的启动包，并替换启动脚本
+        create_zipapp_launcher(bin_dir, os.path.join(ai_terminal_dir, "src"))
+        if os.path.islink(os.path.join(ai_terminal_dir, "src")):
+            print("开发模式下修改源码后，请重新运行安装脚本以更新启动包。")
+        
         print("\nAI Terminal 安装成功!")
         print("请确保设置了 Mistral API 密钥:")
         print("  export MISTRAL_API_KEY='your-api-key'")
@@ -126,6 +149,326 @@ if __name__ == "__main__":
     os.chmod(script_path, 0o755)
 
 
+def create_zipapp_launcher(bin_dir, src_dir):
+    """
+    构建预编译的启动包 ai_terminal.pyz，并将 ai_terminal 替换为以隔离模式(-I -S)启动它的脚本
+    
+    启动包包含项目源码和纯 Python 依赖的 .pyc；含编译扩展的依赖仍从其安装目录加载，
+    该目录在构建时写入启动包。源码、依赖版本或解释器未变化时跳过重建，但启动脚本总是重新写入
+    （create_executable_script 每次安装都会先写入普通启动脚本）。
+    
+    Args:
+        bin_dir (str): 可执行文件目录
+        src_dir (str): 项目 src 目录
+        
+    Returns:
+        bool: 启动包是否可用
+    """
+    script_path = os.path.join(bin_dir, "ai_terminal")
+    zipapp_path = os.path.join(bin_dir, "ai_terminal.pyz")
+    stamp_path = zipapp_path + ".stamp"
+    
+    try:
+        pure, extension_paths = collect_runtime_distributions()
+        stamp = compute_build_stamp(src_dir, pure)
+        before = measure_startup([sys.executable, script_path])
+        
+        if os.path.exists(zipapp_path) and _read_text(stamp_path) == stamp:
+            print("启动包已是最新，跳过重建。")
+        else:
+            print("构建预编译启动包...")
+            build_zipapp(zipapp_path, src_dir, pure, extension_paths)
+            with open(stamp_path, "w") as f:
+                f.write(stamp)
+        
+        error = check_zipapp(zipapp_path, extension_paths)
+        if error is not None:
+            # 下次安装时重新构建
+            os.remove(stamp_path)
+            print(f"警告: 启动包无法导入运行时依赖，继续使用普通启动脚本: {error}")
+            return False
+        
+        launcher = os.path.join(bin_dir, "ai_terminal.launcher")
+        with open(launcher, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" -I -S "{zipapp_path}" "$@"\n')
+        os.chmod(launcher, 0o755)
+        
+        after = measure_startup([launcher])
+        if after is None:
+            os.remove(launcher)
+            # 下次安装时重新构建
+            os.remove(stamp_path)
+            print("启动包无法运行，继续使用普通启动脚本。")
+            return False
+        os.replace(launcher, script_path)
+        if before is not None:
+            print(f"启动耗时: {before * 1000:.0f}ms -> {after * 1000:.0f}ms")
+    except Exception as e:
+        print(f"构建启动包失败，继续使用普通启动脚本: {str(e)}")
+        return False
+    
+    return True
+
+
+def collect_runtime_distributions():
+    """
+    收集运行时依赖的闭包，并区分纯 Python 依赖和含编译扩展的依赖
+    
+    Returns:
+        tuple: (纯 Python 依赖的 Distribution 列表, 含编译扩展依赖的安装目录列表)
+        
+    Raises:
+        RuntimeError: 有依赖未安装（环境标记不适用于当前解释器的依赖除外）
+    """
+    # 依赖刚由 pip 在子进程中安装，清除导入系统缓存的目录列表
+    importlib.invalidate_caches()
+    seen, missing = {}, []
+    pending = [(name, None) for name in RUNTIME_REQUIREMENTS]
+    while pending:
+        name, marker = pending.pop()
+        key = re.sub(r"[-_.]+", "-", name).lower()
+        if key in seen:
+            continue
+        try:
+            dist = importlib.metadata.distribution(name)
+        except importlib.metadata.PackageNotFoundError:
+            seen[key] = None
+            if marker is None or _marker_applies(marker):
+                missing.append(name)
+            continue
+        seen[key] = dist
+        for requirement in dist.requires or []:
+            if "extra ==" in requirement:
+                continue
+            _, _, marker = requirement.partition(";")
+            pending.append((re.match(r"[A-Za-z0-9_.\-]+", requirement).group(0), marker.strip() or None))
+    
+    if missing:
+        raise RuntimeError(f"以下依赖未安装: {', '.join(sorted(missing))}")
+    
+    pure, extension_paths = [], []
+    for dist in seen.values():
+        if dist is None:
+            continue
+        files = dist.files
+        if files is None or any(str(f).endswith(EXTENSION_SUFFIXES) for f in files):
+            path = str(dist.locate_file(""))
+            if path not in extension_paths:
+                extension_paths.append(path)
+        else:
+            pure.append(dist)
+    return pure, extension_paths
+
+
+def _marker_applies(marker):
+    """
+    依赖的环境标记是否适用于当前解释器
+    
+    用 pip 依赖的 packaging 求值；packaging 不可用时视为不适用，由 check_zipapp 的导入校验兜底。
+    
+    Args:
+        marker (str): 环境标记，如 python_version < "3.8"
+        
+    Returns:
+        bool: 是否适用
+    """
+    try:
+        from packaging.markers import Marker
+    except ImportError:
+        return False
+    return Marker(marker).evaluate()
+
+
+def check_zipapp(zipapp_path, extension_paths):
+    """
+    以隔离模式(-I -S)从启动包导入入口模块和运行时依赖
+    
+    Args:
+        zipapp_path (str): 启动包路径
+        extension_paths (list): 含编译扩展依赖的安装目录
+        
+    Returns:
+        str: 导入失败时的错误信息，成功时返回 None
+    """
+    code = (
+        "import sys\n"
+        f"sys.path[:0] = {[zipapp_path, *extension_paths]!r}\n"
+        f"import {', '.join(BUNDLE_CHECK_IMPORTS)}\n"
+    )
+    result = subprocess.run([sys.executable, "-I", "-S", "-c", code], capture_output=True, text=True)
+    if result.returncode == 0:
+        return None
+    lines = result.stderr.strip().splitlines()
+    return lines[-1] if lines else f"退出码 {result.returncode}"
+
+
+def compute_build_stamp(src_dir, distributions):
+    """
+    计算构建标记：解释器版本、项目源码内容和依赖版本的哈希
+    
+    Args:
+        src_dir (str): 项目 src 目录
+        distributions (list): 打包的依赖
+        
+    Returns:
+        str: 构建标记
+    """
+    digest = hashlib.sha256()
+    digest.update(sys.version.encode())
+    digest.update(sys.executable.encode())
+    for path in sorted(Path(src_dir).resolve().rglob("*.py")):
+        digest.update(str(path).encode())
+        digest.update(path.read_bytes())
+    for dist in sorted(distributions, key=lambda d: d.metadata["Name"].lower()):
+        digest.update(f"{dist.metadata['Name']}=={dist.version}".encode())
+    return digest.hexdigest()
+
+
+def build_zipapp(zipapp_path, src_dir, distributions, extension_paths):
+    """
+    构建启动包：在临时目录中汇总文件、预编译为 .pyc，再写入 zip
+    
+    Args:
+        zipapp_path (str): 输出路径
+        src_dir (str): 项目 src 目录
+        distributions (list): 需要打包的纯 Python 依赖
+        extension_paths (list): 含编译扩展依赖的安装目录
+    """
+    with tempfile.TemporaryDirectory() as staging:
+        shutil.copytree(os.path.realpath(src_dir), os.path.join(staging, "src"),
+                        ignore=shutil.ignore_patterns("__pycache__", "*.pyc"))
+        
+        for dist in distributions:
+            for file in dist.files:
+                relative = str(file)
+                if relative.startswith("..") or "__pycache__" in relative or relative.endswith(".pyc"):
+                    continue
+                source = str(dist.locate_file(file))
+                if not os.path.isfile(source):
+                    continue
+                target = os.path.join(staging, relative)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(source, target)
+        
+        with open(os.path.join(staging, "__main__.py"), "w") as f:
+            f.write(
+                "import sys\n"
+                f"sys.path[1:1] = {extension_paths!r}\n"
+                "from src.main import main\n"
+                "main()\n"
+            )
+        
+        # 以 legacy 布局（与源码同目录的 .pyc）预编译，zipimport 可直接加载；
+        # 不校验源码的哈希 pyc 避免 zip 内时间戳精度带来的失效
+        compileall.compile_dir(staging, quiet=1, legacy=True, workers=0,
+                               ddir=zipapp_path,
+                               invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+        
+        tmp_path = zipapp_path + ".tmp"
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as zf:
+            for root, dirs, files in os.walk(staging):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    arcname = os.path.relpath(path, staging)
+                    if _include_in_zipapp(arcname):
+                        zf.write(path, arcname)
+        os.replace(tmp_path, zipapp_path)
+
+
+def _include_in_zipapp(arcname):
+    """
+    判断文件是否写入启动包
+    
+    zipimport 启动时需要解析整个 zip 目录，条目越少启动越快：依赖只保留 .pyc、
+    数据文件和 importlib.metadata 需要的元数据；项目源码保留 .py 以便显示完整的错误堆栈。
+    
+    Args:
+        arcname (str): zip 内的相对路径
+        
+    Returns:
+        bool: 是否写入
+    """
+    parts = arcname.split(os.sep)
+    if parts[0] == "src" or arcname == "__main__.py":
+        return True
+    if arcname.endswith((".py", ".pyi")):
+        return False
+    if parts[0].endswith(".dist-info"):
+        return parts[-1] in ("METADATA", "entry_points.txt", "top_level.txt")
+    return True
+
+
+def measure_startup(command, runs=5):
+    """
+    测量启动耗时（执行 --help 的中位数）
+    
+    Args:
+        command (list): 启动命令
+        runs (int): 测量次数
+        
+    Returns:
+        float: 启动耗时(秒)，命令失败时返回 None
+    """
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(command + ["--help"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if result.returncode != 0:
+            return None
+        durations.append(time.perf_counter() - start)
+    return sorted(durations)[len(durations) // 2]
+
+
+def _read_text(path):
+    """读取文本文件，不存在时返回 None"""
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def create_daemon_scripts(bin_dir):
+    """
+    创建守护进程相关的脚本：瘦客户端 ai_client 和管理命令 ai_terminald
+    
+    Args:
+        bin_dir (str): 可执行文件目录
+    """
+    # 瘦客户端只依赖标准库，可在 -I -S 模式下快速启动
+    client_content = """#!/usr/bin/env python3
+import os
+import sys
+
+sys.path.insert(0, os.path.expanduser("~/.ai_terminal"))
+
+from src.core.daemon import run_client, DAEMON_UNAVAILABLE
+
+if __name__ == "__main__":
+    code = run_client(sys.argv[1:])
+    sys.exit(DAEMON_UNAVAILABLE if code is None else code)
+"""
+    
+    daemon_content = """#!/usr/bin/env python3
+import os
+import sys
+
+sys.path.insert(0, os.path.expanduser("~/.ai_terminal"))
+
+from src.core.daemon import main
+
+if __name__ == "__main__":
+    sys.exit(main())
+"""
+    
+    for name, content in (("ai_client", client_content), ("ai_terminald", daemon_content)):
+        script_path = os.path.join(bin_dir, name)
+        with open(script_path, "w") as f:
+            f.write(content)
+        os.chmod(script_path, 0o755)
+
+
 def install_dependencies():
     """
     安装依赖包
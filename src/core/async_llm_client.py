@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+异步 Mistral API 客户端模块
+持有一个长期存在的 HTTP 连接池（keep-alive，安装了 h2 时使用 HTTP/2），
+多轮对话和并发请求复用已建立的连接，不必每次重新进行 TCP/TLS 握手
+"""
+
+import asyncio
+import importlib.util
+from typing import AsyncGenerator, Dict, List, Optional
+
+from src.core import llm_client
+from src.core.llm_client import MistralClient
+from src.core.request_policy import is_retryable
+from src.core.stream_resume import EchoedPrefixFilter, StreamInterruptedError, continuation_messages
+
+DEFAULT_MAX_CONNECTIONS = 10
+# 空闲连接的保留时间（秒），交互式会话中两轮之间的思考时间通常在这个范围内
+DEFAULT_KEEPALIVE_EXPIRY = 120
+
+
+class AsyncMistralClient(MistralClient):
+    """Mistral API 异步客户端
+
+    在 MistralClient 的基础上增加基于连接池的异步接口 complete / stream，多个协程可以并发调用；
+    同步接口保持不变，因此也可以直接交给各处理器使用。
+    """
+
+    def __init__(self, config: Optional[Dict] = None, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY):
+        """
+        初始化异步客户端
+
+        Args:
+            config (dict): 配置参数，包含 API 密钥、模型名称等
+            max_connections (int): 连接池的最大连接数
+            keepalive_expiry (float): 空闲连接的保留时间（秒）
+        """
+        super().__init__(config)
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._http = None
+        self._async_sdk = None
+
+    @property
+    def http2(self) -> bool:
+        """是否可以使用 HTTP/2（需要安装 h2）"""
+        return importlib.util.find_spec("h2") is not None
+
+    @property
+    def async_client(self):
+        """使用共享连接池的 SDK 客户端，首次使用时创建"""
+        if self._async_sdk is None:
+            import httpx
+            self._http = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                )
+            )
+            self._async_sdk = llm_client.Mistral(api_key=self.api_key, server_url=self.server_url, async_client=self._http)
+        return self._async_sdk
+
+    async def warm_up_async(self, timeout: float = 5.0) -> bool:
+        """
+        预先建立到 API 服务器的连接，放入连接池
+
+        Args:
+            timeout (float): 预热请求的超时时间（秒）
+
+        Returns:
+            bool: 是否成功建立连接
+        """
+        try:
+            server_url, _ = self.async_client.sdk_configuration.get_server_details()
+            await self._http.head(server_url, timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+    async def complete(self, messages: List[Dict], model: Optional[str] = None, **kwargs) -> str:
+        """
+        生成完整响应
+
+        Args:
+            messages (list): 消息列表
+            model (str): 模型名称，默认使用配置中的模型
+            **kwargs: temperature、max_tokens、top_p 等采样参数
+
+        Returns:
+            str: 生成的响应文本
+        """
+        model = model or self.model
+        params = {**self.default_params, **kwargs}
+
+        cache_key = self._cache_key(messages, params, model)
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            return cached["content"]
+
+        self._rate_charged = 0
+        chat_response = await self.policy.call_async(
+            lambda timeout: self.async_client.chat.complete_async(
+                model=model,
+                messages=messages,
+                **self._sampling_args(params),
+                timeout_ms=int(timeout * 1000)
+            ),
+            kind="complete",
+            tokens=self._rate_tokens(messages, params, model)
+        )
+
+        self.last_usage = self._usage_to_dict(chat_response.usage)
+        self.last_finish_reason = chat_response.choices[0].finish_reason
+
+        content = chat_response.choices[0].message.content
+        self._settle_rate_limit()
+        self._cache_store(cache_key, content)
+        return content
+
+    async def stream(self, messages: List[Dict], model: Optional[str] = None, **kwargs) -> AsyncGenerator[str, None]:
+        """
+        生成流式响应，中途断开时以已收到的内容作为 assistant 前缀续传
+
+        Args:
+            messages (list): 消息列表
+            model (str): 模型名称，默认使用配置中的模型
+            **kwargs: temperature、max_tokens、top_p 等采样参数
+
+        Yields:
+            str: 流式响应的每个片段
+        """
+        model = model or self.model
+        params = {**self.default_params, **kwargs}
+
+        cache_key = self._cache_key(messages, params, model)
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            if cached["content"]:
+                yield cached["content"]
+            return
+
+        self.last_usage = None
+        self.last_finish_reason = None
+        self.last_resumes = 0
+        self._rate_charged = 0
+        chunks = []
+        for resume in range(self.policy.max_resumes + 1):
+            partial = "".join(chunks)
+            request_messages = continuation_messages(messages, partial)
+            echo_filter = EchoedPrefixFilter(partial)
+            try:
+                stream, head, events = await self.policy.call_async(
+                    lambda timeout: self._open_stream_async(request_messages, model, params, timeout),
+                    kind="stream",
+                    discard=lambda opened: opened[0].response.aclose(),
+                    tokens=self._rate_tokens(request_messages, params, model)
+                )
+                async with stream:
+                    for chunk in head:
+                        content = self._consume_chunk(chunk, echo_filter)
+                        if content:
+                            chunks.append(content)
+                            yield content
+                    async for event in events:
+                        content = self._consume_chunk(event.data, echo_filter)
+                        if content:
+                            chunks.append(content)
+                            yield content
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if resume >= self.policy.max_resumes:
+                    raise StreamInterruptedError(f"流式响应在结束前中断: {e}") from e
+            else:
+                # 没有收到结束原因就结束的流同样视为中断
+                if self.last_finish_reason:
+                    break
+                if resume >= self.policy.max_resumes:
+                    raise StreamInterruptedError("流式响应在结束前中断")
+            self.last_resumes += 1
+            await asyncio.sleep(self.policy.backoff(resume))
+
+        self._settle_rate_limit()
+        self._cache_store(cache_key, "".join(chunks))
+
+    async def _open_stream_async(self, messages: List[Dict], model: str, params: Dict, timeout: float):
+        """
+        发起流式请求并读取到首个 token 为止
+
+        Returns:
+            tuple: (EventStreamAsync, 已读取的片段列表, 剩余事件的异步迭代器)
+        """
+        stream = await self.async_client.chat.stream_async(
+            model=model,
+            messages=messages,
+            **self._sampling_args(params),
+            timeout_ms=int(timeout * 1000)
+        )
+        events = stream.__aiter__()
+        head = []
+        try:
+            async for event in events:
+                head.append(event.data)
+                if self._is_first_token(event.data):
+                    break
+        except BaseException:
+            await stream.response.aclose()
+            raise
+        return stream, head, events
+
+    async def generate_response_async(self, user_input: str, context: Optional[Dict] = None, **kwargs) -> str:
+        """
+        generate_response 的异步版本
+
+        Args:
+            user_input (str): 用户输入的文本
+            context (dict): 上下文信息，包含历史对话、系统提示等
+            **kwargs: 传递给 API 的其他参数
+
+        Returns:
+            str: 生成的响应文本
+        """
+        messages, params = self._prepare_request(user_input, context, kwargs)
+        return await self.complete(messages, **params)
+
+    async def generate_streaming_response_async(self, user_input: str, context: Optional[Dict] = None,
+                                                **kwargs) -> AsyncGenerator[str, None]:
+        """
+        generate_streaming_response 的异步版本
+
+        Args:
+            user_input (str): 用户输入的文本
+            context (dict): 上下文信息，包含历史对话、系统提示等
+            **kwargs: 传递给 API 的其他参数
+
+        Yields:
+            str: 流式响应的每个片段
+        """
+        messages, params = self._prepare_request(user_input, context, kwargs)
+        async for chunk in self.stream(messages, **params):
+            yield chunk
+
+    async def aclose(self):
+        """关闭连接池"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self._async_sdk = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
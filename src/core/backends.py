@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+模型服务后端模块
+统一 Mistral SDK 和 OpenAI 兼容 HTTP API 的调用方式：complete 返回完整响应，
+stream 返回可迭代的流式事件；两者的返回对象结构与 mistralai SDK 一致，调用方无需区分后端
+"""
+
+import json
+from typing import Callable, Dict, List, Optional
+
+BACKEND_TYPES = ("mistral", "openai")
+
+
+class BackendHTTPError(Exception):
+    """后端返回了错误状态码（status_code 和 headers 与 SDK 的异常一致，供重试判断使用）"""
+
+    def __init__(self, status_code: int, body: str = "", headers: Optional[Dict] = None):
+        super().__init__(f"HTTP {status_code}: {body[:200]}")
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+
+class Backend:
+    """后端接口"""
+
+    def __init__(self, name: str, model: Optional[str] = None):
+        """
+        初始化后端
+
+        Args:
+            name (str): 端点名称（用于统计和日志）
+            model (str): 该端点使用的模型，为空时使用请求指定的模型
+        """
+        self.name = name
+        self.model = model
+        # 请求体压缩策略（RequestCompressor），为 None 时不压缩
+        self.compressor = None
+
+    def complete(self, model: str, messages: List[Dict], args: Dict, timeout: float):
+        """
+        生成完整响应
+
+        Args:
+            model (str): 模型名称
+            messages (list): 消息列表
+            args (dict): 采样参数
+            timeout (float): 超时时间（秒）
+
+        Returns:
+            ChatCompletionResponse 结构的对象（choices、usage）
+        """
+        raise NotImplementedError("子类必须实现此方法")
+
+    def stream(self, model: str, messages: List[Dict], args: Dict, timeout: float):
+        """
+        发起流式请求
+
+        Returns:
+            流对象：可作为上下文管理器使用，迭代得到 data 为 CompletionChunk 结构的事件，
+            response.close() 关闭底层连接
+        """
+        raise NotImplementedError("子类必须实现此方法")
+
+    def warm_up(self, timeout: float) -> bool:
+        """预热到端点的连接"""
+        return False
+
+
+class MistralBackend(Backend):
+    """使用 mistralai SDK 的后端"""
+
+    def __init__(self, name: str, sdk: Callable[[], object], model: Optional[str] = None):
+        """
+        初始化后端
+
+        Args:
+            name (str): 端点名称
+            sdk (callable): 返回 SDK 客户端的函数（SDK 在首次请求时才加载）
+            model (str): 该端点使用的模型
+        """
+        super().__init__(name, model)
+        self._sdk = sdk
+
+    def complete(self, model, messages, args, timeout):
+        return self._sdk().chat.complete(model=model, messages=messages, **args, timeout_ms=int(timeout * 1000))
+
+    def stream(self, model, messages, args, timeout):
+        return self._sdk().chat.stream(model=model, messages=messages, **args, timeout_ms=int(timeout * 1000))
+
+    def warm_up(self, timeout):
+        try:
+            config = self._sdk().sdk_configuration
+            server_url, _ = config.get_server_details()
+            # 任意响应（包括 404）都说明连接已建立并留在连接池中
+            config.client.head(server_url, timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+
+class OpenAICompatibleBackend(Backend):
+    """OpenAI 兼容的 HTTP API（如本地推理网关）"""
+
+    def __init__(self, name: str, base_url: str, api_key: Optional[str] = None, model: Optional[str] = None):
+        """
+        初始化后端
+
+        Args:
+            name (str): 端点名称
+            base_url (str): API 地址，包含版本路径（如 http://localhost:8000/v1）
+            api_key (str): API 密钥，为空时不发送 Authorization
+            model (str): 该端点使用的模型
+        """
+        super().__init__(name, model)
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self._http = None
+
+    @property
+    def http(self):
+        """长期存在的 HTTP 连接池，首次使用时创建"""
+        if self._http is None:
+            if self.compressor is not None:
+                from src.core.compression import compressing_client
+                self._http = compressing_client(self.compressor)
+            else:
+                import httpx
+                self._http = httpx.Client()
+        return self._http
+
+    def _request(self, model, messages, args, stream):
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream" if stream else "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        # prefix 是 Mistral 的扩展字段；OpenAI 兼容服务把末尾的 assistant 消息作为续写前缀
+        body = {
+            "model": model,
+            "messages": [{k: v for k, v in m.items() if k != "prefix"} for m in messages],
+            **args
+        }
+        if stream:
+            body["stream"] = True
+            body["stream_options"] = {"include_usage": True}
+        return headers, json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+    def complete(self, model, messages, args, timeout):
+        headers, body = self._request(model, messages, args, stream=False)
+        response = self.http.post(f"{self.base_url}/chat/completions", content=body, headers=headers, timeout=timeout)
+        if response.status_code >= 400:
+            raise BackendHTTPError(response.status_code, response.text, dict(response.headers))
+        return _wrap(response.json())
+
+    def stream(self, model, messages, args, timeout):
+        headers, body = self._request(model, messages, args, stream=True)
+        request = self.http.build_request("POST", f"{self.base_url}/chat/completions",
+                                          content=body, headers=headers, timeout=timeout)
+        response = self.http.send(request, stream=True)
+        if response.status_code >= 400:
+            text = response.read().decode("utf-8", "replace")
+            response.close()
+            raise BackendHTTPError(response.status_code, text, dict(response.headers))
+        return SSEStream(response)
+
+    def warm_up(self, timeout):
+        try:
+            self.http.head(self.base_url, timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+
+class SSEStream:
+    """OpenAI 兼容接口的流式响应，接口与 SDK 的 EventStream 一致"""
+
+    def __init__(self, response):
+        self.response = response
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.response.close()
+
+    def __iter__(self):
+        for line in self.response.iter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            yield _Payload(data=_wrap(json.loads(data)))
+
+
+class _Payload(dict):
+    """以属性方式访问的 JSON 对象，缺少的字段返回 None（与 SDK 模型的可选字段一致）"""
+
+    def __getattr__(self, name):
+        return self.get(name)
+
+
+def _wrap(value):
+    if isinstance(value, dict):
+        return _Payload((k, _wrap(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_wrap(v) for v in value]
+    return value
+
+
+def build_backends(endpoints: List[Dict], api_key: Optional[str], sdk_factory: Callable[[str, Optional[str]], object]):
+    """
+    根据配置中的 api.endpoints 创建后端列表
+
+    Args:
+        endpoints (list): 端点配置 {name, type, server_url/base_url, api_key, model}
+        api_key (str): 端点未配置 api_key 时使用的默认密钥（仅 mistral 类型）
+        sdk_factory (callable): 按 (api_key, server_url) 返回 SDK 客户端的函数
+
+    Returns:
+        list: 后端列表
+
+    Raises:
+        ValueError: 端点类型未知或缺少地址
+    """
+    backends = []
+    for index, endpoint in enumerate(endpoints):
+        kind = endpoint.get('type', 'mistral')
+        name = endpoint.get('name') or f"{kind}-{index}"
+        if kind == "mistral":
+            key = endpoint.get('api_key') or api_key
+            url = endpoint.get('server_url') or None
+            backends.append(MistralBackend(name, lambda key=key, url=url: sdk_factory(key, url), endpoint.get('model')))
+        elif kind == "openai":
+            base_url = endpoint.get('base_url') or endpoint.get('server_url')
+            if not base_url:
+                raise ValueError(f"端点 {name} 缺少 base_url")
+            backends.append(OpenAICompatibleBackend(name, base_url, endpoint.get('api_key'), endpoint.get('model')))
+        else:
+            raise ValueError(f"未知的端点类型: {kind}（可选: {', '.join(BACKEND_TYPES)}）")
+    return backends
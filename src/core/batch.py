@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+批量处理模块
+从 JSONL 文件读取请求（query，可选 mode、file、id），以有限的并发度交给各处理器处理，
+结果按输入顺序或完成顺序写为 JSONL（含每条的耗时、token 用量和错误）；
+输出文件中已有成功结果的记录在重新运行时跳过，中途崩溃后可以续跑
+"""
+
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, IO, List, Optional, Set
+
+DEFAULT_CONCURRENCY = 4
+ORDERS = ("input", "completion")
+
+
+def read_records(path: str) -> List[Dict]:
+    """
+    读取批量请求
+
+    Args:
+        path (str): JSONL 文件路径，每行一个 {"query": ..., "mode": ..., "file": ..., "id": ...}
+
+    Returns:
+        list: 按行号编号的记录 {"index", "query", ...}；无法解析的行带有 error，处理时直接写出错误
+    """
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            index = len(records)
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict) or not str(record.get("query", "")).strip():
+                    raise ValueError("记录缺少 query")
+            except ValueError as e:
+                record = {"error": f"无效的记录: {e}"}
+            record["index"] = index
+            records.append(record)
+    return records
+
+
+def load_completed(path: str, records: List[Dict]) -> Set[int]:
+    """
+    读取已有的输出，找出已经成功处理的记录
+
+    Args:
+        path (str): 输出文件路径
+        records (list): 批量请求
+
+    Returns:
+        set: 已有成功结果且 query 未变化的记录编号（崩溃时写了一半的行忽略）
+    """
+    queries = {record["index"]: record.get("query") for record in records}
+    completed = set()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                    index = result["index"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if result.get("error") is None and queries.get(index) == result.get("query"):
+                    completed.add(index)
+    except OSError:
+        pass
+    return completed
+
+
+class BatchRunner:
+    """以有限并发处理批量请求并写出结果"""
+
+    def __init__(self, worker_factory: Callable[[], Callable[[Dict], Dict]],
+                 concurrency: int = DEFAULT_CONCURRENCY, order: str = "input"):
+        """
+        初始化
+
+        Args:
+            worker_factory (callable): 为每个工作线程创建处理函数；处理函数接收一条记录，
+                返回 {"mode", "response", "usage", ...}，出错时抛出异常
+            concurrency (int): 同时处理的记录数
+            order (str): 结果的写出顺序，input 为输入顺序，completion 为完成顺序
+        """
+        if order not in ORDERS:
+            raise ValueError(f"未知的输出顺序: {order}（可选: {', '.join(ORDERS)}）")
+        self.worker_factory = worker_factory
+        self.concurrency = max(1, concurrency)
+        self.order = order
+        self._local = threading.local()
+
+    def run(self, records: List[Dict], output: IO[str], skip: Optional[Set[int]] = None) -> Dict:
+        """
+        处理批量请求
+
+        Args:
+            records (list): read_records 返回的记录
+            output: 结果的写出目标（每条结果写完即 flush）
+            skip (set): 跳过的记录编号（已有成功结果）
+
+        Returns:
+            dict: 汇总 {total, skipped, succeeded, failed, seconds}
+        """
+        skip = skip or set()
+        pending = [record for record in records if record["index"] not in skip]
+        summary = {"total": len(records), "skipped": len(records) - len(pending), "succeeded": 0, "failed": 0}
+        start = time.perf_counter()
+
+        # 输入顺序：先完成的结果暂存，等到前面的记录都写出后再写
+        waiting: Dict[int, Dict] = {}
+        order = iter([record["index"] for record in pending])
+        next_index = next(order, None)
+
+        def write(result):
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            summary["failed" if result.get("error") is not None else "succeeded"] += 1
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self._process, record) for record in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                if self.order == "completion":
+                    write(result)
+                    continue
+                waiting[result["index"]] = result
+                while next_index in waiting:
+                    write(waiting.pop(next_index))
+                    next_index = next(order, None)
+
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+
+    def _process(self, record: Dict) -> Dict:
+        """处理一条记录，错误记录在结果中而不是向上抛出"""
+        result = {"index": record["index"]}
+        for key in ("id", "query", "mode", "file"):
+            if record.get(key) is not None:
+                result[key] = record[key]
+        if record.get("error"):
+            return {**result, "response": None, "error": record["error"], "latency": 0.0, "usage": None}
+
+        start = time.perf_counter()
+        try:
+            worker = getattr(self._local, "worker", None)
+            if worker is None:
+                worker = self._local.worker = self.worker_factory()
+            outcome = worker(record)
+            error = None
+        except Exception as e:
+            outcome = {}
+            error = f"{type(e).__name__}: {e}"
+        result.update({"response": None, "usage": None, **outcome})
+        result["error"] = error
+        result["latency"] = round(time.perf_counter() - start, 3)
+        return result
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+相似命令缓存模块
+记录以往的命令生成请求及其结果，新请求与某条记录足够相似时直接复用结果。
+
+相似度基于字符级 n-gram shingle（中文无需分词）的 Jaccard 系数，用 MinHash 签名估计，
+LSH 分桶后只对候选记录计算精确值；索引保存在 SQLite 中，查询不需要把整个索引读入内存。
+每个桶只取最新的 BUCKET_CANDIDATES 条记录作为候选，大量近似重复的记录落入同一个桶时查询耗时也不会增长。
+数字和时长（7天、3小时）、英文单词（文件类型、命令名等）、常见操作意图以及比较、时间方向、否定和对象词
+（大于/小于、以前/最近、不/没有、文件/目录等）必须完全一致才会复用，避免“查找 py 文件”和“删除 py 文件”、
+“大于 100MB”和“小于 100MB”这类字面相近但含义相反的请求互相命中。
+记录和查找时还可以指定作用范围（如输出模式和工作目录），只复用作用范围相同的记录。
+"""
+
+import os
+import re
+import time
+import struct
+import sqlite3
+import hashlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_THRESHOLD = 0.75
+DEFAULT_MAX_ENTRIES = 50000
+
+# MinHash 参数：NUM_PERM 个哈希函数分成 BANDS 组，每组 ROWS 个；
+# Jaccard 为 0.75 的两条请求至少落入同一个桶的概率约为 1 - (1 - 0.75^2)^32 ≈ 100%
+NUM_PERM = 64
+ROWS = 2
+BANDS = NUM_PERM // ROWS
+# 每个桶最多取的候选数（最新的记录优先），以及计算精确相似度的候选数
+BUCKET_CANDIDATES = 8
+MAX_CANDIDATES = 16
+
+# 特征（签名和桶键）的计算方法变化时递增，打开旧版本的数据库时清空其中的记录
+FEATURE_VERSION = 3
+
+# 每个 shingle 用一次 SHAKE-128 生成 NUM_PERM 个 32 位哈希值，代替逐个计算 NUM_PERM 个哈希函数
+_SIGNATURE = struct.Struct(f"<{NUM_PERM}I")
+_MASK = (1 << 64) - 1
+_MIX = 0x9E3779B97F4A7C15
+
+# 同义词归一化：不同说法映射到同一个标记，标记同时参与精确匹配
+ALIASES = {
+    "查找": "find", "找出": "find", "搜索": "find", "寻找": "find", "列出": "list",
+    "删除": "delete", "删掉": "delete", "移除": "delete", "rm": "delete",
+    "移动": "move", "mv": "move", "复制": "copy", "拷贝": "copy", "cp": "copy",
+    "压缩": "compress", "打包": "compress", "解压": "extract",
+    "重命名": "rename", "统计": "count", "计算": "count",
+    "修改": "modified", "改过": "modified", "更改": "modified", "改动": "modified", "变动": "modified",
+    "杀掉": "kill", "终止": "kill", "结束进程": "kill",
+    "下载": "download", "安装": "install", "替换": "replace",
+    "python": "py", "javascript": "js", "typescript": "ts", "markdown": "md",
+    "yaml": "yml", "jpeg": "jpg", "shell": "sh",
+}
+# 限定词：比较、时间方向、否定和操作对象，归一化为英文标记后参与精确匹配（按顺序替换，长的说法在前）
+QUALIFIERS = [
+    ("gte", r"不小于|不少于|不低于|至少"),
+    ("lte", r"不大于|不超过|不多于|不高于|至多|最多"),
+    ("gt", r"大于|超过|多于|高于|以上"),
+    ("lt", r"小于|少于|低于|不到|不足|以下"),
+    ("before", r"以前|之前|(?<=[天周月年时钟])前"),
+    ("after", r"以后|之后|(?<=[天周月年时钟])后"),
+    ("recent", r"最近|近|以内|之内|(?<=[天周月年时钟])内"),
+    ("not", r"没有|除了|排除|除外|不|没|未|非"),
+    ("hidden", r"隐藏"),
+    ("dir", r"目录|文件夹"),
+    ("file", r"文件"),
+]
+# 时长单位归一化为英文标记（7天 -> 7d），与数字一起参与精确匹配
+DURATION_UNITS = {"分钟": "min", "小时": "h", "个小时": "h", "天": "d", "周": "w", "星期": "w", "个星期": "w",
+                  "个月": "mo", "年": "y"}
+_UNITS = "|".join(sorted(DURATION_UNITS, key=len, reverse=True))
+_DURATION_PATTERN = re.compile(rf"(\d+)\s*({_UNITS})")
+# 时间窗口的不同说法（“7天内”“过去7天”）统一为“最近7天”，语序不同的同义请求得到相同的单元序列
+_WINDOW_PATTERN = re.compile(rf"(?:过去|最近|近)\s*(\d+)\s*({_UNITS})(?:以内|之内|内)?|(\d+)\s*({_UNITS})(?:以内|之内|内)")
+# 不影响含义的助词，不参与相似度计算
+PARTICLES = {"的", "了", "过", "着"}
+_QUALIFIER_PATTERNS = [(re.compile(pattern), f" {token} ") for token, pattern in QUALIFIERS]
+# 英文别名只匹配完整单词（rm 不能匹配 format 中的 rm）
+_ALIAS_PATTERN = re.compile("|".join(
+    rf"(?<![a-z0-9_]){re.escape(alias)}(?![a-z0-9_])" if alias.isascii() else re.escape(alias)
+    for alias in sorted(ALIASES, key=len, reverse=True)
+))
+_UNIT_PATTERN = re.compile(r"[a-z0-9_.\-]+|[^\sa-z0-9_.\-]")
+_PUNCTUATION = set("，。？！、；：,.?!;:'\"`（）()[]【】「」")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将请求切分为基本单元：英文单词和数字整体作为一个单元，其余字符各自作为一个单元
+
+    Args:
+        text (str): 请求文本
+
+    Returns:
+        list: 单元列表（已归一化时间窗口、时长和同义词，去掉标点和助词）
+    """
+    text = _WINDOW_PATTERN.sub(lambda m: f"最近{m.group(1) or m.group(3)}{m.group(2) or m.group(4)}", text.lower())
+    for pattern, token in _QUALIFIER_PATTERNS:
+        text = pattern.sub(token, text)
+    text = _DURATION_PATTERN.sub(lambda m: f" {m.group(1)}{DURATION_UNITS[m.group(2)]} ", text)
+    text = _ALIAS_PATTERN.sub(lambda m: f" {ALIASES[m.group(0)]} ", text)
+    return [unit for unit in _UNIT_PATTERN.findall(text) if unit not in _PUNCTUATION and unit not in PARTICLES]
+
+
+def shingles(units: List[str]) -> frozenset:
+    """
+    生成 shingle 集合：单个单元和相邻两个单元
+
+    Args:
+        units (list): tokenize 的结果
+
+    Returns:
+        frozenset: shingle 集合
+    """
+    return frozenset(units) | frozenset(a + "\x1f" + b for a, b in zip(units, units[1:]))
+
+
+def guard_key(units: List[str]) -> str:
+    """
+    计算必须完全一致的部分：数字、英文单词、归一化后的操作意图和限定词
+
+    Args:
+        units (list): tokenize 的结果
+
+    Returns:
+        str: 排序后拼接的关键单元
+    """
+    return " ".join(sorted({unit for unit in units if unit.isascii()}))
+
+
+def minhash(items: frozenset) -> List[int]:
+    """
+    计算 MinHash 签名
+
+    Args:
+        items (frozenset): shingle 集合
+
+    Returns:
+        list: NUM_PERM 个最小哈希值
+    """
+    rows = [_SIGNATURE.unpack(hashlib.shake_128(item.encode("utf-8")).digest(_SIGNATURE.size)) for item in items]
+    return list(map(min, zip(*rows))) if rows else [0] * NUM_PERM
+
+
+def band_keys(guard: str, signature: List[int]) -> List[int]:
+    """
+    计算 LSH 桶键（桶键包含 guard，关键单元不同的请求不会成为候选）
+
+    Args:
+        guard (str): guard_key 的结果
+        signature (list): MinHash 签名
+
+    Returns:
+        list: BANDS 个 63 位整数桶键
+    """
+    # 每个桶的两个 32 位签名值拼成 64 位，与 guard 派生的各桶种子异或后乘奇数常数：
+    # 同一 guard 和桶内不同的签名值不会得到相同的桶键
+    seeds = struct.unpack(f"<{BANDS}Q", hashlib.shake_128(guard.encode("utf-8")).digest(8 * BANDS))
+    return [
+        ((((signature[band * ROWS] << 32) | signature[band * ROWS + 1]) ^ seeds[band]) * _MIX & _MASK) >> 1
+        for band in range(BANDS)
+    ]
+
+
+@lru_cache(maxsize=256)
+def features(query: str, scope: str = "") -> Tuple[frozenset, Tuple[int, ...]]:
+    """
+    计算请求的 shingle 集合和 LSH 桶键（结果缓存：同一请求先查找、未命中后再记录时只计算一次）
+
+    Args:
+        query (str): 请求文本
+        scope (str): 作用范围，与 guard 一起决定桶键
+
+    Returns:
+        tuple: (shingle 集合, 桶键)
+    """
+    units = tokenize(query)
+    items = shingles(units)
+    return items, tuple(band_keys(f"{guard_key(units)}\x1f{scope}", minhash(items)))
+
+
+# 每个桶按 (key, entry_id) 索引只取最新的 BUCKET_CANDIDATES 条记录，再按命中的桶数选出候选
+_LOOKUP_SQL = f"""
+    SELECT e.query, e.command, e.shingles FROM entries e JOIN (
+        SELECT entry_id, COUNT(*) AS hits FROM ({" UNION ALL ".join(
+            f"SELECT * FROM (SELECT entry_id FROM bands WHERE key = ? ORDER BY entry_id DESC "
+            f"LIMIT {BUCKET_CANDIDATES})" for _ in range(BANDS))})
+        GROUP BY entry_id ORDER BY hits DESC, entry_id DESC LIMIT {MAX_CANDIDATES}
+    ) c ON e.id = c.entry_id
+"""
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    """计算两个集合的 Jaccard 系数"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class CommandCache:
+    """命令生成请求的相似度缓存"""
+
+    def __init__(self, path: str, threshold: float = DEFAULT_THRESHOLD, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        初始化相似命令缓存
+
+        Args:
+            path (str): SQLite 数据库路径
+            threshold (float): 复用结果所需的最小相似度 (0.0 - 1.0)
+            max_entries (int): 最多保留的记录数，超出时删除最早的记录
+        """
+        self.path = os.path.expanduser(path)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._conn = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional["CommandCache"]:
+        """
+        根据配置中的 cache 部分创建相似命令缓存
+
+        Args:
+            config (dict): cache 配置
+
+        Returns:
+            CommandCache: 缓存实例，未启用时返回 None
+        """
+        config = config or {}
+        similar = config.get('similar_commands') or {}
+        # 复用的命令可能与请求的含义有细微差别，需要显式开启
+        if not config.get('enabled', False) or not similar.get('enabled', False):
+            return None
+        directory = config.get('directory') or "~/.ai_terminal/cache"
+        return cls(
+            os.path.join(directory, "commands.db"),
+            threshold=float(similar.get('threshold', DEFAULT_THRESHOLD)),
+            max_entries=int(similar.get('max_entries', DEFAULT_MAX_ENTRIES))
+        )
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """数据库连接，首次使用时打开并建表"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    id INTEGER PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    command TEXT NOT NULL,
+                    shingles TEXT NOT NULL,
+                    created REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS bands (
+                    key INTEGER NOT NULL,
+                    entry_id INTEGER NOT NULL
+                );
+                DROP INDEX IF EXISTS bands_key;
+                CREATE INDEX IF NOT EXISTS bands_key_entry ON bands (key, entry_id);
+                CREATE INDEX IF NOT EXISTS bands_entry ON bands (entry_id);
+            """)
+            if conn.execute("PRAGMA user_version").fetchone()[0] != FEATURE_VERSION:
+                # 旧版本的桶键与当前的特征计算方法不一致，缓存的记录无法再被查到
+                with conn:
+                    conn.execute("DELETE FROM bands")
+                    conn.execute("DELETE FROM entries")
+                    conn.execute(f"PRAGMA user_version = {FEATURE_VERSION}")
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, query: str, scope: str = "") -> Optional[Dict]:
+        """
+        查找与请求足够相似的记录
+
+        Args:
+            query (str): 命令生成请求
+            scope (str): 作用范围，只查找以相同作用范围记录的结果
+
+        Returns:
+            dict: 最相似的记录（query、command、similarity），没有达到阈值的记录时返回 None
+        """
+        items, keys = features(query, scope)
+        try:
+            rows = self.conn.execute(_LOOKUP_SQL, keys).fetchall()
+        except sqlite3.Error:
+            return None
+
+        best = None
+        for cached_query, command, cached_shingles in rows:
+            similarity = jaccard(items, frozenset(cached_shingles.split("\x1e")))
+            if similarity >= self.threshold and (best is None or similarity > best["similarity"]):
+                best = {"query": cached_query, "command": command, "similarity": similarity}
+        return best
+
+    def add(self, query: str, command: str, scope: str = ""):
+        """
+        记录一次命令生成的请求和结果
+
+        Args:
+            query (str): 命令生成请求
+            command (str): 生成的结果
+            scope (str): 作用范围
+        """
+        items, keys = features(query, scope)
+        try:
+            with self.conn:
+                cursor = self.conn.execute(
+                    "INSERT INTO entries (query, command, shingles, created) VALUES (?, ?, ?, ?)",
+                    (query, command, "\x1e".join(sorted(items)), time.time())
+                )
+                self.conn.executemany(
+                    "INSERT INTO bands (key, entry_id) VALUES (?, ?)",
+                    [(key, cursor.lastrowid) for key in keys]
+                )
+                self._trim()
+        except sqlite3.Error:
+            pass
+
+    def _trim(self):
+        """记录数超过上限时删除最早的记录（记录 id 递增，保留最新的 max_entries 个 id）"""
+        cutoff = self.conn.execute("SELECT MAX(id) FROM entries").fetchone()[0] - self.max_entries
+        if cutoff > 0:
+            self.conn.execute("DELETE FROM bands WHERE entry_id <= ?", (cutoff,))
+            self.conn.execute("DELETE FROM entries WHERE id <= ?", (cutoff,))
+
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
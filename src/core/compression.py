@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+请求体压缩模块
+文档模式的请求体可能有数 MB，超过阈值时以 gzip（或 deflate）压缩后发送；
+端点不接受压缩（415，或 400/422 且不压缩重发后成功）时记住该端点并改为不压缩发送，
+按服务端在 Accept-Encoding 中声明的编码协商
+"""
+
+import os
+import gzip
+import json
+import time
+import zlib
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+COMPRESSION_STATS_FILE = "~/.ai_terminal/compression_stats.json"
+
+# 按优先顺序排列的可用编码
+SUPPORTED_ENCODINGS = ("gzip", "deflate")
+IDENTITY = "identity"
+DEFAULT_THRESHOLD_KB = 64
+DEFAULT_LEVEL = 6
+# 服务端明确拒绝编码的状态码；以及可能由无法解析压缩请求体导致、需要不压缩重发确认的状态码
+UNSUPPORTED_STATUS = 415
+AMBIGUOUS_STATUSES = (400, 422)
+
+
+class RequestCompressor:
+    """决定请求体是否压缩、使用哪种编码，并统计发送的字节数和耗时"""
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD_KB * 1024, level: int = DEFAULT_LEVEL,
+                 encodings: Optional[List[str]] = None, path: str = COMPRESSION_STATS_FILE):
+        """
+        初始化
+
+        Args:
+            threshold (int): 请求体达到该字节数才压缩
+            level (int): 压缩级别 (1 - 9)
+            encodings (list): 按优先顺序尝试的编码
+            path (str): 统计文件路径（同时记录各端点协商出的编码）
+        """
+        self.threshold = threshold
+        self.level = level
+        self.encodings = [e for e in (encodings or SUPPORTED_ENCODINGS) if e in SUPPORTED_ENCODINGS]
+        self.path = os.path.expanduser(path)
+        self._stats: Optional[Dict] = None
+        self._lock = threading.Lock()
+        # 最近一次达到阈值的请求 {raw_bytes, sent_bytes, encoding, compress_seconds, request_seconds}
+        self.last_stats: Optional[Dict] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional["RequestCompressor"]:
+        """
+        根据配置中的 advanced 部分创建
+
+        Args:
+            config (dict): advanced 配置
+
+        Returns:
+            RequestCompressor: 未启用 compress_requests 时返回 None
+        """
+        config = config or {}
+        if not config.get('compress_requests', True):
+            return None
+        return cls(
+            threshold=int(float(config.get('compress_threshold_kb', DEFAULT_THRESHOLD_KB)) * 1024),
+            level=int(config.get('compress_level', DEFAULT_LEVEL))
+        )
+
+    @property
+    def stats(self) -> Dict:
+        """各端点的编码和按编码汇总的请求数、字节数、耗时，首次访问时从磁盘读取"""
+        if self._stats is None:
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                if not isinstance(data, dict):
+                    raise ValueError("invalid stats")
+                self._stats = data
+            except (OSError, ValueError):
+                self._stats = {}
+            self._stats.setdefault("hosts", {})
+            self._stats.setdefault("totals", {})
+        return self._stats
+
+    @staticmethod
+    def host(url) -> str:
+        """端点标识：scheme://host:port"""
+        parts = urlsplit(str(url))
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def encoding_for(self, url, size: int) -> str:
+        """
+        选择请求体的编码
+
+        Args:
+            url: 请求地址
+            size (int): 请求体字节数
+
+        Returns:
+            str: 编码，不压缩时为 identity
+        """
+        if size < self.threshold or not self.encodings:
+            return IDENTITY
+        return self.stats["hosts"].get(self.host(url), self.encodings[0])
+
+    def negotiate(self, url, rejected: str, accepted: Optional[str] = None) -> str:
+        """
+        端点拒绝某种编码后选择下一种并记住
+
+        Args:
+            url: 请求地址
+            rejected (str): 被拒绝的编码
+            accepted (str): 响应中的 Accept-Encoding 头
+
+        Returns:
+            str: 之后对该端点使用的编码，没有可用编码时为 identity
+        """
+        offered = [e.split(";")[0].strip().lower() for e in (accepted or "").split(",") if e.strip()]
+        candidates = [e for e in self.encodings if e != rejected and e in offered]
+        encoding = candidates[0] if candidates else IDENTITY
+        self.remember(url, encoding)
+        return encoding
+
+    def remember(self, url, encoding: str):
+        """记住端点使用的编码并写回磁盘"""
+        with self._lock:
+            self.stats["hosts"][self.host(url)] = encoding
+            self._save()
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        """按编码压缩请求体"""
+        if encoding == "gzip":
+            return gzip.compress(data, compresslevel=self.level)
+        if encoding == "deflate":
+            return zlib.compress(data, self.level)
+        return data
+
+    def record(self, raw_bytes: int, sent_bytes: int, encoding: str, compress_seconds: float,
+               request_seconds: float):
+        """
+        记录一次达到阈值的请求并写回磁盘
+
+        Args:
+            raw_bytes (int): 原始请求体字节数
+            sent_bytes (int): 实际发送的字节数（包括协商失败后重发的部分）
+            encoding (str): 最终使用的编码
+            compress_seconds (float): 压缩耗时（秒）
+            request_seconds (float): 发送请求到收到响应头的耗时（秒）
+        """
+        self.last_stats = {
+            "raw_bytes": raw_bytes,
+            "sent_bytes": sent_bytes,
+            "encoding": encoding,
+            "compress_seconds": compress_seconds,
+            "request_seconds": request_seconds
+        }
+        with self._lock:
+            totals = self.stats["totals"].setdefault(
+                encoding, {"requests": 0, "raw_bytes": 0, "sent_bytes": 0, "compress_seconds": 0.0, "request_seconds": 0.0}
+            )
+            totals["requests"] += 1
+            totals["raw_bytes"] += raw_bytes
+            totals["sent_bytes"] += sent_bytes
+            totals["compress_seconds"] += compress_seconds
+            totals["request_seconds"] += request_seconds
+            self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.stats, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+def compressing_client(compressor: RequestCompressor, **kwargs):
+    """
+    创建压缩 POST 请求体的 httpx.Client
+
+    客户端按 httpx 的默认方式创建（环境变量中的代理、NO_PROXY 和证书设置照常生效），再把其中的
+    默认传输和按代理挂载的传输分别包装为 CompressingTransport：直接传入 transport 时 httpx 不再读取环境变量中的代理
+
+    Args:
+        compressor (RequestCompressor): 压缩策略
+        **kwargs: 传给 httpx.Client 的参数
+
+    Returns:
+        httpx.Client: HTTP 客户端
+    """
+    import httpx
+    client = httpx.Client(**kwargs)
+    client._transport = CompressingTransport(compressor, client._transport)
+    client._mounts = {
+        pattern: None if transport is None else CompressingTransport(compressor, transport)
+        for pattern, transport in client._mounts.items()
+    }
+    return client
+
+
+class CompressingTransport:
+    """httpx 传输层：按 RequestCompressor 压缩 POST 请求体，其余请求原样交给底层传输"""
+
+    def __init__(self, compressor: RequestCompressor, transport=None):
+        """
+        初始化
+
+        Args:
+            compressor (RequestCompressor): 压缩策略
+            transport: 底层 httpx 传输，默认为 httpx.HTTPTransport
+        """
+        if transport is None:
+            import httpx
+            transport = httpx.HTTPTransport()
+        self.compressor = compressor
+        self.transport = transport
+
+    def __enter__(self):
+        self.transport.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.transport.__exit__(*exc)
+
+    def close(self):
+        self.transport.close()
+
+    def handle_request(self, request):
+        if request.method != "POST" or "content-encoding" in request.headers:
+            return self.transport.handle_request(request)
+        body = request.read()
+        if len(body) < self.compressor.threshold:
+            return self.transport.handle_request(request)
+        encoding = self.compressor.encoding_for(request.url, len(body))
+
+        start = time.perf_counter()
+        data = self.compressor.compress(body, encoding)
+        compress_seconds = time.perf_counter() - start
+        sent_bytes = len(data)
+        start = time.perf_counter()
+        response = self.transport.handle_request(self._encoded(request, data, encoding))
+
+        if encoding != IDENTITY and response.status_code in (UNSUPPORTED_STATUS,) + AMBIGUOUS_STATUSES:
+            accepted = response.headers.get("accept-encoding")
+            response.close()
+            if response.status_code == UNSUPPORTED_STATUS:
+                fallback = self.compressor.negotiate(request.url, encoding, accepted)
+            else:
+                # 不确定是否由压缩引起：不压缩重发，成功后才记住该端点不接受压缩
+                fallback = IDENTITY
+            data = self.compressor.compress(body, fallback)
+            sent_bytes += len(data)
+            response = self.transport.handle_request(self._encoded(request, data, fallback))
+            if fallback == IDENTITY and response.status_code < 400:
+                self.compressor.remember(request.url, IDENTITY)
+            encoding = fallback
+
+        self.compressor.record(len(body), sent_bytes, encoding, compress_seconds, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def _encoded(request, data, encoding):
+        import httpx
+        headers = request.headers.copy()
+        headers["Content-Length"] = str(len(data))
+        if encoding != IDENTITY:
+            headers["Content-Encoding"] = encoding
+        return httpx.Request(request.method, request.url, headers=headers, content=data,
+                             extensions=request.extensions)
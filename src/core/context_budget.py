@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+上下文预算模块
+按模式为每次请求设定 token 预算，在系统提示、新输入、最近几轮和更早的对话之间分配，
+超出预算的历史按固定顺序截断或丢弃；token 数由本地估算器计算，并根据 API 返回的 usage 自动校准
+
+预算只限制历史的增长，新输入（如要分析的文档）总是完整发送。
+分配顺序（确定性）：
+1. 系统提示：完整保留，先从总预算中扣除
+2. 新输入：完整保留；历史可用剩余的预算，新输入很长时历史仍保留 recent + older 份额
+   （历史实际需要的更少时按实际）
+3. 最近 recent_turns 轮：从新到旧逐轮加入；放不下的一轮先截断回复，仍放不下则连同更早的对话全部丢弃
+4. 更早的对话：从新到旧逐轮加入，每轮先截断到 older_turn_tokens；放不下时丢弃该轮及更早的对话
+"""
+
+import os
+import re
+import json
+from typing import Dict, List, Optional
+
+CALIBRATION_FILE = "~/.ai_terminal/token_calibration.json"
+
+# 每条消息的固定开销（角色标记等）
+MESSAGE_OVERHEAD = 4
+# 中日韩字符和其他字符的初始估算权重（token/字符），实际比例由校准系数修正
+CJK_WEIGHT = 1.0
+OTHER_WEIGHT = 0.3
+# 校准：新观测值的权重，以及单次观测比例的合理范围
+CALIBRATION_ALPHA = 0.2
+CALIBRATION_RANGE = (0.25, 4.0)
+
+TRUNCATION_MARK = "\n…（内容过长，已截断）…\n"
+
+DEFAULT_BUDGETS = {
+    "conversation": {"total": 4000, "recent_turns": 2, "recent": 0.35, "older": 0.15, "older_turn_tokens": 150},
+    "command": {"total": 2500, "recent_turns": 2, "recent": 0.3, "older": 0.1, "older_turn_tokens": 100},
+    "document": {"total": 12000, "recent_turns": 1, "recent": 0.15, "older": 0.05, "older_turn_tokens": 100},
+}
+
+_CJK = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+
+class TokenEstimator:
+    """本地 token 估算器：按字符类别加权计数，再乘以按模型校准的系数"""
+
+    def __init__(self, path: str = CALIBRATION_FILE):
+        """
+        初始化估算器
+
+        Args:
+            path (str): 校准系数文件路径
+        """
+        self.path = os.path.expanduser(path)
+        self._scales: Optional[Dict[str, float]] = None
+
+    @property
+    def scales(self) -> Dict[str, float]:
+        """各模型的校准系数，首次访问时从磁盘读取"""
+        if self._scales is None:
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                self._scales = {k: float(v) for k, v in data.items()}
+            except (OSError, ValueError, TypeError, AttributeError):
+                self._scales = {}
+        return self._scales
+
+    @staticmethod
+    def raw_count(text: str) -> float:
+        """未校准的 token 估算值"""
+        cjk = len(_CJK.findall(text))
+        return cjk * CJK_WEIGHT + (len(text) - cjk) * OTHER_WEIGHT
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        """
+        估算文本的 token 数
+
+        Args:
+            text (str): 文本
+            model (str): 模型名称（决定使用的校准系数）
+
+        Returns:
+            int: 估算的 token 数
+        """
+        return int(self.raw_count(text) * self.scales.get(model, 1.0) + 0.5)
+
+    def count_messages(self, messages: List[Dict], model: Optional[str] = None) -> int:
+        """估算消息列表的 token 数（含每条消息的固定开销）"""
+        return sum(self.count(str(m.get("content", "")), model) + MESSAGE_OVERHEAD for m in messages)
+
+    def truncate(self, text: str, max_tokens: int, model: Optional[str] = None, keep_tail: bool = False) -> str:
+        """
+        将文本截断到不超过 max_tokens
+
+        Args:
+            text (str): 文本
+            max_tokens (int): token 上限
+            model (str): 模型名称
+            keep_tail (bool): 是否同时保留结尾（截断中间），否则只保留开头
+
+        Returns:
+            str: 截断后的文本（未超出时原样返回）
+        """
+        if self.count(text, model) <= max_tokens:
+            return text
+        scale = self.scales.get(model, 1.0)
+        limit = max(0.0, max_tokens / scale - self.raw_count(TRUNCATION_MARK))
+        if keep_tail:
+            head = self._prefix_within(text, limit / 2)
+            tail = self._prefix_within(text[::-1], limit / 2)[::-1]
+            return head + TRUNCATION_MARK + tail
+        return self._prefix_within(text, limit) + TRUNCATION_MARK
+
+    @staticmethod
+    def _prefix_within(text: str, limit: float) -> str:
+        total = 0.0
+        for index, char in enumerate(text):
+            total += CJK_WEIGHT if _CJK.match(char) else OTHER_WEIGHT
+            if total > limit:
+                return text[:index]
+        return text
+
+    def calibrate(self, model: str, estimated: int, actual: int):
+        """
+        根据 API 返回的实际 prompt_tokens 修正校准系数
+
+        Args:
+            model (str): 模型名称
+            estimated (int): 发送前估算的 token 数
+            actual (int): API 返回的 prompt_tokens
+        """
+        if not isinstance(estimated, int) or not isinstance(actual, int) or estimated <= 0 or actual <= 0:
+            return
+        current = self.scales.get(model, 1.0)
+        ratio = min(max(actual / estimated, CALIBRATION_RANGE[0]), CALIBRATION_RANGE[1])
+        updated = current * ((1 - CALIBRATION_ALPHA) + CALIBRATION_ALPHA * ratio)
+        self.scales[model] = updated
+        # 变化很小时不写盘
+        if abs(updated - current) / current < 0.01:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.scales, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+class ContextAssembler:
+    """按 token 预算组装请求的消息列表"""
+
+    def __init__(self, budgets: Optional[Dict[str, Dict]] = None, estimator: Optional[TokenEstimator] = None):
+        """
+        初始化组装器
+
+        Args:
+            budgets (dict): 各模式的预算，未指定的项使用 DEFAULT_BUDGETS
+            estimator (TokenEstimator): token 估算器
+        """
+        budgets = budgets or {}
+        self.budgets = {
+            mode: {**defaults, **(budgets.get(mode) or {})}
+            for mode, defaults in DEFAULT_BUDGETS.items()
+        }
+        self.estimator = estimator or TokenEstimator()
+        # 最近一次组装的统计：估算的 token 数、被截断和被丢弃的消息数
+        self.last_stats = {"tokens": 0, "truncated": 0, "dropped": 0}
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> "ContextAssembler":
+        """
+        根据配置中的 context_budget 部分创建组装器
+
+        Args:
+            config (dict): context_budget 配置，按模式覆盖 DEFAULT_BUDGETS
+
+        Returns:
+            ContextAssembler: 组装器
+        """
+        return cls(budgets=config or {})
+
+    def assemble(self, messages: List[Dict], mode: str = "conversation", model: Optional[str] = None) -> List[Dict]:
+        """
+        按预算裁剪消息列表
+
+        Args:
+            messages (list): 完整的消息列表：可选的系统提示、按时间排列的历史对话和最后的新输入
+            mode (str): 操作模式，决定使用的预算
+            model (str): 模型名称，决定估算时使用的校准系数
+
+        Returns:
+            list: 裁剪后的消息列表（新列表，原列表不变）
+        """
+        budget = self.budgets.get(mode, self.budgets["conversation"])
+        stats = {"tokens": 0, "truncated": 0, "dropped": 0}
+        count = lambda text: self.estimator.count(text, model) + MESSAGE_OVERHEAD
+
+        system = [messages[0]] if messages and messages[0].get("role") == "system" else []
+        body = messages[len(system):]
+        new_input = dict(body[-1]) if body else None
+        turns = self._split_turns(body[:-1])
+
+        # 1. 系统提示完整保留
+        available = budget["total"] - sum(count(m["content"]) for m in system)
+
+        # 2. 新输入完整保留；历史至少保留其份额
+        history_share = budget["recent"] + budget["older"]
+        history_need = sum(count(m["content"]) for turn in turns for m in turn)
+        history_reserved = min(history_need, int(max(available, 0) * history_share))
+        if new_input is not None:
+            available = max(available - count(str(new_input["content"])), history_reserved)
+
+        # 3. 最近几轮：更早的对话至多占用历史预算中 older 的比例
+        recent = turns[-budget["recent_turns"]:] if budget["recent_turns"] else []
+        older = turns[:len(turns) - len(recent)]
+        older_need = sum(
+            count(self.estimator.truncate(str(m["content"]), budget["older_turn_tokens"], model))
+            for turn in older for m in turn
+        )
+        older_reserved = min(older_need, int(max(available, 0) * budget["older"] / history_share)) if history_share else 0
+        recent_budget = max(available, 0) - older_reserved
+
+        kept_recent, dropped = self._fit_turns(recent, recent_budget, None, model, stats)
+        available -= sum(count(m["content"]) for turn in kept_recent for m in turn)
+        if dropped:
+            # 最近的对话放不下时，更早的对话全部丢弃
+            kept_older = []
+            stats["dropped"] += sum(len(turn) for turn in older)
+        else:
+            # 4. 更早的对话：逐轮截断到 older_turn_tokens
+            kept_older, _ = self._fit_turns(older, max(available, 0), budget["older_turn_tokens"], model, stats)
+
+        result = system + [m for turn in kept_older + kept_recent for m in turn]
+        if new_input is not None:
+            result.append(new_input)
+        stats["tokens"] = self.estimator.count_messages(result, model)
+        self.last_stats = stats
+        return result
+
+    @staticmethod
+    def _split_turns(history: List[Dict]) -> List[List[Dict]]:
+        """将历史消息按轮次分组：每轮以一条 user 消息开始"""
+        turns = []
+        for message in history:
+            if message.get("role") == "user" or not turns:
+                turns.append([message])
+            else:
+                turns[-1].append(message)
+        return turns
+
+    def _fit_turns(self, turns, budget, turn_cap, model, stats):
+        """
+        从新到旧逐轮加入对话，返回保留的轮次（按时间顺序）和是否有轮次被丢弃
+
+        turn_cap 不为 None 时，每条消息先截断到 turn_cap；放不下的一轮先尝试截断回复，
+        仍然放不下时丢弃该轮及更早的所有轮次。
+        """
+        count = lambda text: self.estimator.count(text, model) + MESSAGE_OVERHEAD
+        kept = []
+        for position in range(len(turns) - 1, -1, -1):
+            turn = [dict(m) for m in turns[position]]
+            if turn_cap is not None:
+                for message in turn:
+                    truncated = self.estimator.truncate(str(message["content"]), turn_cap, model)
+                    if truncated != message["content"]:
+                        message["content"] = truncated
+                        stats["truncated"] += 1
+
+            cost = sum(count(m["content"]) for m in turn)
+            if cost > budget and len(turn) > 1:
+                # 先截断回复（保留开头），用户消息保持完整
+                reply_budget = budget - sum(count(m["content"]) for m in turn[:-1]) - MESSAGE_OVERHEAD
+                if reply_budget > self.estimator.count(TRUNCATION_MARK, model):
+                    turn[-1]["content"] = self.estimator.truncate(str(turn[-1]["content"]), reply_budget, model)
+                    stats["truncated"] += 1
+                    cost = sum(count(m["content"]) for m in turn)
+
+            if cost > budget:
+                stats["dropped"] += sum(len(t) for t in turns[:position + 1])
+                return list(reversed(kept)), True
+            kept.append(turn)
+            budget -= cost
+        return list(reversed(kept)), False
@@ -2,6 +2,16 @@
 """
 上下文管理器模块
 负责管理和维护对话历史、用户环境信息、命令历史等上下文数据
+
+上下文保存为快照（context.json）加追加日志（context.journal）：每次调用只把新的一轮对话和
+变化的环境、命令、文档记录追加到日志，日志过长时再压缩进快照，加载和保存的开销不随历史增长；
+崩溃时写了一半的最后一条记录在加载时忽略，下次追加前截掉。
+多个进程只在追加和压缩时持有文件锁，读取不加锁：快照和日志都整体原子替换，先打开日志再读快照即可读到一致的状态。
+
+每轮对话记录所在的会话（AI_TERMINAL_SESSION 环境变量，默认为终端设备名，如 tmux 的各个窗格），
+terminal.history_scope 为 session 时只使用本会话的历史，为 global 时使用所有会话共享的历史。
+没有会话标识的对话（升级前记录的历史，或不在终端中运行时记录的）在每个会话中都可见。
+配置 terminal.context_backend 为 sqlite 时改用 SQLite 存储（见 src/core/context_store.py）
 """
 
 import os
@@ -10,17 +20,58 @@ from datetime import datetime
 from collections import Counter
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Windows 上不加锁
+    fcntl = None
+
+SNAPSHOT_FILE = "context.json"
+JOURNAL_FILE = "context.journal"
+HISTORY_DB = "history.db"
+LOCK_FILE = "context.lock"
+SNAPSHOT_FORMAT = 2
+# 日志超过该记录数或字节数时压缩进快照
+COMPACT_RECORDS = 256
+COMPACT_BYTES = 1024 * 1024
+BACKENDS = ("journal", "sqlite")
+HISTORY_SCOPES = ("session", "global")
+MAX_RECENT_COMMANDS = 20
+# 快照和日志中最多保留 max_history 乘以该数的对话（每个会话 max_history 轮）
+MAX_SESSIONS = 8
+
+
+def current_session():
+    """
+    获取当前终端会话的标识
+
+    Returns:
+        str: AI_TERMINAL_SESSION 环境变量，未设置时为标准输入/输出所在的终端设备；都没有时为 None
+    """
+    session = os.environ.get("AI_TERMINAL_SESSION")
+    if session:
+        return session
+    for fd in (0, 1, 2):
+        try:
+            return os.ttyname(fd)
+        except OSError:
+            continue
+    return None
+
 
 class ContextManager:
     """上下文管理器，负责维护和更新系统的上下文信息"""
 
-    def __init__(self, max_history=20):
+    def __init__(self, max_history=20, session=None, history_scope="session"):
         """
         初始化上下文管理器
 
         Args:
-            max_history (int): 保留的最大历史记录条数
+            max_history (int): 每个会话保留的最大历史记录条数
+            session (str): 当前会话标识，记录在每轮对话中
+            history_scope (str): session 只使用本会话的历史，global 使用所有会话的历史
         """
+        self.session = session
+        self.history_scope = history_scope
         self.conversation_history = []
         self.environment_state = {}
         self.current_directory = None
@@ -28,6 +79,12 @@ class ContextManager:
         self.document_context = {}
         self.max_history = max_history
 
+        # 尚未写入日志的变化；当前日志的标识（与快照中记录的一致时日志才有效）、记录数和加载时快照的状态
+        self._pending = []
+        self._journal_id = None
+        self._journal_records = 0
+        self._snapshot_stat = None
+
         # 创建上下文存储目录
         self.context_dir = Path(os.path.expanduser("~/.ai_terminal"))
         self.context_dir.mkdir(exist_ok=True)
@@ -35,6 +92,30 @@ class ContextManager:
         # 加载保存的上下文（如果存在）
         self._load_context_from_disk()
 
+    @classmethod
+    def from_config(cls, config):
+        """
+        根据配置中的 terminal 部分创建上下文管理器
+
+        Args:
+            config (dict): terminal 配置（max_history、context_backend、history_scope）
+
+        Returns:
+            ContextManager: context_backend 为 sqlite 时返回 SQLiteContextManager
+        """
+        config = config or {}
+        max_history = config.get('max_history', 20)
+        backend = config.get('context_backend', "journal")
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的上下文存储: {backend}（可选: {', '.join(BACKENDS)}）")
+        history_scope = config.get('history_scope', "session")
+        if history_scope not in HISTORY_SCOPES:
+            raise ValueError(f"未知的历史范围: {history_scope}（可选: {', '.join(HISTORY_SCOPES)}）")
+        if backend == "sqlite":
+            from src.core.context_store import SQLiteContextManager
+            cls = SQLiteContextManager
+        return cls(max_history=max_history, session=current_session(), history_scope=history_scope)
+
     def update_context(self, user_input, system_response=None, mode=None):
         """
         更新会话上下文
@@ -53,12 +134,10 @@ class ContextManager:
 
         if system_response:
             entry["system"] = system_response
+        if self.session:
+            entry["session"] = self.session
 
-        self.conversation_history.append(entry)
-
-        # 保持最近的 N 轮对话
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[-self.max_history:]
+        self._record({"op": "turn", "entry": entry})
 
     def update_environment(self, env_vars=None, cwd=None, command=None):
         """
@@ -69,22 +148,17 @@ class ContextManager:
             cwd (str): 当前工作目录
             command (str): 执行的命令
         """
-        if env_vars:
-            self.environment_state.update(env_vars)
-
-        if cwd:
-            self.current_directory = cwd
+        # 只记录有变化的部分
+        changed = {key: value for key, value in (env_vars or {}).items() if self.environment_state.get(key) != value}
+        if changed or (cwd and cwd != self.current_directory):
+            self._record({"op": "env", "set": changed, "cwd": cwd})
 
         if command:
-            self.recent_commands.append({
+            self._record({"op": "command", "entry": {
                 "command": command,
                 "timestamp": datetime.now().isoformat(),
                 "cwd": self.current_directory
-            })
-
-            # 保持最近的命令记录
-            if len(self.recent_commands) > 20:  # 保留20条命令记录
-                self.recent_commands = self.recent_commands[-20:]
+            }})
 
     def add_document_context(self, file_path, summary=None, analysis=None):
         """
@@ -95,11 +169,11 @@ class ContextManager:
             summary (str): 文件摘要
             analysis (str): 文件分析结果
         """
-        self.document_context[file_path] = {
+        self._record({"op": "document", "path": file_path, "entry": {
             "last_accessed": datetime.now().isoformat(),
             "summary": summary,
             "analysis": analysis
-        }
+        }})
 
     def build_context_for_mistral(self, mode="conversation"):
         """
@@ -114,6 +188,7 @@ class ContextManager:
         from src.utils.config_manager import MistralConfigManager
 
         context = {
+            "mode": mode,
             "system_prompt": MistralConfigManager.MODES[mode]["system_prompt"],
             "history": self._get_relevant_history(mode),
             "env_info": {
@@ -127,45 +202,247 @@ class ContextManager:
             # 对命令模式，增加最近使用的命令作为上下文
             context["command_patterns"] = self._extract_command_patterns()
 
-        elif mode == "document" and self.document_context:
+        elif mode == "document":
             # 对文档模式，增加最近访问的文档信息
-            context["recent_documents"] = self._get_recent_documents(3)
+            recent_documents = self._get_recent_documents(3)
+            if recent_documents:
+                context["recent_documents"] = recent_documents
 
         return context
 
-    def save_context_to_disk(self):
-        """将上下文保存到磁盘"""
-        context_file = self.context_dir / "context.json"
-
-        # 准备要保存的数据
-        data = {
-            "conversation_history": self.conversation_history,
-            "environment_state": self.environment_state,
-            "current_directory": self.current_directory,
-            "recent_commands": self.recent_commands,
-            "document_context": self.document_context
-        }
+    @staticmethod
+    def storage_signature():
+        """
+        获取上下文存储文件的签名，用于判断基于它生成的缓存是否过期
+
+        Returns:
+            tuple: 各存储文件（快照、日志、SQLite 数据库及其 WAL）的 (mtime_ns, size)，都不存在时为 None
+        """
+        signature = []
+        for name in (SNAPSHOT_FILE, JOURNAL_FILE, HISTORY_DB, f"{HISTORY_DB}-wal"):
+            try:
+                stat = os.stat(os.path.join(os.path.expanduser("~/.ai_terminal"), name))
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature) if any(signature) else None
 
-        # 保存到文件
-        with open(context_file, "w") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    def save_context_to_disk(self):
+        """将本次调用的变化追加到日志，日志过长时压缩进快照"""
+        if not self._pending and self._journal_id is not None:
+            return
+
+        with self._locked():
+            # 其他进程压缩过（快照或日志已更换）或还没有有效的日志时，与磁盘上的状态合并后重写快照
+            if (self._journal_id is None or self._stat(SNAPSHOT_FILE) != self._snapshot_stat
+                    or self._read_journal_id() != self._journal_id):
+                self._compact()
+            else:
+                journal_file = self.context_dir / JOURNAL_FILE
+                self._repair_journal(journal_file)
+                with open(journal_file, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in self._pending))
+                self._journal_records += len(self._pending)
+                self._pending = []
+                if self._journal_records >= COMPACT_RECORDS or journal_file.stat().st_size >= COMPACT_BYTES:
+                    self._compact()
+            self._pending = []
 
     def _load_context_from_disk(self):
-        """从磁盘加载上下文"""
-        context_file = self.context_dir / "context.json"
+        """从磁盘加载上下文：读取快照并重放日志"""
+        # 读取前记下快照的状态：读取期间被其他进程压缩时，保存时能发现并合并
+        snapshot_stat = self._stat(SNAPSHOT_FILE)
+        try:
+            state, self._journal_id, self._journal_records = self._read_disk_state()
+        except Exception as e:
+            print(f"加载上下文失败: {str(e)}")
+            return
+        self._snapshot_stat = snapshot_stat
+        self._assign(state)
+
+    def _read_disk_state(self):
+        """
+        读取快照并重放有效的日志
 
+        Returns:
+            tuple: (状态, 日志标识, 日志记录数)；快照中没有日志标识（旧格式或不存在）时标识为 None
+        """
+        state = {
+            "conversation_history": [],
+            "environment_state": {},
+            "current_directory": None,
+            "recent_commands": [],
+            "document_context": {}
+        }
+        # 先打开日志再读快照：压缩时先替换快照再替换日志，所以打开的日志要么属于读到的快照，
+        # 要么更旧（内容已在快照中，标识不符而被忽略），不加锁也不会读到不一致的状态
+        try:
+            journal = open(self.context_dir / JOURNAL_FILE, "r", encoding="utf-8")
+        except OSError:
+            journal = None
+        try:
+            return self._read_snapshot_and_journal(state, journal)
+        finally:
+            if journal is not None:
+                journal.close()
+
+    def _read_snapshot_and_journal(self, state, journal):
+        context_file = self.context_dir / SNAPSHOT_FILE
+        journal_id = None
         if context_file.exists():
-            try:
-                with open(context_file, "r") as f:
-                    data = json.load(f)
+            with open(context_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("快照格式无效")
+            for key in state:
+                if key in data:
+                    state[key] = data[key]
+            journal_id = data.get("journal")
+
+        records = 0
+        if journal_id is None or journal is None:
+            return state, None, 0
+        try:
+            with journal as f:
+                lines = iter(f)
+                header = self._parse_record(next(lines, ""))
+                # 日志属于更早的快照（压缩时在替换快照之后、替换日志之前崩溃），其内容已在快照中
+                if header is None or header.get("journal") != journal_id:
+                    return state, None, 0
+                for line in lines:
+                    record = self._parse_record(line)
+                    # 崩溃时写了一半的记录没有换行或无法解析，跳过
+                    if record is None:
+                        continue
+                    try:
+                        self._apply(state, record)
+                    except (KeyError, TypeError, AttributeError):
+                        continue
+                    records += 1
+        except OSError:
+            return state, None, 0
+        return state, journal_id, records
+
+    @staticmethod
+    def _parse_record(line):
+        if not line.endswith("\n"):
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) else None
+
+    def _record(self, record):
+        """应用一条变化，并记下待保存"""
+        self._apply(vars(self), record)
+        self._pending.append(record)
+
+    def _apply(self, state, record):
+        """把一条日志记录应用到状态（实例的 __dict__ 或读取中的状态）"""
+        op = record.get("op")
+        if op == "turn":
+            history = state["conversation_history"]
+            history.append(record["entry"])
+            # 每个会话保持最近的 N 轮对话，总数不超过 MAX_SESSIONS 个会话的量
+            session = record["entry"].get("session")
+            same_session = [i for i, entry in enumerate(history) if entry.get("session") == session]
+            if len(same_session) > self.max_history:
+                del history[same_session[0]]
+            if len(history) > self.max_history * MAX_SESSIONS:
+                del history[0]
+        elif op == "env":
+            state["environment_state"].update(record.get("set") or {})
+            if record.get("cwd"):
+                state["current_directory"] = record["cwd"]
+        elif op == "command":
+            state["recent_commands"].append(record["entry"])
+            # 保持最近的命令记录
+            if len(state["recent_commands"]) > MAX_RECENT_COMMANDS:
+                state["recent_commands"] = state["recent_commands"][-MAX_RECENT_COMMANDS:]
+        elif op == "document":
+            state["document_context"][record["path"]] = record["entry"]
+
+    def _assign(self, state):
+        self.conversation_history = state["conversation_history"]
+        self.environment_state = state["environment_state"]
+        self.current_directory = state["current_directory"]
+        self.recent_commands = state["recent_commands"]
+        self.document_context = state["document_context"]
+
+    def _compact(self):
+        """
+        把磁盘上的快照和日志（包括其他进程追加的记录）与本进程的变化合并，写成新快照并换上空日志
 
-                self.conversation_history = data.get("conversation_history", [])
-                self.environment_state = data.get("environment_state", {})
-                self.current_directory = data.get("current_directory")
-                self.recent_commands = data.get("recent_commands", [])
-                self.document_context = data.get("document_context", {})
-            except Exception as e:
-                print(f"加载上下文失败: {str(e)}")
+        先替换快照再替换日志：两者之间崩溃时旧日志的标识与新快照不符，加载时被忽略，不会重复重放
+        """
+        try:
+            state, _, _ = self._read_disk_state()
+        except (OSError, ValueError):
+            state = None
+        if state is None:
+            state = {
+                "conversation_history": self.conversation_history,
+                "environment_state": self.environment_state,
+                "current_directory": self.current_directory,
+                "recent_commands": self.recent_commands,
+                "document_context": self.document_context
+            }
+        else:
+            for record in self._pending:
+                self._apply(state, record)
+
+        journal_id = os.urandom(8).hex()
+        self._replace(SNAPSHOT_FILE, json.dumps({"format": SNAPSHOT_FORMAT, "journal": journal_id, **state},
+                                               ensure_ascii=False))
+        self._replace(JOURNAL_FILE, json.dumps({"journal": journal_id}) + "\n")
+        self._assign(state)
+        self._journal_id = journal_id
+        self._journal_records = 0
+        self._snapshot_stat = self._stat(SNAPSHOT_FILE)
+
+    def _replace(self, name, text):
+        tmp_path = self.context_dir / f"{name}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, self.context_dir / name)
+
+    @staticmethod
+    def _repair_journal(journal_file):
+        """截掉崩溃时写了一半的最后一条记录，使新记录从新的一行开始"""
+        with open(journal_file, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(position - 4096, 0)
+                f.seek(start)
+                block = f.read(position - start)
+                if position == end and block.endswith(b"\n"):
+                    return
+                newline = block.rfind(b"\n")
+                if newline >= 0:
+                    f.truncate(start + newline + 1)
+                    return
+                position = start
+            f.truncate(0)
+
+    def _read_journal_id(self):
+        try:
+            with open(self.context_dir / JOURNAL_FILE, "r", encoding="utf-8") as f:
+                header = self._parse_record(f.readline())
+        except OSError:
+            return None
+        return header.get("journal") if header else None
+
+    def _stat(self, name):
+        try:
+            stat = os.stat(self.context_dir / name)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _locked(self):
+        return _JournalLock(self.context_dir / LOCK_FILE)
 
     def _get_relevant_history(self, current_mode, max_entries=10):
         """
@@ -178,16 +455,17 @@ class ContextManager:
         Returns:
             list: 相关历史记录
         """
+        history = self._history_view()
         # 提取所有历史记录中与当前模式匹配的条目
         relevant = [
-            entry for entry in self.conversation_history
+            entry for entry in history
             if entry.get("mode") == current_mode
         ]
 
         # 如果相关历史太少，也包含一些通用对话
         if len(relevant) < max_entries // 2:
             general = [
-                entry for entry in self.conversation_history
+                entry for entry in history
                 if entry.get("mode") != current_mode
             ]
             # 合并并保持时间顺序
@@ -200,6 +478,12 @@ class ContextManager:
         # 返回最近的相关历史
         return relevant[-max_entries:]
 
+    def _history_view(self):
+        """按 history_scope 可见的对话：本会话的和没有会话标识的，或所有会话的"""
+        if self.history_scope == "global":
+            return self.conversation_history
+        return [entry for entry in self.conversation_history if entry.get("session") in (None, self.session)]
+
     def _extract_command_patterns(self):
         """
         分析用户命令模式和偏好
@@ -277,3 +561,25 @@ class ContextManager:
         )
 
         return dict(recent[:count])
+
+
+class _JournalLock:
+    """追加日志和压缩时持有的跨进程文件锁"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            try:
+                self._file = open(self.path, "a")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except OSError:
+                self._file = None
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
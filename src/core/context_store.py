@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+SQLite 上下文存储模块
+对话、命令和文档记录保存在 ~/.ai_terminal/history.db（WAL 模式：读取不被写入阻塞，
+多个进程的写入按事务串行）；相关历史通过 (mode, timestamp) 和 (cwd, timestamp) 索引只读取需要的行，
+不再每次加载并在内存中过滤全部历史。首次打开时从 context.json（及其日志）一次性迁移。
+history_scope 为 session 时查询按 (session, mode, timestamp) 索引只取本会话和没有会话标识的对话
+"""
+
+import sqlite3
+import threading
+
+from src.core.context_manager import ContextManager, HISTORY_DB, MAX_RECENT_COMMANDS
+
+SCHEMA_VERSION = 2
+# 等待其他进程的写事务的最长时间（秒）
+BUSY_TIMEOUT = 5.0
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS turns (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        cwd TEXT,
+        user TEXT NOT NULL,
+        system TEXT,
+        session TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS turns_mode_time ON turns (mode, timestamp)",
+    "CREATE INDEX IF NOT EXISTS turns_cwd_time ON turns (cwd, timestamp)",
+    "CREATE INDEX IF NOT EXISTS turns_time ON turns (timestamp)",
+    "CREATE INDEX IF NOT EXISTS turns_session_mode_time ON turns (session, mode, timestamp)",
+    "CREATE INDEX IF NOT EXISTS turns_session_time ON turns (session, timestamp)",
+    """CREATE TABLE IF NOT EXISTS commands (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT NOT NULL,
+        cwd TEXT,
+        command TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS commands_time ON commands (timestamp)",
+    """CREATE TABLE IF NOT EXISTS documents (
+        path TEXT PRIMARY KEY,
+        last_accessed TEXT NOT NULL,
+        summary TEXT,
+        analysis TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS documents_time ON documents (last_accessed)",
+    "CREATE TABLE IF NOT EXISTS environment (name TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)",
+]
+
+
+class SQLiteContextManager(ContextManager):
+    """以 SQLite 数据库保存上下文的上下文管理器"""
+
+    def __init__(self, max_history=20, session=None, history_scope="session"):
+        """
+        初始化上下文管理器
+
+        Args:
+            max_history (int): conversation_history 返回的最大历史记录条数（数据库中保留全部记录）
+            session (str): 当前会话标识，记录在每轮对话中
+            history_scope (str): session 只使用本会话的历史，global 使用所有会话的历史
+        """
+        self._conn = None
+        self._lock = threading.Lock()
+        super().__init__(max_history, session, history_scope)
+        # 基类初始化时的赋值会经过下面的 setter，这里恢复为从数据库读取
+        self._history_override = None
+        self._documents_override = None
+
+    @property
+    def conversation_history(self):
+        """最近 max_history 轮对话（按时间顺序）；被整体替换后（如批量模式清空历史）只使用内存中的列表"""
+        if self._history_override is not None:
+            return self._history_override
+        rows = self._query_turns("1", (), self.max_history)
+        return ([self._turn(row) for row in reversed(rows)] + self._pending_turns())[-self.max_history:]
+
+    @conversation_history.setter
+    def conversation_history(self, value):
+        self._history_override = value
+
+    @property
+    def document_context(self):
+        """全部文档记录；被整体替换后只使用内存中的字典"""
+        if self._documents_override is not None:
+            return self._documents_override
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, last_accessed, summary, analysis FROM documents ORDER BY last_accessed"
+            ).fetchall()
+        documents = {row[0]: self._document(row) for row in rows}
+        documents.update(self._pending_documents())
+        return documents
+
+    @document_context.setter
+    def document_context(self, value):
+        self._documents_override = value
+
+    def save_context_to_disk(self):
+        """把本次调用的变化在一个事务中写入数据库"""
+        if not self._pending:
+            return
+        with self._lock, self._db as db:
+            for record in self._pending:
+                self._write(db, record)
+        self._pending = []
+
+    def _record(self, record):
+        """应用一条变化，并记下待保存：环境和命令保存在内存中，对话和文档保存后从数据库读取"""
+        op = record.get("op")
+        if op in ("env", "command"):
+            self._apply(vars(self), record)
+        elif op == "turn" and self._history_override is not None:
+            self._history_override.append(record["entry"])
+        elif op == "document" and self._documents_override is not None:
+            self._documents_override[record["path"]] = record["entry"]
+        self._pending.append(record)
+
+    def _write(self, db, record):
+        op = record.get("op")
+        if op == "turn":
+            entry = record["entry"]
+            db.execute("INSERT INTO turns (timestamp, mode, cwd, user, system, session) VALUES (?, ?, ?, ?, ?, ?)",
+                       (entry["timestamp"], entry["mode"], self.current_directory, entry["user"],
+                        entry.get("system"), entry.get("session")))
+        elif op == "env":
+            db.executemany("INSERT OR REPLACE INTO environment (name, value) VALUES (?, ?)",
+                           (record.get("set") or {}).items())
+            if record.get("cwd"):
+                db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('current_directory', ?)",
+                           (record["cwd"],))
+        elif op == "command":
+            entry = record["entry"]
+            db.execute("INSERT INTO commands (timestamp, cwd, command) VALUES (?, ?, ?)",
+                       (entry["timestamp"], entry.get("cwd"), entry["command"]))
+        elif op == "document":
+            entry = record["entry"]
+            db.execute("INSERT OR REPLACE INTO documents (path, last_accessed, summary, analysis) "
+                       "VALUES (?, ?, ?, ?)",
+                       (record["path"], entry["last_accessed"], entry.get("summary"), entry.get("analysis")))
+
+    def _load_context_from_disk(self):
+        """打开数据库（首次打开时迁移），读取环境、当前目录和最近的命令；对话和文档在用到时按索引查询"""
+        try:
+            with self._lock:
+                db = self._db
+                self.environment_state = dict(db.execute("SELECT name, value FROM environment"))
+                row = db.execute("SELECT value FROM state WHERE key = 'current_directory'").fetchone()
+                self.current_directory = row[0] if row else None
+                rows = db.execute(
+                    "SELECT timestamp, cwd, command FROM commands ORDER BY timestamp DESC, id DESC LIMIT ?",
+                    (MAX_RECENT_COMMANDS,)
+                ).fetchall()
+            self.recent_commands = [{"command": command, "timestamp": timestamp, "cwd": cwd}
+                                    for timestamp, cwd, command in reversed(rows)]
+        except sqlite3.Error as e:
+            print(f"加载上下文失败: {str(e)}")
+
+    @property
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(str(self.context_dir / HISTORY_DB), timeout=BUSY_TIMEOUT,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._migrate(conn)
+            self._conn = conn
+        return self._conn
+
+    def _migrate(self, conn):
+        """建表或升级，并在数据库首次创建时从 context.json（及其日志）导入；多个进程同时首次打开时只执行一次"""
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                # 版本 1 的对话没有会话列
+                if version == 1:
+                    conn.execute("ALTER TABLE turns ADD COLUMN session TEXT")
+                for statement in SCHEMA:
+                    conn.execute(statement)
+                if version == 0:
+                    self._import_json_store(conn)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _import_json_store(self, conn):
+        try:
+            state, _, _ = self._read_disk_state()
+        except (OSError, ValueError) as e:
+            print(f"迁移 context.json 失败: {str(e)}")
+            return
+        conn.executemany(
+            "INSERT INTO turns (timestamp, mode, cwd, user, system, session) VALUES (?, ?, NULL, ?, ?, ?)",
+            [(entry.get("timestamp", ""), entry.get("mode", "conversation"), entry.get("user", ""),
+              entry.get("system"), entry.get("session")) for entry in state["conversation_history"]]
+        )
+        conn.executemany(
+            "INSERT INTO commands (timestamp, cwd, command) VALUES (?, ?, ?)",
+            [(entry.get("timestamp", ""), entry.get("cwd"), entry["command"])
+             for entry in state["recent_commands"] if entry.get("command")]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO documents (path, last_accessed, summary, analysis) VALUES (?, ?, ?, ?)",
+            [(path, entry.get("last_accessed", ""), entry.get("summary"), entry.get("analysis"))
+             for path, entry in state["document_context"].items()]
+        )
+        conn.executemany("INSERT OR REPLACE INTO environment (name, value) VALUES (?, ?)",
+                         state["environment_state"].items())
+        if state["current_directory"]:
+            conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('current_directory', ?)",
+                         (state["current_directory"],))
+
+    def _query_turns(self, where, params, limit):
+        """按时间从新到旧查询可见的对话 (id, timestamp, mode, user, system, session)"""
+        select = "SELECT id, timestamp, mode, user, system, session FROM turns WHERE {} " + where
+        if self.history_scope == "global":
+            sql = select.format("1 AND")
+        elif self.session is None:
+            sql = select.format("session IS NULL AND")
+        else:
+            # 本会话的和没有会话标识的对话分别按会话索引查询再归并；用 OR 合并条件时用不上会话索引
+            sql = select.format("session IS ? AND") + " UNION ALL " + select.format("session IS NULL AND")
+            params = (self.session, *params, *params)
+        with self._lock:
+            return self._db.execute(f"{sql} ORDER BY timestamp DESC, id DESC LIMIT ?", (*params, limit)).fetchall()
+
+    @staticmethod
+    def _turn(row):
+        entry = {"user": row[3], "timestamp": row[1], "mode": row[2]}
+        if row[4]:
+            entry["system"] = row[4]
+        if row[5]:
+            entry["session"] = row[5]
+        return entry
+
+    @staticmethod
+    def _document(row):
+        return {"last_accessed": row[1], "summary": row[2], "analysis": row[3]}
+
+    def _pending_turns(self):
+        return [record["entry"] for record in self._pending if record.get("op") == "turn"]
+
+    def _pending_documents(self):
+        return {record["path"]: record["entry"] for record in self._pending if record.get("op") == "document"}
+
+    def _get_relevant_history(self, current_mode, max_entries=10):
+        """
+        获取与当前模式相关的历史记录：按 (mode, timestamp) 索引取最近的同模式对话；
+        太少时补充其他模式的对话，优先当前目录中的（按 (cwd, timestamp) 索引）
+
+        Args:
+            current_mode (str): 当前操作模式
+            max_entries (int): 最大返回条数
+
+        Returns:
+            list: 相关历史记录（按时间顺序）
+        """
+        if self._history_override is not None:
+            return super()._get_relevant_history(current_mode, max_entries)
+
+        pending = self._pending_turns()
+        relevant = [self._turn(row) for row in reversed(self._query_turns("mode = ?", (current_mode,), max_entries))]
+        relevant = (relevant + [entry for entry in pending if entry.get("mode") == current_mode])[-max_entries:]
+        if len(relevant) >= max_entries // 2:
+            return relevant
+
+        needed = max_entries - len(relevant)
+        rows = []
+        if self.current_directory:
+            rows = self._query_turns("cwd = ? AND mode != ?", (self.current_directory, current_mode), needed)
+        if len(rows) < needed:
+            seen = {row[0] for row in rows}
+            rows += [row for row in self._query_turns("mode != ?", (current_mode,), needed) if row[0] not in seen]
+        # 尚未保存的对话最新，其次是当前目录中的，再其次是其他目录中的
+        general = [entry for entry in reversed(pending) if entry.get("mode") != current_mode]
+        general += [self._turn(row) for row in rows]
+        # 合并并保持时间顺序
+        return sorted(relevant + general[:needed], key=lambda x: x.get("timestamp", ""))
+
+    def _get_recent_documents(self, count=3):
+        """
+        获取最近处理的文档信息（按 last_accessed 索引查询）
+
+        Args:
+            count (int): 返回的文档数量
+
+        Returns:
+            dict: 最近文档信息
+        """
+        if self._documents_override is not None:
+            return super()._get_recent_documents(count)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, last_accessed, summary, analysis FROM documents ORDER BY last_accessed DESC LIMIT ?",
+                (count,)
+            ).fetchall()
+        documents = {row[0]: self._document(row) for row in rows}
+        documents.update(self._pending_documents())
+        recent = sorted(documents.items(), key=lambda x: x[1].get("last_accessed", ""), reverse=True)
+        return dict(recent[:count])
+
+    def __getstate__(self):
+        # 数据库连接和锁不能复制（批量模式为每条记录深拷贝上下文），副本在用到时重新打开连接
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
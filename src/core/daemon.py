@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+常驻守护进程模块
+预先加载依赖、配置和 API 连接，通过每用户的 Unix 套接字为 `ai` 命令提供服务，
+客户端只需转发参数、工作目录、环境变量和标准输入输出，省去每次调用的 Python 冷启动
+
+本模块在顶层只导入标准库，客户端路径可以在 `python -I -S` 下运行
+"""
+
+import os
+import sys
+import json
+import time
+import select
+import signal
+import socket
+import argparse
+import importlib
+import traceback
+
+# 守护进程不可用时客户端的退出码，调用方据此回退到进程内执行
+DAEMON_UNAVAILABLE = 75
+
+DEFAULT_SOCKET_PATH = "~/.ai_terminal/daemon.sock"
+DEFAULT_PID_FILE = "~/.ai_terminal/daemon.pid"
+DEFAULT_LOG_FILE = "~/.ai_terminal/daemon.log"
+
+# 预备工作进程的空闲时长(秒)，超时后替换为新进程，避免长期持有失效连接和过期状态
+DEFAULT_IDLE_TIMEOUT = 300
+
+# 在主进程中预先导入的模块，fork 出的工作进程直接继承
+PRELOAD_MODULES = [
+    "click",
+    "yaml",
+    "mistralai",
+    "src.main",
+    "src.core.llm_client",
+    "src.core.context_budget",
+    "src.core.max_tokens",
+    "src.core.model_cascade",
+    "src.core.speculation",
+    "src.core.context_manager",
+    "src.handlers.command_handler",
+    "src.handlers.conversation_handler",
+    "src.handlers.document_handler",
+]
+
+
+def get_socket_path(path=None):
+    """
+    获取守护进程套接字路径
+
+    Args:
+        path (str): 显式指定的路径
+
+    Returns:
+        str: 展开后的套接字路径
+    """
+    return os.path.expanduser(path or os.environ.get("AI_TERMINAL_SOCKET") or DEFAULT_SOCKET_PATH)
+
+
+def _send_message(conn, message):
+    """发送一行 JSON 消息"""
+    conn.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def run_client(argv, socket_path=None):
+    """
+    作为瘦客户端把请求转交给守护进程
+
+    标准输入、输出和错误的文件描述符通过 SCM_RIGHTS 传递给工作进程，
+    因此输出直接流式写入调用方的终端
+
+    Args:
+        argv (list): 命令行参数（不含程序名）
+        socket_path (str): 套接字路径
+
+    Returns:
+        int: 命令的退出码；守护进程不可用时返回 None
+    """
+    path = get_socket_path(socket_path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        socket.send_fds(sock, [b"\0"], [0, 1, 2])
+        _send_message(sock, {"argv": list(argv), "cwd": os.getcwd(), "env": dict(os.environ)})
+    except OSError:
+        sock.close()
+        return None
+
+    worker_pid = None
+    reader = sock.makefile("rb")
+    with sock, reader:
+        while True:
+            try:
+                line = reader.readline()
+            except KeyboardInterrupt:
+                # 将 Ctrl-C 转发给工作进程，由其按进程内执行时的方式退出
+                if worker_pid is None:
+                    return 130
+                try:
+                    os.kill(worker_pid, signal.SIGINT)
+                except OSError:
+                    return 130
+                continue
+            except OSError:
+                line = b""
+
+            if not line:
+                # 工作进程尚未开始执行时可以安全回退；否则不再重复执行请求
+                return None if worker_pid is None else 1
+
+            message = json.loads(line)
+            if "pid" in message:
+                worker_pid = message["pid"]
+            elif "exit" in message:
+                return message["exit"]
+
+
+class AITerminalDaemon:
+    """预派生（prefork）模式的守护进程
+
+    主进程只负责预加载模块和维护一个预备工作进程。预备工作进程已加载配置并建立好
+    API 连接，接受一个连接、处理完请求后即退出，主进程随即派生新的预备进程。
+    每个请求都运行在独立的进程中，工作目录和环境变量互不干扰。
+    """
+
+    def __init__(self, socket_path=None, pid_file=None, config_path=None, idle_timeout=None):
+        """
+        初始化守护进程
+
+        Args:
+            socket_path (str): 监听的 Unix 套接字路径
+            pid_file (str): PID 文件路径
+            config_path (str): 配置文件路径
+            idle_timeout (int): 预备工作进程的空闲时长(秒)
+        """
+        self.socket_path = get_socket_path(socket_path)
+        self.pid_file = os.path.expanduser(pid_file or DEFAULT_PID_FILE)
+        self.config_path = config_path
+        self.idle_timeout = idle_timeout
+        self.listener = None
+        self._running = False
+
+    def serve_forever(self):
+        """运行主循环，直到收到 SIGTERM 或 SIGINT"""
+        self._preload()
+        settings = self._load_settings()
+        if self.idle_timeout is None:
+            self.idle_timeout = settings.get("daemon", {}).get("idle_timeout", DEFAULT_IDLE_TIMEOUT)
+
+        self._bind()
+        with open(self.pid_file, "w") as f:
+            f.write(str(os.getpid()))
+
+        self._running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        notify_r, notify_w = os.pipe()
+        spare = None
+        try:
+            while self._running:
+                if spare is None:
+                    spare = self._spawn_worker(notify_r, notify_w)
+
+                ready, _, _ = select.select([notify_r], [], [], 1.0)
+                if ready:
+                    # 预备进程已接受连接，立即补充新的预备进程
+                    os.read(notify_r, 64)
+                    spare = None
+
+                if spare is not None and spare in self._reap_children():
+                    spare = None
+                elif spare is None:
+                    self._reap_children()
+        finally:
+            if spare is not None:
+                try:
+                    os.kill(spare, signal.SIGTERM)
+                except OSError:
+                    pass
+            self._cleanup()
+
+    def _stop(self, signum, frame):
+        """信号处理：请求退出主循环"""
+        self._running = False
+
+    def _preload(self):
+        """预先导入耗时的模块"""
+        for name in PRELOAD_MODULES:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass
+
+    def _load_settings(self):
+        """加载配置，失败时返回空配置"""
+        try:
+            from src.utils.config_loader import load_config
+            return load_config(self.config_path) or {}
+        except Exception:
+            return {}
+
+    def _bind(self):
+        """绑定监听套接字，清理残留的套接字文件"""
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                probe.close()
+                raise RuntimeError(f"守护进程已在运行: {self.socket_path}")
+
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        # 套接字仅允许当前用户访问
+        old_umask = os.umask(0o077)
+        try:
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self.listener.listen(16)
+
+    def _cleanup(self):
+        """关闭监听套接字并删除运行时文件"""
+        if self.listener:
+            self.listener.close()
+        for path in (self.socket_path, self.pid_file):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _reap_children(self):
+        """
+        回收已退出的子进程
+
+        Returns:
+            set: 已退出的子进程 PID
+        """
+        exited = set()
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            exited.add(pid)
+        return exited
+
+    def _spawn_worker(self, notify_r, notify_w):
+        """
+        派生预备工作进程
+
+        Returns:
+            int: 工作进程 PID
+        """
+        pid = os.fork()
+        if pid:
+            return pid
+
+        code = 1
+        try:
+            os.close(notify_r)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            self._warm_up()
+
+            self.listener.settimeout(self.idle_timeout)
+            try:
+                conn, _ = self.listener.accept()
+            except socket.timeout:
+                os._exit(0)
+            os.write(notify_w, b"1")
+            os.close(notify_w)
+            self.listener.close()
+            conn.settimeout(None)
+            code = self._handle_connection(conn)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(code)
+
+    def _warm_up(self):
+        """在工作进程中建立 API 连接，供随后的请求复用"""
+        try:
+            from src.core.llm_client import MistralClient
+            MistralClient(self._load_settings().get("api", {})).warm_up()
+        except Exception:
+            pass
+
+    def _handle_connection(self, conn):
+        """
+        在当前工作进程中执行一个客户端请求
+
+        Args:
+            conn (socket.socket): 客户端连接
+
+        Returns:
+            int: 退出码
+        """
+        _, fds, _, _ = socket.recv_fds(conn, 1, 3)
+        with conn.makefile("rb") as reader:
+            request = json.loads(reader.readline())
+
+        # 接管客户端的标准输入输出
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        _reopen_std_streams()
+
+        os.environ.clear()
+        os.environ.update(request.get("env", {}))
+        code = 0
+        try:
+            os.chdir(request.get("cwd") or os.path.expanduser("~"))
+            _send_message(conn, {"pid": os.getpid()})
+
+            from src.main import main
+            main.main(args=request.get("argv", []), prog_name="ai")
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                code = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except KeyboardInterrupt:
+            code = 130
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+        try:
+            _send_message(conn, {"exit": code})
+        except OSError:
+            pass
+        conn.close()
+        return code
+
+
+def _reopen_std_streams():
+    """按新的文件描述符重建 sys 标准流（编码和缓冲方式取决于新的终端）"""
+    sys.stdin = open(0, "r", encoding="utf-8", errors="replace", closefd=False)
+    sys.stdout = open(1, "w", buffering=1 if os.isatty(1) else -1, encoding="utf-8", closefd=False)
+    sys.stderr = open(2, "w", buffering=1, encoding="utf-8", closefd=False)
+
+
+def _read_pid(pid_file):
+    """读取 PID 文件，进程不存在时返回 None"""
+    try:
+        with open(pid_file) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+        return pid
+    except (OSError, ValueError):
+        return None
+
+
+def _daemonize(log_file):
+    """两次 fork 脱离终端，标准输出重定向到日志文件"""
+    if os.fork():
+        return False
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+
+    os.chdir("/")
+    with open(os.devnull, "rb") as devnull:
+        os.dup2(devnull.fileno(), 0)
+    log_fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    os.close(log_fd)
+    _reopen_std_streams()
+    return True
+
+
+def main(argv=None):
+    """守护进程管理命令：start / stop / status / run"""
+    parser = argparse.ArgumentParser(prog="ai_terminald", description="AI Terminal 常驻守护进程")
+    parser.add_argument("action", choices=["start", "stop", "status", "run"])
+    parser.add_argument("--socket", help="Unix 套接字路径")
+    parser.add_argument("--config", help="配置文件路径")
+    args = parser.parse_args(argv)
+
+    pid_file = os.path.expanduser(DEFAULT_PID_FILE)
+    pid = _read_pid(pid_file)
+
+    if args.action == "status":
+        print(f"守护进程运行中 (PID {pid})" if pid else "守护进程未运行")
+        return 0 if pid else 1
+
+    if args.action == "stop":
+        if not pid:
+            print("守护进程未运行")
+            return 1
+        os.kill(pid, signal.SIGTERM)
+        for _ in range(50):
+            if _read_pid(pid_file) is None:
+                break
+            time.sleep(0.1)
+        print("守护进程已停止")
+        return 0
+
+    if pid:
+        print(f"守护进程已在运行 (PID {pid})")
+        return 0
+
+    daemon = AITerminalDaemon(socket_path=args.socket, config_path=args.config)
+    if args.action == "start":
+        if not _daemonize(os.path.expanduser(DEFAULT_LOG_FILE)):
+            print("守护进程已启动")
+            return 0
+        try:
+            daemon.serve_forever()
+        finally:
+            os._exit(0)
+
+    daemon.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+流式响应提前结束模块
+在流式输出中检测第一个代码块的结束或指定的停止序列，检测到后调用方即可关闭流，
+不再等待（也不再为）模型在代码块之后生成的说明文字付费
+"""
+
+from typing import Iterable, Optional, Tuple
+
+FENCE = "```"
+
+
+class EarlyStop:
+    """检测流式输出的结束点
+
+    feed 逐段接收输出，返回可以输出的文本以及是否已经到达结束点。可能构成停止序列或代码块标记
+    开头的内容会暂存到下一个片段，保证跨片段的标记也能被识别，结束点之后的内容不会输出。
+    """
+
+    def __init__(self, stop_sequences: Optional[Iterable[str]] = None, code_block: bool = True):
+        """
+        初始化检测器
+
+        Args:
+            stop_sequences (list): 停止序列，出现时在其之前结束（停止序列本身不输出）
+            code_block (bool): 是否在第一个代码块结束时结束（结束标记保留）
+        """
+        self.stop_sequences = [s for s in (stop_sequences or []) if s]
+        self.code_block = code_block
+        self.stopped = False
+        self._text = ""
+        self._emitted = 0
+
+    def feed(self, text: str) -> Tuple[str, bool]:
+        """
+        处理一个片段
+
+        Args:
+            text (str): 流式响应的片段
+
+        Returns:
+            tuple: (可以输出的文本, 是否已经到达结束点)
+        """
+        if self.stopped:
+            return "", True
+        self._text += text
+
+        end = self._find_end()
+        if end is not None:
+            self.stopped = True
+            output = self._text[self._emitted:end]
+            self._emitted = end
+            return output, True
+
+        safe = len(self._text) - self._pending_length()
+        output = self._text[self._emitted:safe]
+        self._emitted = max(self._emitted, safe)
+        return output, False
+
+    def flush(self) -> str:
+        """流正常结束时取出暂存的内容"""
+        if self.stopped:
+            return ""
+        output = self._text[self._emitted:]
+        self._emitted = len(self._text)
+        return output
+
+    def truncate(self, text: str) -> str:
+        """
+        对完整的（非流式）响应应用同样的结束规则
+
+        Args:
+            text (str): 完整响应
+
+        Returns:
+            str: 结束点之前的内容
+        """
+        output, stopped = self.feed(text)
+        return output if stopped else output + self.flush()
+
+    @property
+    def text(self) -> str:
+        """已输出的文本"""
+        return self._text[:self._emitted]
+
+    def _find_end(self) -> Optional[int]:
+        """查找结束点在已接收文本中的位置"""
+        candidates = []
+        for sequence in self.stop_sequences:
+            index = self._text.find(sequence)
+            if index >= 0:
+                candidates.append(index)
+
+        if self.code_block:
+            opening = self._text.find(FENCE)
+            if opening >= 0:
+                # 开始标记所在行（含语言标识）结束后才开始查找结束标记
+                body = self._text.find("\n", opening)
+                closing = self._text.find(FENCE, body) if body >= 0 else -1
+                if closing >= 0:
+                    candidates.append(closing + len(FENCE))
+        return min(candidates) if candidates else None
+
+    def _pending_length(self) -> int:
+        """文本末尾可能是停止序列或代码块标记开头的长度，这部分暂不输出"""
+        markers = list(self.stop_sequences)
+        if self.code_block:
+            markers.append(FENCE)
+        pending = 0
+        for marker in markers:
+            for size in range(min(len(marker) - 1, len(self._text)), 0, -1):
+                if self._text.endswith(marker[:size]):
+                    pending = max(pending, size)
+                    break
+        return pending
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+端点选择模块
+为每个端点维护首个 token 延迟和错误率的指数加权移动平均（EWMA，跨进程持久化），
+每次请求按得分从优到劣尝试各端点，出错时自动切换到下一个
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional
+
+ENDPOINT_STATS_FILE = "~/.ai_terminal/endpoints.json"
+
+# EWMA 中新样本的权重
+EWMA_ALPHA = 0.3
+# 错误率对得分的放大系数：得分 = 延迟 × (1 + ERROR_PENALTY × 错误率) / (1 - 错误率)，
+# 持续出错的端点无论延迟多低最终都会排到后面
+ERROR_PENALTY = 10
+MAX_ERROR_RATE = 0.99
+# 超过该时长（秒）没有样本的端点重新探测一次，使恢复后的端点有机会被选中
+PROBE_INTERVAL = 300
+
+
+class EndpointSelector:
+    """按延迟和错误率选择端点"""
+
+    def __init__(self, names: List[str], path: str = ENDPOINT_STATS_FILE):
+        """
+        初始化选择器
+
+        Args:
+            names (list): 端点名称（按配置顺序，没有统计数据时按此顺序探测）
+            path (str): 统计文件路径
+        """
+        self.names = list(names)
+        self.path = os.path.expanduser(path)
+        self._stats: Optional[Dict[str, Dict]] = None
+        # 对冲请求的多个线程可能同时记录
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> Dict[str, Dict]:
+        """按 "端点/请求类型" 索引的统计 {latency, errors, updated}，首次访问时从磁盘读取"""
+        if self._stats is None:
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                self._stats = {k: v for k, v in data.items() if isinstance(v, dict)}
+            except (OSError, ValueError, AttributeError):
+                self._stats = {}
+        return self._stats
+
+    def score(self, name: str, kind: str) -> Optional[float]:
+        """
+        端点得分（越小越好）
+
+        Args:
+            name (str): 端点名称
+            kind (str): 请求类型（complete 为完整响应耗时，stream 为首个 token 耗时）
+
+        Returns:
+            float: 得分，没有统计数据或需要重新探测时返回 None
+        """
+        entry = self.stats.get(f"{name}/{kind}")
+        if not entry or time.time() - entry.get("updated", 0) > PROBE_INTERVAL:
+            return None
+        errors = min(entry["errors"], MAX_ERROR_RATE)
+        return entry["latency"] * (1 + ERROR_PENALTY * errors) / (1 - errors)
+
+    def ranked(self, kind: str) -> List[str]:
+        """
+        按尝试顺序排列的端点：需要探测的端点在前（按配置顺序），其余按得分从优到劣
+
+        Args:
+            kind (str): 请求类型
+
+        Returns:
+            list: 端点名称
+        """
+        scores = {name: self.score(name, kind) for name in self.names}
+        unexplored = [name for name in self.names if scores[name] is None]
+        explored = sorted((name for name in self.names if scores[name] is not None), key=lambda n: scores[n])
+        return unexplored + explored
+
+    def record(self, name: str, kind: str, seconds: float, failed: bool = False):
+        """
+        记录一次请求结果并写回磁盘
+
+        Args:
+            name (str): 端点名称
+            kind (str): 请求类型
+            seconds (float): 延迟（秒）
+            failed (bool): 请求是否失败（此时 seconds 为失败前等待的时长）
+        """
+        with self._lock:
+            self._record(f"{name}/{kind}", seconds, failed)
+
+    def _record(self, key, seconds, failed):
+        entry = self.stats.get(key)
+        if entry is None:
+            entry = {"latency": seconds, "errors": 1.0 if failed else 0.0}
+        else:
+            # 失败请求的等待时长只会抬高延迟（如超时），立即返回的错误不会让端点显得更快
+            if not failed or seconds > entry["latency"]:
+                entry["latency"] += EWMA_ALPHA * (seconds - entry["latency"])
+            entry["errors"] += EWMA_ALPHA * ((1.0 if failed else 0.0) - entry["errors"])
+        entry["updated"] = time.time()
+        self.stats[key] = entry
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.stats, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
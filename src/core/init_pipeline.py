@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+初始化流水线模块
+并行执行互不依赖的启动步骤（加载配置、加载上下文、探测环境、建立连接等），
+并记录各步骤的耗时，用于分析启动的关键路径
+"""
+
+import time
+import threading
+from concurrent.futures import Future
+
+
+class InitPipeline:
+    """按依赖关系并行执行启动步骤
+
+    每个步骤运行在独立的守护线程中，未被等待的步骤（如连接预热）不会阻塞进程退出。
+    """
+
+    def __init__(self):
+        """初始化流水线"""
+        self._tasks = {}
+        self._futures = {}
+        self._timings = {}
+        self._origin = None
+
+    def add(self, name, func, deps=()):
+        """
+        注册一个步骤
+
+        Args:
+            name (str): 步骤名称
+            func (callable): 无参函数，可在内部通过 result() 读取依赖步骤的结果
+            deps (tuple): 依赖的步骤名称，全部完成后才开始执行
+        """
+        self._tasks[name] = (func, tuple(deps))
+        self._futures[name] = Future()
+
+    def start(self):
+        """启动所有步骤"""
+        self._origin = time.perf_counter()
+        for name in self._tasks:
+            thread = threading.Thread(target=self._run, args=(name,), name=f"init-{name}", daemon=True)
+            thread.start()
+
+    def result(self, name, timeout=None):
+        """
+        等待并返回步骤结果，步骤失败时抛出其异常
+
+        Args:
+            name (str): 步骤名称
+            timeout (float): 最长等待时间(秒)
+
+        Returns:
+            Any: 步骤函数的返回值
+        """
+        return self._futures[name].result(timeout)
+
+    def _run(self, name):
+        """在线程中执行单个步骤"""
+        func, deps = self._tasks[name]
+        future = self._futures[name]
+        try:
+            for dep in deps:
+                self._futures[dep].result()
+            start = time.perf_counter()
+            try:
+                value = func()
+            finally:
+                self._timings[name] = (start - self._origin, time.perf_counter() - self._origin)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(value)
+
+    def timings(self):
+        """
+        获取已完成步骤的耗时
+
+        Returns:
+            dict: 步骤名称 -> (开始时间, 结束时间)，单位为秒，相对于流水线启动时刻
+        """
+        return dict(self._timings)
+
+    def critical_path(self, names):
+        """
+        计算关键路径：从给定步骤中最晚结束的一个出发，沿最晚结束的依赖回溯
+
+        Args:
+            names (list): 调用方实际等待的步骤
+
+        Returns:
+            list: 关键路径上的步骤名称，按执行顺序排列
+        """
+        finished = [name for name in names if name in self._timings]
+        if not finished:
+            return []
+
+        current = max(finished, key=lambda n: self._timings[n][1])
+        path = [current]
+        while True:
+            deps = [dep for dep in self._tasks[current][1] if dep in self._timings]
+            if not deps:
+                break
+            current = max(deps, key=lambda n: self._timings[n][1])
+            path.append(current)
+        return list(reversed(path))
+
+    def report(self, names):
+        """
+        生成耗时报告
+
+        Args:
+            names (list): 调用方实际等待的步骤
+
+        Returns:
+            list: 报告文本行
+        """
+        lines = []
+        for name, (start, end) in sorted(self._timings.items(), key=lambda item: item[1][0]):
+            lines.append(f"  {name:<12} {start * 1000:8.1f}ms → {end * 1000:8.1f}ms ({(end - start) * 1000:.1f}ms)")
+
+        path = self.critical_path(names)
+        if path:
+            total = self._timings[path[-1]][1] * 1000
+            lines.append(f"  关键路径: {' → '.join(path)} ({total:.1f}ms)")
+        return lines
@@ -5,12 +5,41 @@ Mistral API 客户端模块
 """
 
 import os
+import time
+import itertools
+import contextlib
 from typing import Dict, List, Optional, Generator, Any
-from mistralai import Mistral
+
+from src.core.backends import MistralBackend, build_backends
+from src.core.compression import RequestCompressor
+from src.core.context_budget import ContextAssembler, TokenEstimator
+from src.core.early_stop import EarlyStop
+from src.core.endpoint_selector import EndpointSelector
+from src.core.max_tokens import AdaptiveMaxTokens
+from src.core.request_policy import RequestPolicy, is_retryable
+from src.core.response_cache import ResponseCache
+from src.core.single_flight import LeaderLost, SingleFlight
+from src.core.stream_resume import EchoedPrefixFilter, StreamInterruptedError, continuation_messages
+
+# 发送给 API 的采样参数（同时参与缓存键的计算）
+SAMPLING_PARAMS = ("temperature", "max_tokens", "top_p", "stop")
+
+
+def __getattr__(name):
+    """延迟导入 mistralai SDK（连带 pydantic、httpx），只有在真正发送请求时才加载"""
+    if name == "Mistral":
+        from mistralai import Mistral
+        globals()["Mistral"] = Mistral
+        return Mistral
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class MistralClient:
     """Mistral API 客户端类，负责与 Mistral API 通信"""
     
+    # 已预热的 SDK 客户端（按 API 密钥和地址索引），供常驻进程复用已建立的连接
+    _warm_clients: Dict[str, Any] = {}
+    
     def __init__(self, config: Optional[Dict] = None):
         """
         初始化 Mistral 客户端
@@ -20,11 +49,60 @@ class MistralClient:
         """
         config = config or {}
         self.api_key = config.get('api_key') or os.environ.get("MISTRAL_API_KEY")
-        if not self.api_key:
+        # 配置了多个端点（api.endpoints）时按延迟和错误率选择，否则只使用 Mistral 官方（或 server_url 指定的）地址
+        self.endpoints = config.get('endpoints') or []
+        if not self.api_key and not self.endpoints:
             raise ValueError("缺少 Mistral API 密钥。请设置环境变量 MISTRAL_API_KEY 或在配置文件中设置。")
         
         self.model = config.get('model', "mistral-small-latest")
-        self.client = Mistral(api_key=self.api_key)
+        # 最近一次请求实际使用的模型（调用时可以通过 model 参数指定其他模型）
+        self.last_model = self.model
+        # 自定义 API 地址（如代理网关），留空使用 SDK 默认地址
+        self.server_url = config.get('server_url') or None
+        self._client = None
+        self._compressor: Optional[RequestCompressor] = None
+        self._endpoint_sdks: Dict[tuple, Any] = {}
+        if self.endpoints:
+            self.backends = build_backends(self.endpoints, self.api_key, self._endpoint_sdk)
+        else:
+            self.backends = [MistralBackend("mistral", lambda: self.client)]
+        self.selector = EndpointSelector([b.name for b in self.backends]) if len(self.backends) > 1 else None
+        # 最近一次请求使用的端点
+        self.last_backend: Optional[str] = None
+        
+        # 响应缓存（ResponseCache），refresh_cache 为 True 时跳过读取但仍写入新结果
+        self.cache = None
+        self.refresh_cache = False
+        
+        # 跨进程合并相同的请求（SingleFlight），为 None 时每个进程各自请求
+        self.single_flight: Optional[SingleFlight] = None
+        # 最近一次请求是否跟随了其他进程的相同请求（没有调用 API）
+        self.last_coalesced = False
+        
+        # 超时、重试和对冲请求策略
+        self.policy = RequestPolicy()
+        
+        # 按 token 预算裁剪上下文（ContextAssembler），为 None 时原样发送全部历史
+        self.assembler: Optional[ContextAssembler] = None
+        self._prompt_estimate = 0
+        # 本次请求在限流器中预扣的 token 数
+        self._rate_charged = 0
+        
+        # 最近一次请求的 token 用量、结束原因和流式续传次数
+        self.last_usage: Optional[Dict[str, int]] = None
+        self.last_finish_reason: Optional[str] = None
+        self.last_resumes = 0
+        # 模型梯级（ModelCascade），由处理器在简短请求上使用，为 None 时始终使用 self.model
+        self.cascade = None
+        
+        # 按请求类型自适应 max_tokens（AdaptiveMaxTokens），为 None 时使用模式配置中的固定值
+        self.max_tokens_policy: Optional[AdaptiveMaxTokens] = None
+        self._usage_key: Optional[str] = None
+        self._max_tokens_budget = 0
+        # 最近一次请求因达到 max_tokens 被截断后扩大预算续传的次数
+        self.last_length_retries = 0
+        # 最近一次流式请求的提前结束信息（已接收和至多节省的输出 token 数），未提前结束时为 None
+        self.last_early_stop: Optional[Dict[str, int]] = None
         
         # 默认参数
         self.default_params = {
@@ -33,6 +111,95 @@ class MistralClient:
             "top_p": config.get('top_p', 0.9)
         }
     
+    @property
+    def client(self):
+        """SDK 客户端，首次使用时才创建"""
+        if self._client is None:
+            self._client = (self._warm_clients.get((self.api_key, self.server_url))
+                            or self._new_sdk(self.api_key, self.server_url))
+        return self._client
+    
+    @client.setter
+    def client(self, value):
+        self._client = value
+    
+    @property
+    def compressor(self) -> Optional[RequestCompressor]:
+        """请求体压缩策略，为 None 时原样发送"""
+        return self._compressor
+    
+    @compressor.setter
+    def compressor(self, value: Optional[RequestCompressor]):
+        self._compressor = value
+        for backend in self.backends:
+            backend.compressor = value
+    
+    def _new_sdk(self, api_key: Optional[str], server_url: Optional[str]):
+        """创建 SDK 客户端；启用了请求体压缩时为其提供压缩请求体的 HTTP 客户端"""
+        sdk_class = globals().get("Mistral") or __getattr__("Mistral")
+        if self._compressor is None:
+            return sdk_class(api_key=api_key, server_url=server_url)
+        from src.core.compression import compressing_client
+        # 与 SDK 默认创建的客户端相同的设置（包括环境变量中的代理）
+        http = compressing_client(self._compressor, follow_redirects=True)
+        return sdk_class(api_key=api_key, server_url=server_url, client=http)
+    
+    def warm_up(self, timeout: float = 5.0) -> bool:
+        """
+        预热到 API 服务器的连接（DNS + TCP + TLS），并登记该 SDK 客户端供后续复用
+        
+        Args:
+            timeout (float): 预热请求的超时时间（秒）
+            
+        Returns:
+            bool: 是否成功建立连接（配置了多个端点时，任一端点成功即可）
+        """
+        if self.endpoints:
+            return any([backend.warm_up(timeout) for backend in self.backends])
+        self._warm_clients[(self.api_key, self.server_url)] = self.client
+        return self.backends[0].warm_up(timeout)
+    
+    def _endpoint_sdk(self, api_key: str, server_url: Optional[str]):
+        """api.endpoints 中 mistral 类型端点的 SDK 客户端"""
+        key = (api_key, server_url)
+        if key not in self._endpoint_sdks:
+            self._endpoint_sdks[key] = self._warm_clients.get(key) or self._new_sdk(api_key, server_url)
+        return self._endpoint_sdks[key]
+    
+    def _call_backend(self, kind: str, call, timeout: float):
+        """
+        按端点选择器的顺序发送请求，出错时切换到下一个端点
+        
+        Args:
+            kind (str): 请求类型（complete 或 stream）
+            call (callable): call(backend, timeout) 执行一次请求
+            timeout (float): 超时时间（秒）
+            
+        Returns:
+            object: 请求结果
+            
+        Raises:
+            Exception: 所有端点都失败时抛出最后一个错误
+        """
+        if self.selector is None:
+            self.last_backend = self.backends[0].name
+            return call(self.backends[0], timeout)
+        
+        backends = {backend.name: backend for backend in self.backends}
+        error = None
+        for name in self.selector.ranked(kind):
+            start = time.perf_counter()
+            try:
+                result = call(backends[name], timeout)
+            except Exception as e:
+                self.selector.record(name, kind, time.perf_counter() - start, failed=True)
+                error = e
+                continue
+            self.selector.record(name, kind, time.perf_counter() - start)
+            self.last_backend = name
+            return result
+        raise error
+    
     def generate_response(self, user_input: str, context: Optional[Dict] = None, **kwargs) -> str:
         """
         生成响应
@@ -40,66 +207,513 @@ class MistralClient:
         Args:
             user_input (str): 用户输入的文本
             context (dict): 上下文信息，包含历史对话、系统提示等
-            **kwargs: 传递给 API 的其他参数
+            **kwargs: 传递给 API 的其他参数（model 指定本次使用的模型）
             
         Returns:
             str: 生成的响应文本
         """
-        # 构建消息历史
-        messages = self._build_messages_from_context(context or {})
+        messages, params = self._prepare_request(user_input, context, kwargs)
         
-        # 添加用户的新消息
-        messages.append({"role": "user", "content": user_input})
+        model = self.last_model = params.get("model") or self.model
+        cache_key = self._cache_key(messages, params, model)
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            return cached["content"]
         
-        # 构建 API 参数
-        params = {**self.default_params, **kwargs}
+        self.last_coalesced = False
+        flight_key = self._flight_key(messages, params, model)
+        lease = None
+        while flight_key is not None:
+            try:
+                lease = self.single_flight.begin(flight_key)
+            except OSError:
+                # 锁目录不可写时不合并，直接请求
+                break
+            if lease is not None:
+                break
+            # 其他进程正在进行相同的请求：等待其结果；对方失败或崩溃时重新竞争
+            try:
+                return "".join(self._follow_flight(flight_key))
+            except LeaderLost:
+                continue
         
-        # 调用 Mistral API
-        chat_response = self.client.chat.complete(
-            model=self.model,
-            messages=messages,
-            temperature=params.get('temperature'),
-            max_tokens=params.get('max_tokens'),
-            top_p=params.get('top_p')
-        )
+        params = self._adapt_max_tokens(params, context)
+        self._rate_charged = 0
+        self.last_usage = None
+        self.last_resumes = 0
+        self.last_length_retries = 0
+        self.last_early_stop = None
+        
+        with lease or contextlib.nullcontext():
+            content = self._complete(messages, params, model)
+            if lease is not None:
+                lease.write(content)
+                lease.finish(self.last_finish_reason)
+        
+        self._calibrate_estimator()
+        self._record_completion()
+        self._settle_rate_limit()
+        self._cache_store(cache_key, content)
         
         # 提取并返回响应内容
-        return chat_response.choices[0].message.content
+        return content
+    
+    def _complete(self, messages: List[Dict], params: Dict, model: str) -> str:
+        """
+        调用 API 生成完整响应
+        
+        Args:
+            messages (list): 消息列表
+            params (dict): 采样参数
+            model (str): 模型名称
+            
+        Returns:
+            str: 响应文本
+        """
+        # 调用 Mistral API（超时、可重试错误和对冲请求由 policy 处理）；
+        # 因达到 max_tokens 被截断时，以已生成的内容作为前缀按扩大后的预算继续生成
+        content = ""
+        while True:
+            request_messages = continuation_messages(messages, content)
+            chat_response = self.policy.call(
+                lambda timeout: self._call_backend(
+                    "complete",
+                    lambda backend, t: backend.complete(
+                        backend.model or model, request_messages, self._sampling_args(params), t),
+                    timeout
+                ),
+                kind="complete",
+                tokens=self._rate_tokens(request_messages, params, model)
+            )
+            
+            # 记录用量和结束原因
+            self._add_usage(self._usage_to_dict(chat_response.usage))
+            self.last_finish_reason = chat_response.choices[0].finish_reason
+            piece = chat_response.choices[0].message.content
+            content = content + EchoedPrefixFilter(content).feed(piece or "") if content else piece
+            
+            extended = self._extend_max_tokens(params)
+            if extended is None:
+                return content
+            params = extended
     
-    def generate_streaming_response(self, user_input: str, context: Optional[Dict] = None, **kwargs) -> Generator[str, None, None]:
+    def generate_streaming_response(self, user_input: str, context: Optional[Dict] = None,
+                                    early_stop: Optional[EarlyStop] = None, **kwargs) -> Generator[str, None, None]:
         """
         生成流式响应
         
         Args:
             user_input (str): 用户输入的文本
             context (dict): 上下文信息，包含历史对话、系统提示等
-            **kwargs: 传递给 API 的其他参数
+            early_stop (EarlyStop): 提前结束检测器，到达结束点时立即关闭流
+            **kwargs: 传递给 API 的其他参数（model 指定本次使用的模型）
             
         Yields:
             str: 流式响应的每个片段
         """
+        messages, params = self._prepare_request(user_input, context, kwargs)
+        
+        model = self.last_model = params.get("model") or self.model
+        cache_key = self._cache_key(messages, params, model)
+        cached = self._cache_lookup(cache_key)
+        if cached is not None:
+            if cached["content"]:
+                yield cached["content"]
+            return
+        
+        self.last_coalesced = False
+        flight_key = self._flight_key(messages, params, model)
+        lease = None
+        received = ""
+        while flight_key is not None:
+            try:
+                lease = self.single_flight.begin(flight_key)
+            except OSError:
+                # 锁目录不可写时不合并，直接请求
+                break
+            if lease is not None:
+                break
+            # 其他进程正在进行相同的请求：跟随其输出；对方失败或崩溃时重新竞争，
+            # 接手后以已输出的内容作为前缀续写
+            try:
+                for text in self._follow_flight(flight_key, skip=len(received)):
+                    received += text
+                    yield text
+                return
+            except LeaderLost:
+                continue
+        
+        params = self._adapt_max_tokens(params, context)
+        self._rate_charged = 0
+        self.last_usage = None
+        self.last_finish_reason = None
+        self.last_resumes = 0
+        self.last_length_retries = 0
+        self.last_early_stop = None
+        if received and early_stop is not None:
+            early_stop.feed(received)
+        
+        output = [received]
+        with lease or contextlib.nullcontext():
+            for content in self._stream(messages, params, model, early_stop, received):
+                if lease is not None:
+                    lease.write(content)
+                output.append(content)
+                yield content
+            if lease is not None:
+                lease.finish(self.last_finish_reason)
+        
+        self._calibrate_estimator()
+        self._record_completion()
+        self._settle_rate_limit()
+        self._cache_store(cache_key, "".join(output))
+    
+    def _stream(self, messages: List[Dict], params: Dict, model: str, early_stop: Optional[EarlyStop] = None,
+                received: str = "") -> Generator[str, None, None]:
+        """
+        调用 API 流式接口：收到首个 token 之前的超时和错误按 policy 重试；
+        中途断开时以已收到的内容作为 assistant 前缀续传，只生成剩余部分
+        
+        Args:
+            messages (list): 消息列表
+            params (dict): 采样参数
+            model (str): 模型名称
+            early_stop (EarlyStop): 提前结束检测器
+            received (str): 已经输出的内容（接手其他进程的请求时），从其后继续生成
+            
+        Yields:
+            str: 新输出的片段
+        """
+        # chunks 为收到的全部内容（续传前缀）；提前结束时只输出结束点之前的部分
+        chunks = [received] if received else []
+        resume = 0
+        while True:
+            partial = "".join(chunks)
+            request_messages = continuation_messages(messages, partial)
+            echo_filter = EchoedPrefixFilter(partial)
+            try:
+                stream, head, events = self.policy.call(
+                    lambda timeout: self._open_stream(request_messages, model, params, timeout),
+                    kind="stream",
+                    discard=lambda opened: opened[0].response.close(),
+                    tokens=self._rate_tokens(request_messages, params, model)
+                )
+                
+                # 返回流式响应生成器；提前关闭生成器时同时关闭底层连接，不完整的结果不会写入缓存
+                with stream:
+                    for chunk in itertools.chain(head, (event.data for event in events)):
+                        content = self._consume_chunk(chunk, echo_filter)
+                        if not content:
+                            continue
+                        chunks.append(content)
+                        if early_stop is not None:
+                            content, stopped = early_stop.feed(content)
+                            if stopped:
+                                # 到达结束点：退出 with 时关闭连接，服务端随之停止生成
+                                self._record_early_stop(early_stop.text, params)
+                        if content:
+                            yield content
+                        if self.last_early_stop:
+                            break
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if resume >= self.policy.max_resumes:
+                    raise StreamInterruptedError(f"流式响应在结束前中断: {e}") from e
+            else:
+                # 因达到 max_tokens 被截断时按扩大后的预算续传
+                if self.last_finish_reason == "length" and not self.last_early_stop:
+                    extended = self._extend_max_tokens(params)
+                    if extended is not None:
+                        params = extended
+                        self.last_finish_reason = None
+                        continue
+                # 没有收到结束原因就结束的流同样视为中断
+                if self.last_finish_reason:
+                    break
+                if resume >= self.policy.max_resumes:
+                    raise StreamInterruptedError("流式响应在结束前中断")
+            self.last_resumes += 1
+            time.sleep(self.policy.backoff(resume))
+            resume += 1
+        
+        if early_stop is not None:
+            tail = early_stop.flush()
+            if tail:
+                yield tail
+    
+    def _record_early_stop(self, text: str, params: Dict):
+        """
+        记录提前结束：结果视为完整，并估算节省的输出 token 数（提前关闭的流没有用量信息）
+        
+        Args:
+            text (str): 已输出的文本
+            params (dict): 请求参数
+        """
+        estimator = self.assembler.estimator if self.assembler is not None else TokenEstimator()
+        received = estimator.count(text, self.last_model)
+        max_tokens = params.get("max_tokens")
+        self.last_finish_reason = "stop"
+        self.last_early_stop = {
+            "output_tokens": received,
+            "saved_tokens": max(max_tokens - received, 0) if max_tokens else None
+        }
+    
+    def _consume_chunk(self, chunk, echo_filter: EchoedPrefixFilter) -> str:
+        """
+        处理一个流式片段：记录用量和结束原因，返回新增的文本
+        
+        Args:
+            chunk: SDK 返回的 CompletionChunk
+            echo_filter (EchoedPrefixFilter): 续传时过滤重复输出的前缀
+            
+        Returns:
+            str: 新增的文本（可能为空字符串）
+        """
+        if chunk.usage:
+            self._add_usage(self._usage_to_dict(chunk.usage))
+        if not chunk.choices:
+            return ""
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.last_finish_reason = choice.finish_reason
+        if choice.delta and isinstance(choice.delta.content, str) and choice.delta.content:
+            return echo_filter.feed(choice.delta.content)
+        return ""
+    
+    @staticmethod
+    def _is_first_token(chunk) -> bool:
+        """片段是否包含首个 token（或已经结束）"""
+        choice = chunk.choices[0] if chunk.choices else None
+        return bool(choice and (choice.finish_reason or (choice.delta and choice.delta.content)))
+    
+    def _add_usage(self, usage: Optional[Dict[str, int]]):
+        """累加 token 用量（续传时每个请求分别计费）"""
+        if usage is None:
+            return
+        if self.last_usage is None:
+            self.last_usage = usage
+        else:
+            self.last_usage = {key: self.last_usage.get(key, 0) + value for key, value in usage.items()}
+    
+    def _open_stream(self, messages: List[Dict], model: str, params: Dict, timeout: float):
+        """
+        发起流式请求并读取到首个 token 为止
+        
+        Args:
+            messages (list): 消息列表
+            model (str): 模型名称（端点配置了模型时使用端点的模型）
+            params (dict): 采样参数
+            timeout (float): 超时时间（秒），同时作为读取间隔的超时
+            
+        Returns:
+            tuple: (EventStream, 已读取的片段列表, 剩余事件的迭代器)
+        """
+        return self._call_backend(
+            "stream",
+            lambda backend, t: self._read_first_token(
+                backend.stream(backend.model or model, messages, self._sampling_args(params), t)),
+            timeout
+        )
+    
+    def _read_first_token(self, stream):
+        """读取流直到首个 token，返回 (流, 已读取的片段列表, 剩余事件的迭代器)"""
+        events = iter(stream)
+        head = []
+        try:
+            for event in events:
+                head.append(event.data)
+                if self._is_first_token(event.data):
+                    break
+        except BaseException:
+            stream.response.close()
+            raise
+        return stream, head, events
+    
+    def _prepare_request(self, user_input: str, context: Optional[Dict], kwargs: Dict):
+        """
+        构建请求的消息列表和采样参数
+        
+        Args:
+            user_input (str): 用户输入的文本
+            context (dict): 上下文信息
+            kwargs (dict): 调用方传入的参数
+            
+        Returns:
+            tuple: (消息列表, 参数字典)
+        """
         # 构建消息历史
         messages = self._build_messages_from_context(context or {})
         
         # 添加用户的新消息
         messages.append({"role": "user", "content": user_input})
         
+        # 按当前模式的 token 预算裁剪
+        if self.assembler is not None:
+            mode = (context or {}).get('mode', 'conversation')
+            messages = self.assembler.assemble(messages, mode, kwargs.get("model") or self.model)
+            self._prompt_estimate = self.assembler.last_stats["tokens"]
+        
         # 构建 API 参数
         params = {**self.default_params, **kwargs}
+        return messages, params
+    
+    @property
+    def last_max_tokens(self) -> Optional[Dict]:
+        """最近一次请求的类型和自适应的 max_tokens（含截断后的扩大），未启用时为 None"""
+        if self._usage_key is None:
+            return None
+        return {"key": self._usage_key, "max_tokens": self._max_tokens_budget}
+    
+    def _adapt_max_tokens(self, params: Dict, context: Optional[Dict]) -> Dict:
+        """
+        按该类请求的历史用量设定 max_tokens（在缓存查找之后调用，不影响缓存键）
         
-        # 调用 Mistral API 流式接口
-        stream = self.client.chat_stream(
-            model=self.model,
-            messages=messages,
-            temperature=params.get('temperature'),
-            max_tokens=params.get('max_tokens'),
-            top_p=params.get('top_p')
-        )
+        Args:
+            params (dict): 请求参数
+            context (dict): 上下文信息，其中的模式和操作决定请求类型
+            
+        Returns:
+            dict: 调整后的请求参数
+        """
+        self._usage_key = None
+        if self.max_tokens_policy is None or not params.get("max_tokens"):
+            return params
+        self._usage_key = self.max_tokens_policy.key(context)
+        self._max_tokens_budget = self.max_tokens_policy.limit(self._usage_key, params["max_tokens"])
+        return {**params, "max_tokens": self._max_tokens_budget}
+    
+    def _extend_max_tokens(self, params: Dict) -> Optional[Dict]:
+        """
+        回复因达到 max_tokens 被截断时扩大预算
         
-        # 返回流式响应生成器
-        for chunk in stream:
-            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content is not None:
-                yield chunk.choices[0].delta.content
+        Returns:
+            dict: 续传请求的参数（max_tokens 为新增的预算），不需要或无法续传时返回 None
+        """
+        if self.last_finish_reason != "length" or self._usage_key is None:
+            return None
+        budget = self.max_tokens_policy.expand(self._max_tokens_budget)
+        if budget is None:
+            return None
+        extra = budget - self._max_tokens_budget
+        self._max_tokens_budget = budget
+        self.last_length_retries += 1
+        return {**params, "max_tokens": extra}
+    
+    def _record_completion(self):
+        """记录完整回复的输出 token 数，用于调整该类请求的 max_tokens"""
+        if self._usage_key is None or self.last_finish_reason != "stop" or self.last_early_stop or not self.last_usage:
+            return
+        self.max_tokens_policy.record(self._usage_key, self.last_usage["completion_tokens"])
+    
+    def _rate_tokens(self, messages: List, params: Dict, model: str) -> int:
+        """
+        限流时每次请求预扣的 token 数：估算的输入 token 数加上 max_tokens，请求结束后按实际用量修正
+        
+        Args:
+            messages (list): 消息列表（字典或 SDK 消息对象）
+            params (dict): 采样参数
+            model (str): 模型名称
+            
+        Returns:
+            int: 预扣的 token 数，未启用限流时为 0
+        """
+        if self.policy.rate_limiter is None:
+            return 0
+        estimator = self.assembler.estimator if self.assembler is not None else TokenEstimator()
+        contents = [m.get("content") if isinstance(m, dict) else getattr(m, "content", "") for m in messages]
+        tokens = sum(estimator.count(str(c or ""), model) for c in contents) + (params.get("max_tokens") or 0)
+        self._rate_charged += tokens
+        return tokens
+    
+    def _settle_rate_limit(self):
+        """按 API 返回的实际 token 数退还（或补扣）限流器中预扣的 token"""
+        if self.policy.rate_limiter is not None and self._rate_charged and self.last_usage:
+            self.policy.rate_limiter.settle(self._rate_charged, self.last_usage.get("total_tokens", 0))
+        self._rate_charged = 0
+    
+    def _calibrate_estimator(self):
+        """用 API 返回的 prompt_tokens 校准 token 估算器（续传请求的提示包含前缀，不参与校准）"""
+        if self.assembler is None or not self.last_usage or self.last_resumes or self.last_length_retries:
+            return
+        self.assembler.estimator.calibrate(self.last_model, self._prompt_estimate, self.last_usage["prompt_tokens"])
+    
+    @staticmethod
+    def _sampling_args(params: Dict) -> Dict:
+        """取出要发送的采样参数，未设置的参数不发送，使用服务端默认值"""
+        return {name: params[name] for name in SAMPLING_PARAMS if params.get(name) is not None}
+    
+    def _flight_key(self, messages: List[Dict], params: Dict, model: str) -> Optional[str]:
+        """跨进程合并使用的请求键（包含历史对话，只合并完全相同的请求），未启用合并时返回 None"""
+        if self.single_flight is None:
+            return None
+        sampling = {name: params.get(name) for name in SAMPLING_PARAMS}
+        return ResponseCache.make_key(model, messages, sampling)
+    
+    def _follow_flight(self, key: str, skip: int = 0) -> Generator[str, None, None]:
+        """跟随其他进程的相同请求，结束后记录结束原因（没有调用 API，不计 token 用量）"""
+        self.last_coalesced = True
+        self.last_usage = None
+        self.last_finish_reason = yield from self.single_flight.follow(key, skip)
+    
+    def _cache_key(self, messages: List[Dict[str, str]], params: Dict, model: Optional[str] = None) -> Optional[str]:
+        """
+        计算缓存键，未启用缓存时返回 None
+
+        键包含完整的消息列表（含历史对话）：“继续”“为什么？”这类追问的回答取决于历史，
+        只有历史也相同时才能复用
+        """
+        if self.cache is None:
+            return None
+        sampling = {name: params.get(name) for name in SAMPLING_PARAMS}
+        return self.cache.make_key(model or params.get("model") or self.model, messages, sampling)
+    
+    def _cache_lookup(self, cache_key: Optional[str]) -> Optional[Dict]:
+        """
+        查找缓存，命中时同时更新 last_usage 和 last_finish_reason
+        
+        Args:
+            cache_key (str): 缓存键
+            
+        Returns:
+            dict: 缓存条目，未命中、未启用或要求刷新时返回 None
+        """
+        if cache_key is None:
+            return None
+        if self.refresh_cache:
+            self.cache.misses += 1
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            # 命中缓存时没有产生 API 调用，不计 token 用量
+            self.last_usage = None
+            self.last_finish_reason = cached.get("finish_reason")
+        return cached
+    
+    def _cache_store(self, cache_key: Optional[str], content: str):
+        """只缓存完整的响应（被 max_tokens 截断的结果不缓存）"""
+        if cache_key is None or not content or self.last_finish_reason not in (None, "stop"):
+            return
+        self.cache.put(cache_key, content, self.last_usage, self.last_finish_reason)
+    
+    @staticmethod
+    def _usage_to_dict(usage) -> Optional[Dict[str, int]]:
+        """
+        将 SDK 的用量对象转换为字典
+        
+        Args:
+            usage: SDK 返回的 UsageInfo
+            
+        Returns:
+            dict: 包含 prompt_tokens、completion_tokens、total_tokens 的字典
+        """
+        if usage is None:
+            return None
+        return {
+            "prompt_tokens": usage.prompt_tokens or 0,
+            "completion_tokens": usage.completion_tokens or 0,
+            "total_tokens": usage.total_tokens or 0
+        }
     
     def _build_messages_from_context(self, context: Dict) -> List[Dict[str, str]]:
         """
@@ -120,14 +734,14 @@ class MistralClient:
                 "content": context.get('system_prompt')
             })
         
-        # 从历史记录中构建消息列表
+        # 从历史记录中构建消息列表：每条记录是一轮对话（用户输入和对应的回复）
         for entry in context.get('history', []):
             if 'user' in entry:
                 messages.append({
                     "role": "user",
                     "content": entry['user']
                 })
-            elif 'system' in entry:
+            if entry.get('system'):
                 messages.append({
                     "role": "assistant",
                     "content": entry['system']
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+自适应 max_tokens 模块
+按（模式, 操作）记录每次完整回复实际使用的输出 token 数，用其高分位数加上余量作为 max_tokens；
+回复因达到上限被截断时（finish_reason == "length"），按翻倍后的预算继续生成
+"""
+
+import os
+import json
+import math
+from typing import Dict, List, Optional
+
+USAGE_STATS_FILE = "~/.ai_terminal/usage_stats.json"
+# 每个（模式, 操作）保留的最近样本数，以及开始调整所需的最少样本数
+USAGE_SAMPLES = 100
+MIN_USAGE_SAMPLES = 10
+
+DEFAULT_PERCENTILE = 95
+DEFAULT_HEADROOM = 1.5
+DEFAULT_MIN_TOKENS = 64
+DEFAULT_CEILING = 4096
+
+
+class AdaptiveMaxTokens:
+    """根据历史输出 token 用量为每类请求设定 max_tokens"""
+
+    def __init__(self, path: str = USAGE_STATS_FILE, percentile: float = DEFAULT_PERCENTILE,
+                 headroom: float = DEFAULT_HEADROOM, min_tokens: int = DEFAULT_MIN_TOKENS,
+                 ceiling: int = DEFAULT_CEILING):
+        """
+        初始化
+
+        Args:
+            path (str): 用量样本文件路径
+            percentile (float): 使用的用量分位数 (0 - 100)
+            headroom (float): 在分位数基础上乘以的余量系数
+            min_tokens (int): max_tokens 的下限
+            ceiling (int): max_tokens 的上限（截断后扩大预算也不超过它）
+        """
+        self.path = os.path.expanduser(path)
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.ceiling = ceiling
+        self._samples: Optional[Dict[str, List[int]]] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional["AdaptiveMaxTokens"]:
+        """
+        根据配置中的 advanced 部分创建
+
+        Args:
+            config (dict): advanced 配置
+
+        Returns:
+            AdaptiveMaxTokens: 未启用 adaptive_max_tokens 时返回 None
+        """
+        config = config or {}
+        if not config.get('adaptive_max_tokens', True):
+            return None
+        return cls(
+            percentile=float(config.get('max_tokens_percentile', DEFAULT_PERCENTILE)),
+            headroom=float(config.get('max_tokens_headroom', DEFAULT_HEADROOM)),
+            ceiling=int(config.get('max_tokens_ceiling', DEFAULT_CEILING))
+        )
+
+    @staticmethod
+    def key(context: Optional[Dict]) -> str:
+        """请求类型：上下文中的模式和操作（如 command/explain）"""
+        context = context or {}
+        return f"{context.get('mode', 'conversation')}/{context.get('action', 'default')}"
+
+    @property
+    def samples(self) -> Dict[str, List[int]]:
+        """按请求类型分组的输出 token 用量，首次访问时从磁盘读取"""
+        if self._samples is None:
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                self._samples = {k: [int(x) for x in v] for k, v in data.items() if isinstance(v, list)}
+            except (OSError, ValueError, TypeError, AttributeError):
+                self._samples = {}
+        return self._samples
+
+    def limit(self, key: str, default: int) -> int:
+        """
+        计算请求类型的 max_tokens
+
+        Args:
+            key (str): 请求类型
+            default (int): 模式配置中的 max_tokens，样本不足时使用
+
+        Returns:
+            int: max_tokens，样本充足时为分位数乘以余量，限制在 [min_tokens, max(default, ceiling)] 之间
+        """
+        values = sorted(self.samples.get(key, []))
+        if len(values) < MIN_USAGE_SAMPLES:
+            return default
+        index = min(len(values) - 1, int(round(self.percentile / 100 * (len(values) - 1))))
+        limit = math.ceil(values[index] * self.headroom)
+        return min(max(limit, self.min_tokens), max(default, self.ceiling))
+
+    def expand(self, budget: int) -> Optional[int]:
+        """
+        回复被截断后扩大预算
+
+        Args:
+            budget (int): 当前的 max_tokens
+
+        Returns:
+            int: 翻倍后的预算（不超过 ceiling），已达到上限时返回 None
+        """
+        if budget >= self.ceiling:
+            return None
+        return min(budget * 2, self.ceiling)
+
+    def record(self, key: str, completion_tokens: int):
+        """
+        记录一次完整回复的输出 token 数并写回磁盘
+
+        Args:
+            key (str): 请求类型
+            completion_tokens (int): 输出 token 数
+        """
+        if not isinstance(completion_tokens, int) or completion_tokens <= 0:
+            return
+        values = self.samples.setdefault(key, [])
+        values.append(completion_tokens)
+        del values[:-USAGE_SAMPLES]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.samples, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
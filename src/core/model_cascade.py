@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+模型梯级模块
+简短的对话和命令请求先交给最便宜、最快的模型回答，本地检查不通过时
+（空回复、代码块为空或不完整、拒绝或含糊其辞、被截断）再升级到更大的模型
+"""
+
+import os
+import re
+import json
+from typing import Dict, List, Optional
+
+CASCADE_STATS_FILE = "~/.ai_terminal/cascade_stats.json"
+
+DEFAULT_RUNGS = ["ministral-8b-latest", "mistral-small-latest", "mistral-large-latest"]
+DEFAULT_MODES = ["conversation", "command"]
+DEFAULT_MAX_INPUT_CHARS = 200
+
+# 拒绝或含糊其辞的回答（只检查回答的开头部分）
+REFUSAL_PATTERNS = [
+    re.compile(r"^(很抱歉|抱歉|对不起)[，,。\s]*我(无法|不能|没有办法|不太清楚)"),
+    re.compile(r"我不(太)?(确定|清楚|知道)"),
+    re.compile(r"作为(一个)?\s*(AI|人工智能)"),
+    re.compile(r"\bI(?:'m| am) (?:sorry|not sure|unable)\b", re.IGNORECASE),
+    re.compile(r"\bI can(?:not|'t) (?:help|assist|provide)\b", re.IGNORECASE),
+    re.compile(r"\bAs an AI\b", re.IGNORECASE),
+]
+REFUSAL_SCAN_CHARS = 200
+
+_CODE_BLOCK = re.compile(r"```[^\n]*\n(.*?)```", re.DOTALL)
+
+
+class ModelCascade:
+    """按梯级选择模型，并统计各梯级的回答数和节省的延迟"""
+
+    def __init__(self, rungs: Optional[List[str]] = None, modes: Optional[List[str]] = None,
+                 max_input_chars: int = DEFAULT_MAX_INPUT_CHARS, path: str = CASCADE_STATS_FILE):
+        """
+        初始化模型梯级
+
+        Args:
+            rungs (list): 从低到高的模型列表
+            modes (list): 使用梯级的模式
+            max_input_chars (int): 输入不超过该长度的请求才使用梯级
+            path (str): 统计文件路径
+        """
+        self.rungs = list(rungs or DEFAULT_RUNGS)
+        self.modes = list(modes or DEFAULT_MODES)
+        self.max_input_chars = max_input_chars
+        self.path = os.path.expanduser(path)
+        self._stats: Optional[Dict] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional["ModelCascade"]:
+        """
+        根据配置中的 cascade 部分创建模型梯级
+
+        Args:
+            config (dict): cascade 配置
+
+        Returns:
+            ModelCascade: 未启用或梯级少于两级时返回 None
+        """
+        config = config or {}
+        if not config.get('enabled', False):
+            return None
+        rungs = config.get('rungs') or DEFAULT_RUNGS
+        if len(rungs) < 2:
+            return None
+        return cls(
+            rungs=rungs,
+            modes=config.get('modes') or DEFAULT_MODES,
+            max_input_chars=int(config.get('max_input_chars', DEFAULT_MAX_INPUT_CHARS))
+        )
+
+    def applies(self, mode: str, user_input: str) -> bool:
+        """请求是否使用梯级：指定模式下的简短请求"""
+        return mode in self.modes and len(user_input) <= self.max_input_chars
+
+    @staticmethod
+    def check(response: Optional[str], context: Optional[Dict] = None,
+              finish_reason: Optional[str] = None) -> Optional[str]:
+        """
+        本地检查回答是否可以接受
+
+        Args:
+            response (str): 回答
+            context (dict): 上下文（其中的 mode 和 action 决定是否要求代码块）
+            finish_reason (str): 结束原因
+
+        Returns:
+            str: 需要升级的原因（empty、truncated、refusal、malformed_code、empty_code、no_code），
+                可以接受时返回 None
+        """
+        context = context or {}
+        text = (response or "").strip()
+        if not text:
+            return "empty"
+        if finish_reason == "length":
+            return "truncated"
+        head = text[:REFUSAL_SCAN_CHARS]
+        if any(pattern.search(head) for pattern in REFUSAL_PATTERNS):
+            return "refusal"
+        if text.count("```") % 2:
+            return "malformed_code"
+        blocks = _CODE_BLOCK.findall(text)
+        if any(not block.strip() for block in blocks):
+            return "empty_code"
+        if context.get('mode') == "command" and context.get('action') == "generate" and not blocks and "`" not in text:
+            return "no_code"
+        return None
+
+    @property
+    def stats(self) -> Dict:
+        """各梯级的回答数、升级原因、平均延迟和累计节省的延迟，首次访问时从磁盘读取"""
+        if self._stats is None:
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                if not isinstance(data, dict):
+                    raise ValueError("invalid stats")
+                self._stats = data
+            except (OSError, ValueError):
+                self._stats = {}
+            for key in ("answered", "escalations", "latency"):
+                self._stats.setdefault(key, {})
+            self._stats.setdefault("saved_seconds", 0.0)
+        return self._stats
+
+    def record(self, model: str, attempts: List[Dict]) -> float:
+        """
+        记录一次梯级请求并写回磁盘
+
+        Args:
+            model (str): 最终给出回答的模型
+            attempts (list): 每一级的尝试 {"model", "seconds", "reason"}，reason 为升级原因（最后一级为 None）
+
+        Returns:
+            float: 与直接使用最高一级相比节省的延迟（秒），为负数时表示升级多花的时间；
+                尚无最高一级的延迟数据时为 0
+        """
+        stats = self.stats
+        stats["answered"][model] = stats["answered"].get(model, 0) + 1
+        for attempt in attempts:
+            if attempt.get("reason"):
+                stats["escalations"][attempt["reason"]] = stats["escalations"].get(attempt["reason"], 0) + 1
+            latency = stats["latency"].setdefault(attempt["model"], {"mean": 0.0, "count": 0})
+            latency["count"] += 1
+            latency["mean"] += (attempt["seconds"] - latency["mean"]) / latency["count"]
+
+        # 低级模型回答时与最高一级的平均延迟比较；升级到最高一级时，低级模型花费的时间计为损失
+        saved = 0.0
+        top = stats["latency"].get(self.rungs[-1])
+        if model != self.rungs[-1]:
+            if top:
+                saved = top["mean"] - sum(attempt["seconds"] for attempt in attempts)
+        else:
+            saved = -sum(attempt["seconds"] for attempt in attempts[:-1])
+        stats["saved_seconds"] += saved
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+        return saved
+
+    def summary(self) -> List[str]:
+        """
+        统计摘要
+
+        Returns:
+            list: 每行一项：各梯级的回答数、升级原因和累计节省的延迟
+        """
+        stats = self.stats
+        lines = [f"{model}: 回答 {stats['answered'].get(model, 0)} 次" for model in self.rungs]
+        if stats["escalations"]:
+            reasons = ", ".join(f"{reason} {count}" for reason, count in sorted(stats["escalations"].items()))
+            lines.append(f"升级原因: {reasons}")
+        lines.append(f"累计节省延迟（扣除升级损失）: {stats['saved_seconds']:.1f}s")
+        return lines
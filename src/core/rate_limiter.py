@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+客户端限流模块
+本机所有 ai 和 cmd_ai.py 进程共享两个令牌桶：每分钟请求数（RPM）和每分钟估算 token 数（TPM），
+状态保存在加了文件锁的状态文件中；收到 429 时按 AIMD 调整速率（减半，成功后逐步加回），
+并遵守 Retry-After；交互式请求优先于后台（批量）请求
+"""
+
+import os
+import json
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只在进程内加锁
+    fcntl = None
+
+RATE_LIMIT_FILE = "~/.ai_terminal/rate_limit.json"
+
+DEFAULT_RPM = 60
+DEFAULT_TPM = 500000
+# 为交互式请求保留的容量比例：后台请求不会把令牌桶用到这个水位以下
+DEFAULT_RESERVE = 0.2
+# AIMD：收到 429 时速率乘以 DECREASE_FACTOR（不低于 MIN_RATE），每次成功加回 INCREASE_STEP
+DECREASE_FACTOR = 0.5
+INCREASE_STEP = 0.05
+MIN_RATE = 0.05
+# 同一批并发请求收到的多个 429 只减速一次
+DECREASE_COOLDOWN = 2.0
+# 等待期间重新检查共享状态的最长间隔（秒）
+MAX_POLL = 0.5
+
+PRIORITIES = ("interactive", "background")
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    从错误响应的 Retry-After 头中取出需要等待的秒数
+
+    Args:
+        error (BaseException): 请求抛出的异常（SDK 的错误带有 raw_response，后端错误带有 headers）
+
+    Returns:
+        float: 等待秒数，没有或无法解析时返回 None
+    """
+    headers = getattr(error, 'headers', None)
+    if headers is None:
+        headers = getattr(getattr(error, 'raw_response', None), 'headers', None)
+    if not headers:
+        return None
+    value = next((v for k, v in headers.items() if k.lower() == "retry-after"), None)
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """跨进程共享的 RPM/TPM 令牌桶"""
+
+    def __init__(self, rpm: int = DEFAULT_RPM, tpm: int = DEFAULT_TPM, reserve: float = DEFAULT_RESERVE,
+                 path: str = RATE_LIMIT_FILE, priority: str = "interactive"):
+        """
+        初始化
+
+        Args:
+            rpm (int): 每分钟请求数上限
+            tpm (int): 每分钟 token 数上限
+            reserve (float): 为交互式请求保留的容量比例 (0.0 - 1.0)
+            path (str): 共享状态文件路径
+            priority (str): 本进程请求的优先级（interactive 或 background）
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的优先级: {priority}（可选: {', '.join(PRIORITIES)}）")
+        self.limits = {"requests": float(rpm), "tokens": float(tpm)}
+        self.reserve = reserve
+        self.path = os.path.expanduser(path)
+        self.priority = priority
+        self._lock = threading.Lock()
+        # 最近一次请求在限流中等待的时长（秒）
+        self.last_wait = 0.0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional["RateLimiter"]:
+        """
+        根据配置中的 rate_limit 部分创建
+
+        Args:
+            config (dict): rate_limit 配置
+
+        Returns:
+            RateLimiter: 未启用时返回 None
+        """
+        config = config or {}
+        if not config.get('enabled', True):
+            return None
+        return cls(
+            rpm=int(config.get('rpm', DEFAULT_RPM)),
+            tpm=int(config.get('tpm', DEFAULT_TPM)),
+            reserve=float(config.get('reserve', DEFAULT_RESERVE))
+        )
+
+    def acquire(self, tokens: int = 0, timeout: Optional[float] = None) -> float:
+        """
+        等待直到可以发出一个请求，并扣除一个请求和 tokens 个 token
+
+        Args:
+            tokens (int): 本次请求估算的 token 数（输入加最大输出）
+            timeout (float): 最长等待时间（秒），为 None 时一直等待
+
+        Returns:
+            float: 等待的时长（秒）
+
+        Raises:
+            TimeoutError: 超过 timeout 仍无法发出请求
+        """
+        start = time.monotonic()
+        while True:
+            wait = self._try_acquire(tokens)
+            waited = time.monotonic() - start
+            if wait <= 0:
+                self.last_wait = waited
+                return waited
+            if timeout is not None and waited + wait > timeout:
+                raise TimeoutError(f"限流等待超过 {timeout:g} 秒")
+            time.sleep(min(wait, MAX_POLL))
+
+    async def acquire_async(self, tokens: int = 0, timeout: Optional[float] = None) -> float:
+        """acquire 的异步版本"""
+        # asyncio 只在异步客户端中用到，不在入口路径上导入
+        import asyncio
+
+        start = time.monotonic()
+        while True:
+            wait = self._try_acquire(tokens)
+            waited = time.monotonic() - start
+            if wait <= 0:
+                self.last_wait = waited
+                return waited
+            if timeout is not None and waited + wait > timeout:
+                raise TimeoutError(f"限流等待超过 {timeout:g} 秒")
+            await asyncio.sleep(min(wait, MAX_POLL))
+
+    def settle(self, charged: int, actual: int):
+        """
+        请求结束后按实际用量修正 token 桶（预扣的最大输出通常远多于实际输出）
+
+        Args:
+            charged (int): acquire 时扣除的 token 数
+            actual (int): API 返回的实际 token 数
+        """
+        if charged == actual:
+            return
+        with self._state() as state:
+            bucket = state["buckets"]["tokens"]
+            bucket["level"] = min(bucket["level"] + charged - actual, self._capacity(state, "tokens"))
+
+    def throttle(self, delay: Optional[float] = None):
+        """
+        收到 429：速率减半，有 Retry-After 时所有进程在此之前都不发出请求
+
+        Args:
+            delay (float): Retry-After 的秒数
+        """
+        now = time.time()
+        with self._state() as state:
+            if now - state["decreased"] >= DECREASE_COOLDOWN:
+                state["rate"] = max(state["rate"] * DECREASE_FACTOR, MIN_RATE)
+                state["decreased"] = now
+                for name in self.limits:
+                    bucket = state["buckets"][name]
+                    bucket["level"] = min(bucket["level"], self._capacity(state, name))
+            if delay:
+                state["blocked_until"] = max(state["blocked_until"], now + delay)
+
+    def succeeded(self):
+        """请求成功：速率加回一步"""
+        with self._state() as state:
+            if state["rate"] < 1.0:
+                state["rate"] = min(state["rate"] + INCREASE_STEP, 1.0)
+
+    @property
+    def rate(self) -> float:
+        """当前速率占配置上限的比例"""
+        with self._state() as state:
+            return state["rate"]
+
+    def _capacity(self, state: Dict, name: str) -> float:
+        return self.limits[name] * state["rate"]
+
+    def _try_acquire(self, tokens: int) -> float:
+        """尝试扣除令牌，成功返回 0，否则返回建议的等待时间（秒）"""
+        now = time.time()
+        with self._state() as state:
+            if state["blocked_until"] > now:
+                return state["blocked_until"] - now
+            # 有交互式请求在等待时，后台请求让出令牌
+            if self.priority != "interactive" and state["interactive_until"] > now:
+                return MAX_POLL
+            floor = 0.0 if self.priority == "interactive" else self.reserve
+            costs = {"requests": 1.0, "tokens": float(tokens)}
+            wait = 0.0
+            for name, cost in costs.items():
+                capacity = self._capacity(state, name)
+                # 超过容量的单个请求按满容量计，避免永远等待
+                needed = min(min(cost, capacity) + floor * capacity, capacity)
+                level = state["buckets"][name]["level"]
+                if level < needed:
+                    wait = max(wait, (needed - level) / (capacity / 60))
+            if wait > 0:
+                if self.priority == "interactive":
+                    state["interactive_until"] = max(state["interactive_until"], now + min(wait, MAX_POLL) * 2)
+                return wait
+            for name, cost in costs.items():
+                state["buckets"][name]["level"] -= min(cost, self._capacity(state, name))
+            return 0.0
+
+    def _state(self):
+        return _SharedState(self)
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+            if not isinstance(state, dict) or not isinstance(state.get("buckets"), dict):
+                raise ValueError("invalid state")
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault("rate", 1.0)
+        state.setdefault("decreased", 0.0)
+        state.setdefault("blocked_until", 0.0)
+        state.setdefault("interactive_until", 0.0)
+        buckets = state.setdefault("buckets", {})
+        now = time.time()
+        for name in self.limits:
+            capacity = self._capacity(state, name)
+            bucket = buckets.get(name)
+            if not isinstance(bucket, dict):
+                bucket = buckets[name] = {"level": capacity, "updated": now}
+            # 按经过的时间补充令牌
+            elapsed = max(now - bucket["updated"], 0.0)
+            bucket["level"] = min(bucket["level"] + elapsed * capacity / 60, capacity)
+            bucket["updated"] = now
+        return state
+
+    def _save(self, state: Dict):
+        try:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+class _SharedState:
+    """在文件锁内读取、修改并写回共享状态"""
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+        self._lock_file = None
+
+    def __enter__(self) -> Dict:
+        self.limiter._lock.acquire()
+        try:
+            os.makedirs(os.path.dirname(self.limiter.path), exist_ok=True)
+            if fcntl is not None:
+                self._lock_file = open(f"{self.limiter.path}.lock", 'a')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        except OSError:
+            self._lock_file = None
+        self.state = self.limiter._load()
+        return self.state
+
+    def __exit__(self, *exc):
+        try:
+            self.limiter._save(self.state)
+        finally:
+            if self._lock_file is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                self._lock_file.close()
+            self.limiter._lock.release()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+预热上下文快照模块
+由 zsh 的 precmd 钩子在后台生成紧凑的二进制快照，包含各模式的 Mistral 上下文、
+过滤后的环境变量和系统版本信息；`ai` 调用时直接内存映射读取，不必在关键路径上重新计算。
+每个终端会话使用各自的快照文件（历史按会话区分，多个窗格不会互相覆盖）
+"""
+
+import os
+import mmap
+import fcntl
+import marshal
+import hashlib
+
+from src.core.context_manager import ContextManager, current_session
+from src.utils.system_info import get_system_versions
+
+READY_CONTEXT_FILE = "~/.ai_terminal/ready_context.bin"
+
+# 文件头：魔数 + 格式版本
+MAGIC = b"AIRC"
+FORMAT_VERSION = 2
+HEADER = MAGIC + FORMAT_VERSION.to_bytes(4, "little")
+
+MODES = ("conversation", "command", "document")
+
+
+def collect_env_vars():
+    """
+    收集需要写入上下文的环境变量
+
+    Returns:
+        dict: 过滤后的环境变量
+    """
+    return {k: v for k, v in os.environ.items() if k.startswith('PATH') or k in ['HOME', 'USER', 'SHELL']}
+
+
+def ready_context_path():
+    """
+    获取当前终端会话的快照文件路径
+
+    Returns:
+        str: 没有会话标识时为 READY_CONTEXT_FILE，否则在文件名中加入会话标识的摘要
+    """
+    session = current_session()
+    if not session:
+        return os.path.expanduser(READY_CONTEXT_FILE)
+    digest = hashlib.sha256(session.encode("utf-8", "surrogateescape")).hexdigest()[:16]
+    return os.path.expanduser(READY_CONTEXT_FILE.replace(".bin", f".{digest}.bin"))
+
+
+def snapshot_key(cwd, config_path):
+    """
+    计算快照的有效性键：工作目录、上下文存储、配置文件和环境变量任一变化都会使快照失效
+
+    Args:
+        cwd (str): 当前工作目录
+        config_path (str): 配置文件路径
+
+    Returns:
+        tuple: 有效性键
+    """
+    try:
+        stat = os.stat(config_path)
+        config_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    except OSError:
+        config_key = None
+
+    env_hash = hashlib.sha256(repr(sorted(collect_env_vars().items())).encode("utf-8", "surrogateescape")).hexdigest()
+    return (cwd, ContextManager.storage_signature(), config_key, env_hash)
+
+
+def refresh_ready_context(config_path, terminal=None):
+    """
+    生成预热上下文快照（已有的快照仍然有效时跳过）
+
+    同一时间只有一个刷新进程会执行，其他进程直接返回。
+
+    Args:
+        config_path (str): 配置文件路径
+        terminal (dict): terminal 配置（历史条数、上下文存储和历史范围）
+
+    Returns:
+        bool: 是否写入了新快照
+    """
+    path = ready_context_path()
+    cwd = os.getcwd()
+    if load_ready_context(config_path, cwd) is not None:
+        return False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+
+        # 先计算键再读取数据：读取期间发生的修改会让快照在下次检查时失效
+        key = snapshot_key(cwd, config_path)
+        context_manager = ContextManager.from_config(terminal)
+        context_manager.update_environment(env_vars=collect_env_vars(), cwd=cwd)
+        snapshot = {
+            "key": key,
+            "env_vars": collect_env_vars(),
+            "system_versions": get_system_versions(),
+            "contexts": {mode: context_manager.build_context_for_mistral(mode) for mode in MODES}
+        }
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER)
+            marshal.dump(snapshot, f)
+        os.replace(tmp_path, path)
+    return True
+
+
+def load_ready_context(config_path, cwd=None):
+    """
+    内存映射读取预热上下文快照
+
+    Args:
+        config_path (str): 配置文件路径
+        cwd (str): 当前工作目录，默认为 os.getcwd()
+
+    Returns:
+        dict: 快照内容，不存在、已损坏或已过期时返回 None
+    """
+    path = ready_context_path()
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(HEADER)] != HEADER:
+                return None
+            with memoryview(mm) as view:
+                snapshot = marshal.loads(view[len(HEADER):])
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get("key") != snapshot_key(cwd or os.getcwd(), config_path):
+        return None
+    return snapshot
+
+
+class PrewarmedContextManager:
+    """基于快照的上下文管理器
+
+    build_context_for_mistral 直接返回快照中的上下文；其余操作（更新、保存、文档上下文等）
+    转交给后台加载的 ContextManager，首次用到时才等待其加载完成。
+    """
+
+    def __init__(self, snapshot, loader):
+        """
+        初始化
+
+        Args:
+            snapshot (dict): 预热上下文快照
+            loader (callable): 返回完整 ContextManager 的函数
+        """
+        self._snapshot = snapshot
+        self._loader = loader
+
+    def build_context_for_mistral(self, mode="conversation"):
+        """
+        为 Mistral API 构建上下文
+
+        Args:
+            mode (str): 操作模式（对话、命令、文档）
+
+        Returns:
+            dict: 包含上下文信息的字典（副本，调用方可以修改）
+        """
+        context = self._snapshot["contexts"].get(mode)
+        if context is None:
+            return self._loader().build_context_for_mistral(mode)
+        return marshal.loads(marshal.dumps(context))
+
+    def __getattr__(self, name):
+        return getattr(self._loader(), name)
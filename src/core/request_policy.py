@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+请求策略模块
+为 API 调用提供超时、带抖动的指数退避重试和对冲请求（hedged request）：
+首个请求在近期延迟的某个分位数内还没有响应时，再发出一个相同的请求，采用先返回的结果
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import inspect
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from src.core.rate_limiter import retry_after
+
+DEFAULT_REQUEST_TIMEOUT = 30
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_DELAY = 2
+DEFAULT_MAX_RETRY_DELAY = 30
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_MAX_RESUMES = 3
+
+LATENCY_FILE = "~/.ai_terminal/latency.json"
+# 每类请求保留的最近延迟样本数，以及启用对冲所需的最少样本数
+LATENCY_SAMPLES = 50
+MIN_HEDGE_SAMPLES = 5
+
+# 可重试的 HTTP 状态码：限流和服务端临时错误
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class RequestTimeoutError(TimeoutError):
+    """请求在截止时间内没有完成"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    判断错误是否可以重试
+
+    Args:
+        error (BaseException): 请求抛出的异常
+
+    Returns:
+        bool: 超时、连接错误和 RETRYABLE_STATUS_CODES 中的状态码可以重试
+    """
+    if isinstance(error, TimeoutError):
+        return True
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(error, httpx.TransportError)
+
+
+class LatencyTracker:
+    """记录近期请求延迟（跨进程持久化），用于计算对冲请求的触发时间"""
+
+    def __init__(self, path: str = LATENCY_FILE):
+        """
+        初始化延迟记录
+
+        Args:
+            path (str): 延迟样本文件路径
+        """
+        self.path = os.path.expanduser(path)
+        self._samples: Optional[Dict[str, List[float]]] = None
+
+    @property
+    def samples(self) -> Dict[str, List[float]]:
+        """按请求类型分组的延迟样本（秒），首次访问时从磁盘读取"""
+        if self._samples is None:
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                self._samples = {k: [float(x) for x in v] for k, v in data.items() if isinstance(v, list)}
+            except (OSError, ValueError, TypeError, AttributeError):
+                self._samples = {}
+        return self._samples
+
+    def record(self, kind: str, seconds: float):
+        """
+        记录一次延迟并写回磁盘
+
+        Args:
+            kind (str): 请求类型（complete 为完整响应耗时，stream 为首个 token 耗时）
+            seconds (float): 延迟（秒）
+        """
+        values = self.samples.setdefault(kind, [])
+        values.append(round(seconds, 4))
+        del values[:-LATENCY_SAMPLES]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.samples, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def percentile(self, kind: str, percentile: float) -> Optional[float]:
+        """
+        计算延迟分位数
+
+        Args:
+            kind (str): 请求类型
+            percentile (float): 分位数 (0 - 100)
+
+        Returns:
+            float: 延迟分位数（秒），样本不足时返回 None
+        """
+        values = sorted(self.samples.get(kind, []))
+        if len(values) < MIN_HEDGE_SAMPLES:
+            return None
+        index = min(len(values) - 1, int(round(percentile / 100 * (len(values) - 1))))
+        return values[index]
+
+
+class RequestPolicy:
+    """API 请求的超时、重试和对冲策略"""
+
+    def __init__(self, timeout: float = DEFAULT_REQUEST_TIMEOUT, max_retries: int = DEFAULT_MAX_RETRIES,
+                 retry_delay: float = DEFAULT_RETRY_DELAY, max_retry_delay: float = DEFAULT_MAX_RETRY_DELAY,
+                 hedge: bool = False, hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE,
+                 max_resumes: int = DEFAULT_MAX_RESUMES, latency: Optional[LatencyTracker] = None):
+        """
+        初始化请求策略
+
+        Args:
+            timeout (float): 单次请求的超时时间（秒）
+            max_retries (int): 可重试错误的最大重试次数
+            retry_delay (float): 首次重试的基础延迟（秒），之后每次翻倍
+            max_retry_delay (float): 单次重试延迟的上限（秒）
+            hedge (bool): 是否启用对冲请求
+            hedge_percentile (float): 触发对冲请求的近期延迟分位数 (0 - 100)
+            max_resumes (int): 流式响应中途断开后的最大续传次数
+            latency (LatencyTracker): 延迟记录，默认使用 LATENCY_FILE
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.max_resumes = max_resumes
+        self.latency = latency or LatencyTracker()
+        # 本机进程共享的限流器（RateLimiter），每次尝试前等待令牌；为 None 时不限流
+        self.rate_limiter = None
+        # 最近一次调用在限流中等待的总时长（秒）
+        self.last_rate_wait = 0.0
+        # 最近一次调用的统计：尝试次数、是否发出了对冲请求、对冲请求是否胜出
+        self.last_stats = {"attempts": 0, "hedged": False, "hedge_won": False}
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> "RequestPolicy":
+        """
+        根据配置中的 advanced 部分创建请求策略
+
+        Args:
+            config (dict): advanced 配置
+
+        Returns:
+            RequestPolicy: 请求策略
+        """
+        config = config or {}
+        return cls(
+            timeout=float(config.get('request_timeout', DEFAULT_REQUEST_TIMEOUT)),
+            max_retries=int(config.get('max_retries', DEFAULT_MAX_RETRIES)),
+            retry_delay=float(config.get('retry_delay', DEFAULT_RETRY_DELAY)),
+            max_retry_delay=float(config.get('max_retry_delay', DEFAULT_MAX_RETRY_DELAY)),
+            hedge=bool(config.get('hedge_requests', False)),
+            hedge_percentile=float(config.get('hedge_percentile', DEFAULT_HEDGE_PERCENTILE)),
+            max_resumes=int(config.get('max_stream_resumes', DEFAULT_MAX_RESUMES))
+        )
+
+    def backoff(self, retry: int) -> float:
+        """
+        计算第 retry 次重试前的等待时间（full jitter）
+
+        Args:
+            retry (int): 重试序号，从 0 开始
+
+        Returns:
+            float: 等待时间（秒）
+        """
+        return random.uniform(0, min(self.max_retry_delay, self.retry_delay * (2 ** retry)))
+
+    def call(self, attempt: Callable[[float], object], kind: str = "complete",
+             discard: Optional[Callable[[object], None]] = None, tokens: int = 0):
+        """
+        按策略执行请求：超时或可重试错误时退避重试，启用对冲时并发发出备用请求
+
+        Args:
+            attempt (callable): 执行一次请求的函数，参数为本次请求的超时时间（秒），
+                返回结果即视为请求已响应（流式请求应在收到首个 token 后返回）
+            kind (str): 请求类型，用于分别记录延迟
+            discard (callable): 释放未被采用的结果（如关闭对冲中落败的流）
+            tokens (int): 每次尝试从限流器扣除的估算 token 数
+
+        Returns:
+            object: 先完成的请求的结果
+
+        Raises:
+            Exception: 不可重试的错误，或重试次数用尽后的最后一个错误
+        """
+        self.last_stats = {"attempts": 0, "hedged": False, "hedge_won": False}
+        self.last_rate_wait = 0.0
+        for retry in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.last_rate_wait += self.rate_limiter.acquire(tokens)
+            try:
+                value = self._race(attempt, kind, discard)
+            except Exception as e:
+                throttled = self._throttled(e)
+                if retry >= self.max_retries or not is_retryable(e):
+                    raise
+                if throttled:
+                    # 限流器已记下 Retry-After 并降低速率，下一次尝试前在 acquire 中等待
+                    continue
+            else:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.succeeded()
+                return value
+            time.sleep(self.backoff(retry))
+
+    def _throttled(self, error: BaseException) -> bool:
+        """收到 429 时通知限流器，返回是否已由限流器接管等待"""
+        if self.rate_limiter is None or getattr(error, 'status_code', None) != 429:
+            return False
+        self.rate_limiter.throttle(retry_after(error))
+        return True
+
+    def _race(self, attempt, kind, discard):
+        """发出请求，超过对冲延迟仍未响应时再发出一个相同的请求，返回先成功的结果"""
+        results = queue.Queue()
+        state = {"winner": None}
+        lock = threading.Lock()
+
+        def run(index):
+            start = time.perf_counter()
+            try:
+                value = attempt(self.timeout)
+            except BaseException as e:
+                results.put((index, False, e))
+                return
+            with lock:
+                won = state["winner"] is None
+                if won:
+                    state["winner"] = index
+            if won:
+                # 只在启用对冲时记录延迟，未启用时不产生额外的磁盘写入
+                if self.hedge:
+                    self.latency.record(kind, time.perf_counter() - start)
+                results.put((index, True, value))
+            elif discard:
+                discard(value)
+
+        def launch(index):
+            self.last_stats["attempts"] += 1
+            threading.Thread(target=run, args=(index,), daemon=True).start()
+
+        hedge_delay = self.latency.percentile(kind, self.hedge_percentile) if self.hedge else None
+        deadline = time.monotonic() + self.timeout
+        launch(0)
+        pending = 1
+        hedged = False
+        error = None
+
+        while pending:
+            wait = deadline - time.monotonic()
+            if hedge_delay is not None and not hedged:
+                wait = min(wait, hedge_delay)
+            try:
+                index, ok, value = results.get(timeout=max(wait, 0))
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    break
+                # 首个请求超过近期延迟分位数仍未响应，发出对冲请求
+                hedged = self.last_stats["hedged"] = True
+                launch(1)
+                pending += 1
+                continue
+
+            pending -= 1
+            if ok:
+                self.last_stats["hedge_won"] = index == 1
+                return value
+            error = value
+
+        with lock:
+            # 截止时间已过：之后才完成的请求结果直接丢弃
+            if state["winner"] is None:
+                state["winner"] = -1
+        if error is not None and not pending:
+            raise error
+        raise RequestTimeoutError(f"请求超时（{self.timeout:g} 秒）")
+
+    async def call_async(self, attempt: Callable[[float], Awaitable], kind: str = "complete",
+                         discard: Optional[Callable[[object], object]] = None, tokens: int = 0):
+        """
+        call 的异步版本：attempt 为协程函数，对冲中落败或超时的请求直接取消
+
+        Args:
+            attempt (callable): 执行一次请求的协程函数，参数为本次请求的超时时间（秒）
+            kind (str): 请求类型，用于分别记录延迟
+            discard (callable): 释放未被采用的结果，可以返回协程
+            tokens (int): 每次尝试从限流器扣除的估算 token 数
+
+        Returns:
+            object: 先完成的请求的结果
+        """
+        # asyncio 只在异步客户端中用到，不在入口路径上导入
+        import asyncio
+
+        self.last_stats = {"attempts": 0, "hedged": False, "hedge_won": False}
+        self.last_rate_wait = 0.0
+        for retry in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.last_rate_wait += await self.rate_limiter.acquire_async(tokens)
+            try:
+                value = await self._race_async(attempt, kind, discard)
+            except Exception as e:
+                throttled = self._throttled(e)
+                if retry >= self.max_retries or not is_retryable(e):
+                    raise
+                if throttled:
+                    continue
+            else:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.succeeded()
+                return value
+            await asyncio.sleep(self.backoff(retry))
+
+    async def _race_async(self, attempt, kind, discard):
+        """_race 的异步版本"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        hedge_delay = self.latency.percentile(kind, self.hedge_percentile) if self.hedge else None
+
+        async def timed():
+            start = time.perf_counter()
+            value = await attempt(self.timeout)
+            return value, time.perf_counter() - start
+
+        tasks = {}
+
+        def launch(index):
+            self.last_stats["attempts"] += 1
+            tasks[asyncio.ensure_future(timed())] = index
+
+        launch(0)
+        hedged = False
+        error = None
+        try:
+            while tasks:
+                wait = deadline - loop.time()
+                if wait <= 0:
+                    raise RequestTimeoutError(f"请求超时（{self.timeout:g} 秒）")
+                if hedge_delay is not None and not hedged:
+                    wait = min(wait, hedge_delay)
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if loop.time() < deadline:
+                        # 首个请求超过近期延迟分位数仍未响应，发出对冲请求
+                        hedged = self.last_stats["hedged"] = True
+                        launch(1)
+                    continue
+
+                winner = None
+                for task in done:
+                    index = tasks.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = (index, *task.result())
+                    elif discard:
+                        await _maybe_await(discard(task.result()[0]))
+                if winner is not None:
+                    index, value, elapsed = winner
+                    if self.hedge:
+                        self.latency.record(kind, elapsed)
+                    self.last_stats["hedge_won"] = index == 1
+                    return value
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # 所有请求都失败了
+        raise error
+
+
+async def _maybe_await(value):
+    if inspect.isawaitable(value):
+        await value
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+响应缓存模块
+按内容寻址的磁盘缓存：以模型、规范化后的消息列表和采样参数计算键，
+条目分片存放在缓存目录下，支持过期时间、总大小上限（按最近使用淘汰）和多进程并发写入
+"""
+
+import os
+import json
+import time
+import hashlib
+from typing import Dict, List, Optional
+
+DEFAULT_CACHE_DIR = "~/.ai_terminal/cache"
+DEFAULT_TTL = 86400
+DEFAULT_MAX_SIZE_MB = 50
+
+# 淘汰时清理到上限的该比例以下，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+
+class ResponseCache:
+    """LLM 响应的磁盘缓存"""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, ttl: int = DEFAULT_TTL,
+                 max_size: int = DEFAULT_MAX_SIZE_MB * 1024 * 1024):
+        """
+        初始化响应缓存
+
+        Args:
+            directory (str): 缓存目录
+            ttl (int): 条目过期时间（秒）
+            max_size (int): 缓存总大小上限（字节）
+        """
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional["ResponseCache"]:
+        """
+        根据配置中的 cache 部分创建缓存
+
+        Args:
+            config (dict): cache 配置
+
+        Returns:
+            ResponseCache: 缓存实例，未启用时返回 None
+        """
+        config = config or {}
+        if not config.get('enabled', False):
+            return None
+        return cls(
+            directory=config.get('directory') or DEFAULT_CACHE_DIR,
+            ttl=int(config.get('ttl', DEFAULT_TTL)),
+            max_size=int(float(config.get('max_size_mb', DEFAULT_MAX_SIZE_MB)) * 1024 * 1024)
+        )
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], params: Dict) -> str:
+        """
+        计算缓存键
+
+        消息内容统一换行符并去掉首尾空白，空白差异不会导致缓存未命中。
+
+        Args:
+            model (str): 模型名称
+            messages (list): 消息列表
+            params (dict): 采样参数
+
+        Returns:
+            str: 十六进制的 SHA-256 摘要
+        """
+        normalized = [
+            [message["role"], str(message["content"]).replace("\r\n", "\n").strip()]
+            for message in messages
+        ]
+        payload = json.dumps([model, normalized, sorted(params.items())], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key[2:] + ".json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        读取缓存条目
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            dict: 缓存的响应（content、usage、finish_reason），不存在或已过期时返回 None
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if not isinstance(entry, dict) or time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # 更新修改时间作为最近使用时间，供淘汰时参考
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, content: str, usage: Optional[Dict] = None, finish_reason: Optional[str] = None):
+        """
+        写入缓存条目（先写临时文件再原子替换，并发进程不会读到不完整的条目）
+
+        Args:
+            key (str): 缓存键
+            content (str): 响应文本
+            usage (dict): token 用量
+            finish_reason (str): 结束原因
+        """
+        path = self._path(key)
+        entry = {"created": time.time(), "content": content, "usage": usage, "finish_reason": finish_reason}
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        """删除过期条目；总大小超过上限时按最近使用时间从旧到新删除"""
+        entries = []
+        total = 0
+        now = time.time()
+        try:
+            shards = [entry.path for entry in os.scandir(self.directory) if entry.is_dir()]
+        except OSError:
+            return
+
+        for shard in shards:
+            try:
+                files = list(os.scandir(shard))
+            except OSError:
+                continue
+            for entry in files:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                # 过期条目（以及异常退出残留的临时文件）的最近使用时间一定早于 ttl 之前
+                if now - stat.st_mtime > self.ttl:
+                    self._remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total <= self.max_size:
+            return
+
+        target = self.max_size * EVICT_TARGET_RATIO
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+跨进程请求合并模块
+多个 ai 进程同时发出完全相同的请求时，第一个进程取得锁文件并把结果（流式片段）写入共享的
+spool 文件，其余进程跟随 spool 输出而不再调用 API；持锁进程崩溃后由等待的进程接手
+"""
+
+import os
+import json
+import time
+import socket
+from typing import Dict, Generator, Optional
+
+SINGLE_FLIGHT_DIR = "~/.ai_terminal/inflight"
+# 持锁进程超过该时长（秒）没有任何输出时视为失效（无法确认进程是否存活时，如其他主机上的进程）
+DEFAULT_STALE_SECONDS = 300
+# 跟随 spool 时的轮询间隔（秒）
+POLL_INTERVAL = 0.05
+# 锁文件的心跳间隔（秒）
+HEARTBEAT_INTERVAL = 1.0
+# 已结束的 spool 保留的时长（秒），供启动较晚的跟随者读完
+SPOOL_TTL = 600
+
+
+class LeaderLost(Exception):
+    """持锁进程崩溃、失效或请求失败，跟随者需要重新竞争锁"""
+
+
+class FlightLease:
+    """持锁进程的租约：把输出追加到 spool，结束后释放锁"""
+
+    def __init__(self, flight: "SingleFlight", key: str, spool_path: str):
+        self.flight = flight
+        self.key = key
+        self.spool_path = spool_path
+        self._spool = open(spool_path, 'a', encoding='utf-8')
+        self._beat = time.monotonic()
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+        else:
+            self.abort(f"{exc_type.__name__}: {exc}")
+
+    def write(self, text: str):
+        """追加一段输出"""
+        if text:
+            self._append({"t": text})
+
+    def finish(self, finish_reason: Optional[str] = None):
+        """写入结束记录并释放锁"""
+        if not self.closed:
+            self._append({"done": True, "finish_reason": finish_reason})
+            self._release()
+
+    def abort(self, error: str):
+        """请求失败：通知跟随者自行请求，并释放锁"""
+        if not self.closed:
+            self._append({"error": error})
+            self._release()
+
+    def _append(self, record: Dict):
+        self._spool.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._spool.flush()
+        now = time.monotonic()
+        if now - self._beat >= HEARTBEAT_INTERVAL:
+            self._beat = now
+            try:
+                os.utime(self.flight.lock_path(self.key))
+            except OSError:
+                pass
+
+    def _release(self):
+        self.closed = True
+        self._spool.close()
+        # 锁被判定失效并由其他进程接手后，不能删除对方的锁
+        lock_path = self.flight.lock_path(self.key)
+        owner = self.flight._read_lock(lock_path)
+        if owner is not None and owner.get("spool") == self.spool_path:
+            try:
+                os.unlink(lock_path)
+            except OSError:
+                pass
+
+
+class SingleFlight:
+    """基于锁文件和 spool 文件的跨进程请求合并"""
+
+    def __init__(self, directory: str = SINGLE_FLIGHT_DIR, stale_seconds: float = DEFAULT_STALE_SECONDS):
+        """
+        初始化
+
+        Args:
+            directory (str): 锁文件和 spool 文件所在目录
+            stale_seconds (float): 持锁进程无输出超过该时长（秒）视为失效
+        """
+        self.directory = os.path.expanduser(directory)
+        self.stale_seconds = stale_seconds
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional["SingleFlight"]:
+        """
+        根据配置中的 advanced 部分创建
+
+        Args:
+            config (dict): advanced 配置
+
+        Returns:
+            SingleFlight: 未启用 single_flight 时返回 None
+        """
+        config = config or {}
+        if not config.get('single_flight', True):
+            return None
+        return cls(stale_seconds=float(config.get('single_flight_stale_seconds', DEFAULT_STALE_SECONDS)))
+
+    def lock_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.lock")
+
+    def begin(self, key: str) -> Optional[FlightLease]:
+        """
+        尝试成为该请求的持锁进程
+
+        Args:
+            key (str): 请求键
+
+        Returns:
+            FlightLease: 取得锁时返回租约；其他存活进程持有锁时返回 None
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._sweep()
+        lock_path = self.lock_path(key)
+        spool_path = os.path.join(self.directory, f"{key}.{os.getpid()}.{time.time_ns()}.spool")
+        owner = {"pid": os.getpid(), "host": socket.gethostname(), "spool": spool_path, "started": time.time()}
+
+        # 先写完锁内容再用 link 原子地创建锁文件，其他进程不会读到不完整的锁
+        tmp_path = f"{lock_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(owner, f)
+        open(spool_path, 'w').close()
+        try:
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, lock_path)
+                    return FlightLease(self, key, spool_path)
+                except FileExistsError:
+                    current = self._read_lock(lock_path)
+                    if current is not None and not self._is_stale(lock_path, current):
+                        break
+                    self._break_lock(lock_path, current)
+            os.unlink(spool_path)
+            return None
+        finally:
+            os.unlink(tmp_path)
+
+    def follow(self, key: str, skip: int = 0) -> Generator[str, None, Optional[str]]:
+        """
+        跟随持锁进程的输出
+
+        Args:
+            key (str): 请求键
+            skip (int): 跳过开头的字符数（接手前已经输出的部分）
+
+        Yields:
+            str: 输出片段
+
+        Returns:
+            str: 持锁进程记录的结束原因
+
+        Raises:
+            LeaderLost: 锁已释放或失效但没有结束记录，或持锁进程的请求失败
+        """
+        lock_path = self.lock_path(key)
+        owner = self._read_lock(lock_path)
+        if owner is None:
+            raise LeaderLost("锁已释放")
+        try:
+            spool = open(owner["spool"], 'r', encoding='utf-8')
+        except OSError as e:
+            raise LeaderLost(str(e)) from e
+
+        with spool:
+            buffer = ""
+            while True:
+                data = spool.read()
+                if not data:
+                    current = self._read_lock(lock_path)
+                    if current is not None and current.get("spool") == owner["spool"] \
+                            and not self._is_stale(lock_path, current):
+                        time.sleep(POLL_INTERVAL)
+                        continue
+                    # 释放锁之前一定已经写入结束记录，再读一次确认
+                    data = spool.read()
+                    if not data:
+                        raise LeaderLost("持锁进程在结束前退出")
+                buffer += data
+                *lines, buffer = buffer.split("\n")
+                for line in lines:
+                    record = json.loads(line)
+                    if "t" in record:
+                        text = record["t"]
+                        if skip >= len(text):
+                            skip -= len(text)
+                            continue
+                        text, skip = text[skip:], 0
+                        yield text
+                    elif "error" in record:
+                        raise LeaderLost(record["error"])
+                    elif record.get("done"):
+                        return record.get("finish_reason")
+
+    def _read_lock(self, lock_path: str) -> Optional[Dict]:
+        try:
+            with open(lock_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_stale(self, lock_path: str, owner: Dict) -> bool:
+        """持锁进程已退出（同一主机），或长时间没有心跳"""
+        if owner.get("host") == socket.gethostname():
+            try:
+                os.kill(owner["pid"], 0)
+            except ProcessLookupError:
+                return True
+            except (PermissionError, KeyError, TypeError):
+                pass
+        try:
+            return time.time() - os.path.getmtime(lock_path) > self.stale_seconds
+        except OSError:
+            return True
+
+    def _break_lock(self, lock_path: str, owner: Optional[Dict]):
+        """
+        移除失效的锁：先改名（只有一个进程能成功），确认移走的正是判定为失效的锁再删除；
+        移走的是其他进程刚创建的新锁时放回原处
+        """
+        moved = f"{lock_path}.{os.getpid()}.stale"
+        try:
+            os.rename(lock_path, moved)
+        except OSError:
+            return
+        if owner is not None and self._read_lock(moved) != owner:
+            try:
+                os.link(moved, lock_path)
+            except OSError:
+                pass
+        os.unlink(moved)
+
+    def _sweep(self):
+        """删除过期的 spool 文件"""
+        now = time.time()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".spool"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > SPOOL_TTL:
+                    os.unlink(path)
+            except OSError:
+                pass
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+模式投机模块
+模式检测的置信度较低时，同时以流式请求启动排名前两位的处理器，先缓冲各自的输出，
+采用第一个输出明显符合其模式的处理器（如命令模式输出了命令代码块），取消另一个；
+投机受输入长度和每日额外 token 预算限制，并统计触发和胜出的次数
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from src.core.context_budget import TokenEstimator
+
+SPECULATION_STATS_FILE = "~/.ai_terminal/speculation_stats.json"
+
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_MAX_INPUT_CHARS = 300
+# 两个分支都输出了这么多字符仍无法判定时，采用排名第一的模式
+DEFAULT_DECIDE_CHARS = 400
+# 每天投机额外花费的 token（被取消一方的输入和输出，按估算计）上限
+DEFAULT_DAILY_TOKEN_BUDGET = 50000
+# 对话、文档模式的输出至少有这么多字符且没有代码块时才算符合
+PROSE_CHARS = 120
+
+_SHELL_BLOCK = re.compile(r"```(?:zsh|bash|sh|shell|console)?[ \t]*\n[ \t]*\S")
+_INLINE_CODE = re.compile(r"`[^`\n]+`")
+
+
+class SpeculationCancelled(Exception):
+    """投机失败的分支被取消（从该分支的 on_token 中抛出，结束其请求）"""
+
+
+def fits_mode(mode: str, text: str, finished: bool = False) -> bool:
+    """
+    输出是否明显符合模式
+
+    Args:
+        mode (str): 模式
+        text (str): 已输出的文本
+        finished (bool): 输出是否已经结束
+
+    Returns:
+        bool: 命令模式要求出现命令代码块（结束时行内代码也可以）；对话和文档模式要求
+            足够长且没有代码块的文字（结束时不限长度）
+    """
+    if mode == "command":
+        return bool(_SHELL_BLOCK.search(text)) or (finished and bool(_INLINE_CODE.search(text)))
+    if "```" in text:
+        return False
+    return len(text.strip()) >= PROSE_CHARS or (finished and bool(text.strip()))
+
+
+class _Branch:
+    """一个投机分支：处理器、已缓冲的输出和结果"""
+
+    def __init__(self, mode, handler):
+        self.mode = mode
+        self.handler = handler
+        self.chunks: List[str] = []
+        self.text = ""
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        # pending（缓冲输出）、won（直接输出）、cancelled（下一个片段到达时结束）
+        self.state = "pending"
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def settled(self) -> bool:
+        return self.done or self.error is not None
+
+
+class SpeculativeDispatcher:
+    """低置信度时并行运行两个模式的处理器，并统计投机效果"""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, max_input_chars: int = DEFAULT_MAX_INPUT_CHARS,
+                 decide_chars: int = DEFAULT_DECIDE_CHARS, daily_token_budget: int = DEFAULT_DAILY_TOKEN_BUDGET,
+                 path: str = SPECULATION_STATS_FILE):
+        """
+        初始化
+
+        Args:
+            threshold (float): 检测结果的置信度低于该值时投机
+            max_input_chars (int): 输入超过该长度时不投机（额外的输入 token 太多）
+            decide_chars (int): 两个分支都输出这么多字符仍无法判定时采用排名第一的模式
+            daily_token_budget (int): 每天投机额外花费的 token 上限
+            path (str): 统计文件路径
+        """
+        self.threshold = threshold
+        self.max_input_chars = max_input_chars
+        self.decide_chars = decide_chars
+        self.daily_token_budget = daily_token_budget
+        self.path = os.path.expanduser(path)
+        self._stats: Optional[Dict] = None
+        # 最近一次投机的结果 {"modes", "winner", "reason", "extra_tokens", "decide_seconds"}，未投机时为 None
+        self.last_result: Optional[Dict] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional["SpeculativeDispatcher"]:
+        """
+        根据配置中的 speculation 部分创建
+
+        Args:
+            config (dict): speculation 配置
+
+        Returns:
+            SpeculativeDispatcher: 未启用时（默认，投机会额外发出付费请求）返回 None
+        """
+        config = config or {}
+        if not config.get('enabled', False):
+            return None
+        return cls(
+            threshold=float(config.get('threshold', DEFAULT_THRESHOLD)),
+            max_input_chars=int(config.get('max_input_chars', DEFAULT_MAX_INPUT_CHARS)),
+            decide_chars=int(config.get('decide_chars', DEFAULT_DECIDE_CHARS)),
+            daily_token_budget=int(config.get('daily_token_budget', DEFAULT_DAILY_TOKEN_BUDGET))
+        )
+
+    def plan(self, ranking: List[Tuple[str, float]], user_input: str, stream: bool) -> Optional[List[str]]:
+        """
+        决定是否投机
+
+        Args:
+            ranking (list): rank_modes 的结果 [(模式, 置信度)]
+            user_input (str): 用户输入
+            stream (bool): 是否开启流式输出（非流式时无法及早取消另一个请求）
+
+        Returns:
+            list: 投机的两个模式（排名第一的在前）；置信度足够或超出成本限制时返回 None
+        """
+        if len(ranking) < 2 or ranking[0][1] >= self.threshold:
+            return None
+        stats = self.stats
+        stats["ambiguous"] += 1
+        if not stream:
+            reason = "no_stream"
+        elif len(user_input) > self.max_input_chars:
+            reason = "long_input"
+        elif self._today(stats)["tokens"] >= self.daily_token_budget:
+            reason = "budget"
+        else:
+            return [ranking[0][0], ranking[1][0]]
+        stats["skipped"][reason] = stats["skipped"].get(reason, 0) + 1
+        self._save()
+        return None
+
+    def run(self, candidates: List[Tuple[str, object]], user_input: str, on_token=None) -> Tuple[str, object, str]:
+        """
+        同时运行两个处理器，采用第一个输出符合其模式的一方
+
+        Args:
+            candidates (list): [(模式, 处理器)]，排名第一的在前；各处理器使用独立的 LLM 客户端
+            user_input (str): 用户输入
+            on_token (callable): 采用的一方的输出（先输出已缓冲的部分，之后边接收边输出）
+
+        Returns:
+            tuple: (模式, 处理器, 处理结果)
+
+        Raises:
+            Exception: 两个分支都失败时抛出排名第一的分支的错误
+        """
+        start = time.perf_counter()
+        condition = threading.Condition()
+        branches = [_Branch(mode, handler) for mode, handler in candidates]
+        for branch in branches:
+            branch.handler.on_token = lambda chunk, branch=branch: self._on_chunk(condition, branch, chunk, on_token)
+            branch.thread = threading.Thread(target=self._run_branch, args=(condition, branch, user_input), daemon=True)
+            branch.thread.start()
+
+        with condition:
+            while True:
+                winner, reason = self._decide(branches)
+                if winner is not None:
+                    break
+                condition.wait()
+            decide_seconds = time.perf_counter() - start
+            for branch in branches:
+                branch.state = "won" if branch is winner else "cancelled"
+            if on_token:
+                for chunk in winner.chunks:
+                    on_token(chunk)
+
+        winner.thread.join()
+        if winner.error is not None:
+            raise winner.error
+        self.last_result = {
+            "modes": [branch.mode for branch in branches],
+            "winner": winner.mode,
+            "reason": reason,
+            "extra_tokens": self._extra_tokens(winner, [branch for branch in branches if branch is not winner],
+                                               user_input),
+            "decide_seconds": decide_seconds
+        }
+        self.record(self.last_result, primary=branches[0].mode)
+        return winner.mode, winner.handler, winner.result
+
+    def _run_branch(self, condition, branch, user_input):
+        try:
+            result = branch.handler.handle(user_input)
+        except SpeculationCancelled:
+            return
+        except Exception as e:
+            with condition:
+                branch.error = e
+                condition.notify_all()
+            return
+        with condition:
+            branch.result = result
+            # 未流式输出的结果（如缓存命中）按完整文本判断
+            branch.text = result or branch.text
+            branch.done = True
+            condition.notify_all()
+
+    def _on_chunk(self, condition, branch, chunk, on_token):
+        with condition:
+            if branch.state == "cancelled":
+                raise SpeculationCancelled()
+            if branch.state == "won":
+                if on_token:
+                    on_token(chunk)
+                return
+            branch.chunks.append(chunk)
+            branch.text += chunk
+            condition.notify_all()
+
+    def _decide(self, branches: List[_Branch]) -> Tuple[Optional[_Branch], Optional[str]]:
+        """
+        判定采用哪个分支
+
+        Returns:
+            tuple: (分支, 原因)；原因为 fit（输出符合模式）、fallback（都无法判定，采用排名靠前的一方）
+                或 error（另一方失败）；尚无法判定时返回 (None, None)
+        """
+        for branch in branches:
+            if branch.error is None and fits_mode(branch.mode, branch.text, branch.done):
+                return branch, "fit"
+        if not all(branch.settled or len(branch.text) >= self.decide_chars for branch in branches):
+            return None, None
+        alive = [branch for branch in branches if branch.error is None]
+        if not alive:
+            return branches[0], "error"
+        return alive[0], "fallback" if alive[0] is branches[0] else "error"
+
+    @staticmethod
+    def _extra_tokens(winner: _Branch, losers: List[_Branch], user_input: str) -> int:
+        """估算被取消的一方花费的 token：已结束的按实际用量，否则按输入（与采用的一方相当）加已输出的部分"""
+        usage = getattr(winner.handler.llm_client, 'last_usage', None) or {}
+        prompt_tokens = usage.get('prompt_tokens') or int(TokenEstimator.raw_count(user_input))
+        total = 0
+        for loser in losers:
+            if loser.done:
+                loser_usage = getattr(loser.handler.llm_client, 'last_usage', None) or {}
+                total += loser_usage.get('prompt_tokens', 0) + loser_usage.get('completion_tokens', 0)
+            elif loser.chunks or loser.error is None:
+                total += prompt_tokens + int(TokenEstimator.raw_count(loser.text))
+        return total
+
+    @property
+    def stats(self) -> Dict:
+        """低置信度次数、投机次数、跳过原因、各方胜出次数和额外花费的 token，首次访问时从磁盘读取"""
+        if self._stats is None:
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                if not isinstance(data, dict):
+                    raise ValueError("invalid stats")
+                self._stats = data
+            except (OSError, ValueError):
+                self._stats = {}
+            for key in ("ambiguous", "fired", "alternative_won", "extra_tokens"):
+                self._stats.setdefault(key, 0)
+            for key in ("skipped", "reasons", "today"):
+                self._stats.setdefault(key, {})
+        return self._stats
+
+    @staticmethod
+    def _today(stats: Dict) -> Dict:
+        """当天的额外 token，日期变化时重新计数"""
+        today = date.today().isoformat()
+        if stats["today"].get("date") != today:
+            stats["today"] = {"date": today, "tokens": 0}
+        return stats["today"]
+
+    def record(self, result: Dict, primary: str):
+        """
+        记录一次投机并写回磁盘
+
+        Args:
+            result (dict): 投机结果 {"winner", "reason", "extra_tokens", ...}
+            primary (str): 排名第一的模式
+        """
+        stats = self.stats
+        stats["fired"] += 1
+        if result["winner"] != primary:
+            stats["alternative_won"] += 1
+        stats["reasons"][result["reason"]] = stats["reasons"].get(result["reason"], 0) + 1
+        stats["extra_tokens"] += result["extra_tokens"]
+        self._today(stats)["tokens"] += result["extra_tokens"]
+        self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.stats, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def summary(self) -> List[str]:
+        """
+        统计摘要
+
+        Returns:
+            list: 每行一项：触发次数、备选模式胜出次数、跳过原因和额外花费的 token
+        """
+        stats = self.stats
+        fired = stats["fired"]
+        rate = f"（{stats['alternative_won'] / fired:.0%}）" if fired else ""
+        lines = [f"低置信度 {stats['ambiguous']} 次，投机 {fired} 次，备选模式胜出 {stats['alternative_won']} 次{rate}"]
+        if stats["skipped"]:
+            reasons = ", ".join(f"{reason} {count}" for reason, count in sorted(stats["skipped"].items()))
+            lines.append(f"未投机: {reasons}")
+        lines.append(f"额外 token（估算）: 累计 {stats['extra_tokens']}，今日 {self._today(stats)['tokens']}"
+                     f"/{self.daily_token_budget}")
+        return lines
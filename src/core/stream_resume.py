@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+流式响应续传模块
+流式响应中途断开时，以已收到的部分作为 assistant 前缀（prefix=True）重新请求，
+模型只需生成剩余部分；续传响应若重复输出了前缀，由 EchoedPrefixFilter 去掉
+"""
+
+from typing import Dict, List
+
+
+class StreamInterruptedError(ConnectionError):
+    """流式响应在结束前中断，且续传次数已用尽"""
+
+
+def continuation_messages(messages: List[Dict[str, str]], partial: str) -> List[Dict]:
+    """
+    构建续传请求的消息列表
+
+    Args:
+        messages (list): 原始请求的消息列表
+        partial (str): 已收到的回复文本
+
+    Returns:
+        list: 末尾追加了 assistant 前缀消息的消息列表
+    """
+    if not partial:
+        return messages
+    return [*messages, {"role": "assistant", "content": partial, "prefix": True}]
+
+
+class EchoedPrefixFilter:
+    """过滤续传响应开头重复输出的前缀
+
+    部分服务会在续传响应中先原样输出前缀再继续生成。收到的内容与前缀一致时先暂存，
+    完整匹配前缀后丢弃；一旦出现不一致，说明服务没有重复前缀，暂存的内容原样放行。
+    响应结束时仍在暂存的内容只是前缀的开头，视为重复输出直接丢弃。
+    """
+
+    def __init__(self, prefix: str):
+        """
+        初始化过滤器
+
+        Args:
+            prefix (str): 续传请求使用的前缀
+        """
+        self.prefix = prefix
+        self._buffer = ""
+        self._done = not prefix
+
+    def feed(self, text: str) -> str:
+        """
+        处理一个片段
+
+        Args:
+            text (str): 续传响应的片段
+
+        Returns:
+            str: 可以输出的内容（可能为空字符串）
+        """
+        if self._done:
+            return text
+        self._buffer += text
+        if self._buffer.startswith(self.prefix):
+            self._done = True
+            return self._buffer[len(self.prefix):]
+        if self.prefix.startswith(self._buffer):
+            return ""
+        self._done = True
+        return self._buffer
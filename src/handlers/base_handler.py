@@ -4,14 +4,19 @@
 定义了各种处理器的基类，提供通用功能
 """
 
+import copy
+import time
+
+from src.core.model_cascade import ModelCascade
+
 
 class BaseHandler:
     """处理用户请求的基础类"""
-    
+
     def __init__(self, llm_client, context_manager, settings=None):
         """
         初始化基础处理器
-        
+
         Args:
             llm_client: LLM 客户端
             context_manager: 上下文管理器
@@ -20,15 +25,123 @@ class BaseHandler:
         self.llm_client = llm_client
         self.context_manager = context_manager
         self.settings = settings or {}
-        
+
+        # 流式输出：由配置 mistral.stream 开启，on_token 由调用方设置，用于逐段输出
+        self.stream = bool(self.settings.get('mistral', {}).get('stream', False))
+        self.on_token = None
+        # 本次处理的结果是否已经通过 on_token 输出
+        self.streamed = False
+        # 缓存策略：use（正常使用）、refresh（不读取但写入新结果）、off（不使用），由调用方按命令行参数设置
+        self.cache_policy = "use"
+        # 模型梯级：escalate 为 True 时直接使用最高一级；cascade_result 记录本次各级的尝试
+        self.escalate = False
+        self.cascade_result = None
+
     def handle(self, user_input):
         """
         处理用户输入
-        
+
         Args:
             user_input (str): 用户输入
-            
+
         Returns:
             str: 处理结果
         """
         raise NotImplementedError("子类必须实现此方法")
+
+    def _generate(self, prompt, context, config, early_stop=None):
+        """
+        调用 LLM 生成回复，开启流式输出时边接收边通过 on_token 输出
+
+        Args:
+            prompt (str): 提示
+            context (dict): 上下文
+            config (dict): 模式配置（temperature、max_tokens、top_p）
+            early_stop (EarlyStop): 提前结束检测器；停止序列同时交给 API，
+                流式输出时到达结束点立即关闭流，非流式时按同样的规则截断结果
+
+        Returns:
+            str: 完整的回复文本
+        """
+        params = {
+            "temperature": config["temperature"],
+            "max_tokens": config["max_tokens"],
+            "top_p": config["top_p"]
+        }
+        if early_stop is not None and early_stop.stop_sequences:
+            params["stop"] = early_stop.stop_sequences
+
+        cascade = getattr(self.llm_client, 'cascade', None)
+        if isinstance(cascade, ModelCascade) and (
+                self.escalate or cascade.applies((context or {}).get('mode', 'conversation'), prompt)):
+            return self._generate_cascaded(cascade, prompt, context, params, early_stop)
+        return self._call_llm(prompt, context, params, early_stop)
+
+    def _generate_cascaded(self, cascade, prompt, context, params, early_stop=None):
+        """
+        按模型梯级生成回复：低一级的回答未通过本地检查（或请求出错）时升级到下一级
+
+        低级模型的回答可能被丢弃，因此不流式输出，通过检查后一次性输出；最后一级按正常方式输出。
+
+        Args:
+            cascade (ModelCascade): 模型梯级
+            prompt (str): 提示
+            context (dict): 上下文
+            params (dict): 请求参数
+            early_stop (EarlyStop): 提前结束检测器（每一级使用独立的副本）
+
+        Returns:
+            str: 完整的回复文本
+        """
+        rungs = cascade.rungs[-1:] if self.escalate else cascade.rungs
+        attempts = []
+        for index, model in enumerate(rungs):
+            last = index == len(rungs) - 1
+            start = time.perf_counter()
+            try:
+                response = self._call_llm(prompt, context, {**params, "model": model},
+                                          copy.deepcopy(early_stop), stream=last)
+            except Exception:
+                if last:
+                    raise
+                attempts.append({"model": model, "seconds": time.perf_counter() - start, "reason": "error"})
+                continue
+            reason = None if last else cascade.check(
+                response, context, getattr(self.llm_client, 'last_finish_reason', None))
+            attempts.append({"model": model, "seconds": time.perf_counter() - start, "reason": reason})
+            if reason is None:
+                break
+
+        if not last and response and self.stream and self.on_token:
+            self.on_token(response)
+            self.streamed = True
+        saved = cascade.record(model, attempts)
+        self.cascade_result = {"model": model, "attempts": attempts, "saved": saved}
+        return response
+
+    def _call_llm(self, prompt, context, params, early_stop=None, stream=True):
+        """
+        发送一次请求，开启流式输出且 stream 为 True 时边接收边通过 on_token 输出
+
+        Args:
+            prompt (str): 提示
+            context (dict): 上下文
+            params (dict): 请求参数
+            early_stop (EarlyStop): 提前结束检测器
+            stream (bool): 是否允许流式输出
+
+        Returns:
+            str: 完整的回复文本
+        """
+        if not (stream and self.stream and self.on_token):
+            response = self.llm_client.generate_response(prompt, context, **params)
+            return early_stop.truncate(response) if early_stop is not None else response
+
+        if early_stop is not None:
+            params["early_stop"] = early_stop
+        chunks = []
+        for chunk in self.llm_client.generate_streaming_response(prompt, context, **params):
+            chunks.append(chunk)
+            self.on_token(chunk)
+            self.streamed = True
+        return "".join(chunks)
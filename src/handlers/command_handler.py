@@ -6,14 +6,38 @@
 
 import os
 import re
-import subprocess
+from src.core.command_cache import CommandCache
+from src.core.early_stop import EarlyStop
 from src.handlers.base_handler import BaseHandler
 from src.utils.config_manager import MistralConfigManager
+from src.utils.system_info import get_system_versions
+
+# 简洁模式：只要求输出命令，生成的 token 上限相应降低
+TERSE_INSTRUCTION = "只输出一个 ```zsh 代码块，代码块中只包含命令本身，不要任何解释或其他文字。"
+TERSE_MAX_TOKENS = 256
 
 
 class CommandHandler(BaseHandler):
     """处理命令相关请求的处理器"""
     
+    def __init__(self, llm_client, context_manager, settings=None):
+        """
+        初始化命令处理器
+        
+        Args:
+            llm_client: LLM 客户端
+            context_manager: 上下文管理器
+            settings (dict): 配置参数
+        """
+        super().__init__(llm_client, context_manager, settings)
+        # 相似命令缓存：命中时复用以往相似请求生成的命令，reused 记录命中的记录
+        self.command_cache = CommandCache.from_config(self.settings.get('cache'))
+        self.reused = None
+        # 简洁模式（只输出命令，第一个代码块结束即停止）和生成命令时使用的停止序列
+        terminal = self.settings.get('terminal', {})
+        self.terse = bool(terminal.get('terse_commands', False))
+        self.stop_sequences = list(terminal.get('command_stop_sequences') or [])
+    
     def handle(self, user_input):
         """
         处理用户的命令相关请求
@@ -33,8 +57,10 @@ class CommandHandler(BaseHandler):
         # 添加环境信息到上下文
         self._enrich_context_with_environment(context)
         
-        # 检测请求类型
+        # 检测请求类型（简洁模式下一般查询也按生成命令处理）
         request_type = self._detect_request_type(user_input)
+        if self.terse and request_type == "general":
+            request_type = "generate"
         
         # 根据不同的请求类型处理
         if request_type == "explain":
@@ -127,13 +153,7 @@ class CommandHandler(BaseHandler):
         
         # 调用 LLM 生成解释
         config = MistralConfigManager.MODES["command"]
-        explanation = self.llm_client.generate_response(
-            prompt, 
-            context,
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"],
-            top_p=config["top_p"]
-        )
+        explanation = self._generate(prompt, context, config)
         
         return explanation
     
@@ -152,18 +172,28 @@ class CommandHandler(BaseHandler):
         context["action"] = "generate"
         context["requirement"] = user_input
         
+        # 查找相似的历史请求，足够相似时直接复用其结果：只复用相同输出模式、相同工作目录下生成的命令
+        cache_scope = f"{'terse' if self.terse else 'full'}\n{context.get('current_directory', '')}"
+        if self.command_cache is not None and self.cache_policy == "use":
+            self.reused = self.command_cache.lookup(user_input, cache_scope)
+            if self.reused:
+                return self.reused["command"]
+        
         # 构建提示
         prompt = f"根据以下需求生成适合 macOS 和 zsh 的命令：{user_input}"
-        
-        # 调用 LLM 生成命令
         config = MistralConfigManager.MODES["command"]
-        result = self.llm_client.generate_response(
-            prompt, 
-            context,
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"],
-            top_p=config["top_p"]
-        )
+        if self.terse:
+            prompt = f"{prompt}\n{TERSE_INSTRUCTION}"
+            config = {**config, "max_tokens": min(config["max_tokens"], TERSE_MAX_TOKENS)}
+        
+        # 调用 LLM 生成命令：简洁模式下第一个代码块结束或出现停止序列时即停止
+        early_stop = EarlyStop(self.stop_sequences, code_block=self.terse) if self.terse or self.stop_sequences else None
+        result = self._generate(prompt, context, config, early_stop)
+        
+        # 记录完整生成的结果（被截断的结果不记录）
+        if (self.command_cache is not None and self.cache_policy != "off" and result
+                and getattr(self.llm_client, 'last_finish_reason', None) in (None, "stop")):
+            self.command_cache.add(user_input, result, cache_scope)
         
         return result
     
@@ -190,13 +220,7 @@ class CommandHandler(BaseHandler):
         
         # 调用 LLM 生成优化结果
         config = MistralConfigManager.MODES["command"]
-        optimization = self.llm_client.generate_response(
-            prompt, 
-            context,
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"],
-            top_p=config["top_p"]
-        )
+        optimization = self._generate(prompt, context, config)
         
         return optimization
     
@@ -213,13 +237,7 @@ class CommandHandler(BaseHandler):
         """
         # 调用 LLM 生成回复
         config = MistralConfigManager.MODES["command"]
-        response = self.llm_client.generate_response(
-            user_input, 
-            context,
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"],
-            top_p=config["top_p"]
-        )
+        response = self._generate(user_input, context, config)
         
         return response
     
@@ -241,15 +259,5 @@ class CommandHandler(BaseHandler):
             "SHELL": os.environ.get("SHELL", "")
         }
         
-        # 添加系统信息
-        try:
-            # 获取 macOS 版本
-            process = subprocess.run(["sw_vers", "-productVersion"], capture_output=True, text=True, check=False)
-            context["macos_version"] = process.stdout.strip() if process.returncode == 0 else "Unknown"
-            
-            # 获取 zsh 版本
-            process = subprocess.run(["zsh", "--version"], capture_output=True, text=True, check=False)
-            context["zsh_version"] = process.stdout.strip() if process.returncode == 0 else "Unknown"
-        except Exception:
-            context["macos_version"] = "Unknown"
-            context["zsh_version"] = "Unknown"
+        # 添加系统信息（macOS 和 zsh 版本，每个进程只探测一次，可由启动流水线提前完成）
+        context.update(get_system_versions())
@@ -28,12 +28,6 @@ class ConversationHandler(BaseHandler):
         context = self.context_manager.build_context_for_mistral("conversation")
         
         # 调用 LLM 生成回复
-        response = self.llm_client.generate_response(
-            user_input, 
-            context,
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"],
-            top_p=config["top_p"]
-        )
+        response = self._generate(user_input, context, config)
         
         return response
@@ -229,13 +229,7 @@ class DocumentHandler(BaseHandler):
         
         # 调用 LLM 生成总结
         config = MistralConfigManager.MODES["document"]
-        summary = self.llm_client.generate_response(
-            prompt, 
-            context,
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"],
-            top_p=config["top_p"]
-        )
+        summary = self._generate(prompt, context, config)
         
         # 如果文件是代码文件，保存分析结果到上下文
         file_path = context.get("file_path", "")
@@ -275,13 +269,7 @@ class DocumentHandler(BaseHandler):
         
         # 调用 LLM 生成分析
         config = MistralConfigManager.MODES["document"]
-        analysis = self.llm_client.generate_response(
-            prompt, 
-            context,
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"],
-            top_p=config["top_p"]
-        )
+        analysis = self._generate(prompt, context, config)
         
         # 保存分析结果到上下文
         self.context_manager.add_document_context(file_path, analysis=analysis)
@@ -325,13 +313,7 @@ class DocumentHandler(BaseHandler):
         
         # 调用 LLM 生成提取结果
         config = MistralConfigManager.MODES["document"]
-        extraction = self.llm_client.generate_response(
-            prompt, 
-            context,
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"],
-            top_p=config["top_p"]
-        )
+        extraction = self._generate(prompt, context, config)
         
         return extraction
     
@@ -352,12 +334,6 @@ class DocumentHandler(BaseHandler):
         
         # 调用 LLM 生成结果
         config = MistralConfigManager.MODES["document"]
-        result = self.llm_client.generate_response(
-            prompt, 
-            context,
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"],
-            top_p=config["top_p"]
-        )
+        result = self._generate(prompt, context, config)
         
         return result
@@ -6,19 +6,331 @@ AI Terminal - 智能终端助手
 
 import os
 import sys
+import copy
+import time
+import importlib
 import click
 from pathlib import Path
 
 # 添加项目根目录到 Python 路径
 sys.path.append(str(Path(__file__).parent.parent))
 
-from src.core.llm_client import MistralClient
+# 以下模块只依赖标准库；mistralai SDK、YAML 解析器、LLM 客户端及其请求策略模块在真正用到时才加载
+# （在初始化流水线的工作线程中，与读取上下文并行）
 from src.core.context_manager import ContextManager
-from src.utils.config_loader import load_config
-from src.handlers.command_handler import CommandHandler
-from src.handlers.conversation_handler import ConversationHandler
-from src.handlers.document_handler import DocumentHandler
-from src.utils.mode_detector import detect_mode
+from src.core.init_pipeline import InitPipeline
+from src.utils.config_loader import load_config_snapshot
+from src.utils.mode_detector import detect_mode, rank_modes
+from src.core.ready_context import (
+    PrewarmedContextManager, collect_env_vars, load_ready_context, refresh_ready_context
+)
+from src.utils.system_info import get_system_versions, seed_system_versions
+
+# 各模式对应的处理器，选定模式后才导入
+HANDLERS = {
+    "conversation": ("src.handlers.conversation_handler", "ConversationHandler"),
+    "command": ("src.handlers.command_handler", "CommandHandler"),
+    "document": ("src.handlers.document_handler", "DocumentHandler"),
+}
+
+
+def _load_settings(config_path, debug=False):
+    """
+    加载配置，失败时返回空配置
+    
+    Args:
+        config_path (str): 配置文件路径
+        debug (bool): 是否输出失败原因
+        
+    Returns:
+        dict: 配置参数
+    """
+    try:
+        settings, errors = load_config_snapshot(config_path)
+        if debug and errors:
+            click.echo(f"配置问题: {'; '.join(errors)}", err=True)
+        return settings
+    except Exception as e:
+        if debug:
+            click.echo(f"加载配置失败: {str(e)}", err=True)
+        return {}
+
+
+def _load_context(settings):
+    """
+    加载上下文并记录当前工作目录和环境变量
+    
+    Args:
+        settings (dict): 配置参数
+        
+    Returns:
+        ContextManager: 上下文管理器
+    """
+    context_manager = ContextManager.from_config(settings.get('terminal'))
+    context_manager.update_environment(env_vars=collect_env_vars(), cwd=os.getcwd())
+    return context_manager
+
+
+def _create_client(settings, use_cache=True, refresh_cache=False, shared=None):
+    """
+    创建 LLM 客户端并加载 SDK
+    
+    Args:
+        settings (dict): 配置参数
+        use_cache (bool): 是否使用响应缓存（仍受配置 cache.enabled 控制）
+        refresh_cache (bool): 是否忽略已有缓存重新请求
+        shared (MistralClient): 与该客户端共用后端（SDK 客户端和连接池），用于批量模式的各工作线程和模式投机
+        
+    Returns:
+        MistralClient: LLM 客户端
+    """
+    from src.core.llm_client import MistralClient
+    from src.core.context_budget import ContextAssembler
+    from src.core.compression import RequestCompressor
+    from src.core.max_tokens import AdaptiveMaxTokens
+    from src.core.model_cascade import ModelCascade
+    from src.core.rate_limiter import RateLimiter
+    from src.core.request_policy import RequestPolicy
+    from src.core.response_cache import ResponseCache
+    from src.core.single_flight import SingleFlight
+
+    llm_client = MistralClient(settings.get('api', {}))
+    llm_client.policy = RequestPolicy.from_config(settings.get('advanced'))
+    llm_client.policy.rate_limiter = RateLimiter.from_config(settings.get('rate_limit'))
+    llm_client.assembler = ContextAssembler.from_config(settings.get('context_budget'))
+    llm_client.max_tokens_policy = AdaptiveMaxTokens.from_config(settings.get('advanced'))
+    llm_client.cascade = ModelCascade.from_config(settings.get('cascade'))
+    llm_client.compressor = RequestCompressor.from_config(settings.get('advanced'))
+    llm_client.single_flight = SingleFlight.from_config(settings.get('advanced'))
+    if use_cache:
+        llm_client.cache = ResponseCache.from_config(settings.get('cache'))
+        llm_client.refresh_cache = refresh_cache
+    if shared is not None:
+        llm_client.backends = shared.backends
+    elif not llm_client.endpoints:
+        llm_client.client
+    return llm_client
+
+
+def _select_modes(user_input, forced, settings):
+    """
+    检测运行模式，置信度较低且允许投机时选出两个模式
+    
+    Args:
+        user_input (str): 用户输入
+        forced (str): 命令行指定的模式
+        settings (dict): 配置参数
+        
+    Returns:
+        dict: {"modes": 要运行的模式（一个，投机时为两个）, "confidence": 检测结果的置信度,
+            "speculation": 模式投机器（未启用时为 None）}
+    """
+    if forced:
+        return {"modes": [forced], "confidence": 1.0, "speculation": None}
+    ranking = rank_modes(user_input)
+    speculation = None
+    if (settings.get('speculation') or {}).get('enabled'):
+        from src.core.speculation import SpeculativeDispatcher
+        speculation = SpeculativeDispatcher.from_config(settings.get('speculation'))
+    stream = bool(settings.get('mistral', {}).get('stream', False))
+    modes = speculation.plan(ranking, user_input, stream) if speculation is not None else None
+    return {"modes": modes or [ranking[0][0]], "confidence": ranking[0][1], "speculation": speculation}
+
+
+def _probe_system_info(modes, ready=None):
+    """
+    命令模式下准备系统版本信息，优先使用预热快照中的结果
+    
+    Args:
+        modes (list): 要运行的模式
+        ready (dict): 预热上下文快照
+        
+    Returns:
+        dict: 系统版本信息，不运行命令模式时为空
+    """
+    if ready:
+        seed_system_versions(ready.get("system_versions", {}))
+    return get_system_versions() if "command" in modes else {}
+
+
+def _report_request_stats(llm_client, timing):
+    """
+    输出本次请求的耗时和 token 用量
+    
+    Args:
+        llm_client (MistralClient): LLM 客户端
+        timing (dict): 请求开始时间和首个 token 到达时间
+    """
+    total = (time.perf_counter() - timing["start"]) * 1000
+    if timing["first_token"] is not None:
+        first_token = (timing["first_token"] - timing["start"]) * 1000
+        click.echo(f"首个 token: {first_token:.0f}ms, 总耗时: {total:.0f}ms", err=True)
+    else:
+        click.echo(f"总耗时: {total:.0f}ms", err=True)
+    
+    if llm_client.assembler is not None:
+        context_stats = llm_client.assembler.last_stats
+        click.echo(f"上下文: 估计 {context_stats['tokens']} tokens, 截断 {context_stats['truncated']} 条, "
+                   f"丢弃 {context_stats['dropped']} 条", err=True)
+    
+    if llm_client.selector is not None:
+        click.echo(f"端点: {llm_client.last_backend}", err=True)
+    
+    compression = llm_client.compressor.last_stats if llm_client.compressor is not None else None
+    if compression:
+        click.echo(f"请求体: {compression['raw_bytes'] / 1024:.0f}KB → {compression['sent_bytes'] / 1024:.0f}KB"
+                   f"（{compression['encoding']}，压缩 {compression['compress_seconds'] * 1000:.0f}ms，"
+                   f"发送 {compression['request_seconds'] * 1000:.0f}ms）", err=True)
+    
+    if llm_client.last_coalesced:
+        click.echo("与其他进程中正在进行的相同请求合并，未调用 API", err=True)
+    usage = llm_client.last_usage
+    if usage:
+        click.echo(f"token 用量: 输入 {usage['prompt_tokens']}, 输出 {usage['completion_tokens']}", err=True)
+    
+    if llm_client.policy.last_rate_wait >= 0.05:
+        click.echo(f"限流等待: {llm_client.policy.last_rate_wait:.1f}s（当前速率为上限的 "
+                   f"{llm_client.policy.rate_limiter.rate:.0%}）", err=True)
+    policy_stats = llm_client.policy.last_stats
+    if policy_stats["attempts"] > 1:
+        hedge = "，对冲请求胜出" if policy_stats["hedge_won"] else ""
+        click.echo(f"请求次数: {policy_stats['attempts']}{hedge}", err=True)
+    if llm_client.last_max_tokens:
+        click.echo(f"max_tokens: {llm_client.last_max_tokens['max_tokens']}（{llm_client.last_max_tokens['key']}）",
+                   err=True)
+    if llm_client.last_length_retries:
+        click.echo(f"回复达到 max_tokens 后扩大预算续传: {llm_client.last_length_retries} 次", err=True)
+    if llm_client.last_resumes:
+        click.echo(f"流式续传次数: {llm_client.last_resumes}", err=True)
+    early_stop = llm_client.last_early_stop
+    if early_stop:
+        saved = f"，比 max_tokens 上限至多节省 {early_stop['saved_tokens']} tokens" if early_stop['saved_tokens'] else ""
+        click.echo(f"提前结束: 已输出约 {early_stop['output_tokens']} tokens 后关闭流{saved}", err=True)
+    
+    if llm_client.cache is not None:
+        click.echo(f"缓存: 命中 {llm_client.cache.hits}, 未命中 {llm_client.cache.misses}", err=True)
+
+
+def _report_cascade_stats(llm_client, handler):
+    """
+    输出本次请求在模型梯级中的尝试过程和累计统计
+    
+    Args:
+        llm_client (MistralClient): LLM 客户端
+        handler (BaseHandler): 处理本次请求的处理器
+    """
+    result = handler.cascade_result
+    if llm_client.cascade is None or result is None:
+        return
+    steps = " -> ".join(f"{attempt['model']}({attempt['reason']})" if attempt['reason'] else attempt['model']
+                        for attempt in result["attempts"])
+    saved = ""
+    if result["saved"] > 0:
+        saved = f"，比最高一级约快 {result['saved'] * 1000:.0f}ms"
+    elif result["saved"] < 0:
+        saved = f"，升级多花 {-result['saved'] * 1000:.0f}ms"
+    click.echo(f"模型梯级: {steps}{saved}", err=True)
+    for line in llm_client.cascade.summary():
+        click.echo(f"  {line}", err=True)
+
+
+def _report_speculation_stats(speculation):
+    """
+    输出本次模式投机的结果和累计统计
+    
+    Args:
+        speculation (SpeculativeDispatcher): 模式投机器
+    """
+    if speculation is None or speculation.last_result is None:
+        return
+    result = speculation.last_result
+    reasons = {"fit": "输出符合该模式", "fallback": "均无法判定，采用首选模式", "error": "另一方出错"}
+    click.echo(f"模式投机: {' / '.join(result['modes'])} → {result['winner']}（{reasons[result['reason']]}，"
+               f"{result['decide_seconds'] * 1000:.0f}ms 后判定，额外约 {result['extra_tokens']} tokens）", err=True)
+    for line in speculation.summary():
+        click.echo(f"  {line}", err=True)
+
+
+def _run_batch(batch, output, concurrency, order, config_path, forced_mode=None, debug=False,
+               use_cache=True, refresh_cache=False):
+    """
+    批量处理 JSONL 文件中的请求
+    
+    Args:
+        batch (str): 输入文件路径
+        output (str): 结果文件路径，为空时写到标准输出（不支持续跑）
+        concurrency (int): 并发数，为空时使用配置 batch.concurrency
+        order (str): 结果的写出顺序（input 或 completion），为空时使用配置 batch.order
+        config_path (str): 配置文件路径
+        forced_mode (str): 强制使用的模式（记录中指定的 mode 优先）
+        debug (bool): 是否输出配置问题
+        use_cache (bool): 是否使用响应缓存
+        refresh_cache (bool): 是否忽略已有缓存重新请求
+        
+    Returns:
+        dict: 汇总 {total, skipped, succeeded, failed, seconds}
+    """
+    from src.core.batch import DEFAULT_CONCURRENCY, BatchRunner, load_completed, read_records
+    
+    settings = _load_settings(config_path, debug)
+    batch_config = settings.get('batch', {})
+    concurrency = concurrency or int(batch_config.get('concurrency', DEFAULT_CONCURRENCY))
+    order = order or batch_config.get('order', "input")
+    records = read_records(batch)
+    skip = load_completed(output, records) if output else set()
+    
+    # 批量记录之间互不相关：不带入交互会话的历史，也不写回磁盘
+    base_context = _load_context(settings)
+    base_context.conversation_history = []
+    base_context.document_context = {}
+    shared = _create_client(settings, use_cache, refresh_cache)
+    
+    def worker_factory():
+        llm_client = _create_client(settings, use_cache, refresh_cache, shared=shared)
+        if llm_client.policy.rate_limiter is not None:
+            # 批量请求为后台请求，交互式的 ai 调用优先
+            llm_client.policy.rate_limiter.priority = "background"
+        
+        def process(record):
+            query = record["query"]
+            mode = record.get("mode") or forced_mode
+            if record.get("file"):
+                query = f'{query} "{record["file"]}"'
+                mode = mode or "document"
+            mode = mode or detect_mode(query)
+            handler = load_handler_class(mode)(llm_client, copy.deepcopy(base_context), settings)
+            handler.cache_policy = "off" if not use_cache else "refresh" if refresh_cache else "use"
+            response = handler.handle(query)
+            return {"mode": mode, "response": response, "usage": llm_client.last_usage,
+                    "model": llm_client.last_model}
+        
+        return process
+    
+    runner = BatchRunner(worker_factory, concurrency=concurrency, order=order)
+    if not output:
+        return runner.run(records, sys.stdout)
+    with open(output, 'a', encoding='utf-8') as f:
+        # 上次中断时可能写了半行，从新的一行开始
+        if f.tell() > 0:
+            with open(output, 'rb') as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b"\n":
+                    f.write("\n")
+        return runner.run(records, f, skip)
+
+
+def load_handler_class(mode):
+    """
+    按模式导入处理器类
+    
+    Args:
+        mode (str): 运行模式，未知模式按对话模式处理
+        
+    Returns:
+        type: 处理器类
+    """
+    module_name, class_name = HANDLERS.get(mode, HANDLERS["conversation"])
+    return getattr(importlib.import_module(module_name), class_name)
 
 
 @click.command()
@@ -29,35 +341,48 @@ from src.utils.mode_detector import detect_mode
               help='指定配置文件路径')
 @click.option('--verbose', '-v', is_flag=True, help='显示详细输出')
 @click.option('--debug', '-d', is_flag=True, help='启用调试模式')
-def main(query, mode, config, verbose, debug):
+@click.option('--terse', '-t', is_flag=True, help='简洁模式：只输出命令，代码块结束即停止生成')
+@click.option('--escalate', '-e', is_flag=True, help='跳过模型梯级，直接使用最高一级的模型')
+@click.option('--no-cache', is_flag=True, help='不读取也不写入响应缓存')
+@click.option('--refresh', is_flag=True, help='忽略已缓存的响应，重新请求并更新缓存')
+@click.option('--refresh-context', is_flag=True, hidden=True, help='刷新预热上下文快照（供 zsh precmd 钩子调用）')
+@click.option('--batch', type=click.Path(exists=True, dir_okay=False),
+              help='批量处理 JSONL 文件中的请求（每行 {"query": ..., "mode": ..., "file": ...}）')
+@click.option('--output', '-o', type=click.Path(dir_okay=False),
+              help='批量结果文件（JSONL），已有成功结果的记录在重新运行时跳过')
+@click.option('--concurrency', '-j', type=click.IntRange(min=1), help='批量处理的并发数')
+@click.option('--order', type=click.Choice(['input', 'completion']), help='批量结果按输入顺序还是完成顺序写出')
+def main(query, mode, config, verbose, debug, terse, escalate, no_cache, refresh, refresh_context,
+         batch, output, concurrency, order):
     """AI Terminal - 智能终端助手
     
     示例:
         ai 你好，请介绍一下自己
         ai 如何查找大于100MB的文件
         ai 解释 ls -la | grep "^d"
+        ai -t 查找大于100MB的文件
         ai 总结 ~/document.txt 的主要内容
+        ai --batch questions.jsonl -o results.jsonl -j 8
     """
-    # 加载配置
     config_path = config or os.path.expanduser("~/.ai_terminal/config.yaml")
-    try:
-        settings = load_config(config_path)
-    except Exception as e:
-        if debug:
-            click.echo(f"加载配置失败: {str(e)}", err=True)
-        settings = {}
     
-    # 初始化上下文管理器
-    context_manager = ContextManager(
-        max_history=settings.get('terminal', {}).get('max_history', 20)
-    )
+    if refresh_context:
+        settings = _load_settings(config_path, debug)
+        refresh_ready_context(config_path, settings.get('terminal'))
+        return
     
-    # 获取当前工作目录和环境变量
-    cwd = os.getcwd()
-    env_vars = {k: v for k, v in os.environ.items() if k.startswith('PATH') or k in ['HOME', 'USER', 'SHELL']}
-    context_manager.update_environment(env_vars=env_vars, cwd=cwd)
+    if batch:
+        try:
+            summary = _run_batch(batch, output, concurrency, order, config_path, mode, debug,
+                                 not no_cache, refresh)
+        except Exception as e:
+            click.echo(f"错误: {str(e)}", err=True)
+            sys.exit(1)
+        click.echo(f"批量处理完成: 成功 {summary['succeeded']}, 失败 {summary['failed']}, "
+                   f"跳过 {summary['skipped']}, 耗时 {summary['seconds']:.1f}s", err=True)
+        sys.exit(1 if summary['failed'] else 0)
     
-    # 如果没有输入，显示帮助信息
+    # 如果没有输入，显示帮助信息（无需加载配置和上下文）
     if not query:
         click.echo(main.get_help(click.Context(main)))
         return
@@ -65,28 +390,92 @@ def main(query, mode, config, verbose, debug):
     # 组合用户查询
     user_input = ' '.join(query)
     
+    # 启动流水线：配置、上下文、模式检测、环境探测和 API 连接预热并行进行
+    pipeline = InitPipeline()
+    pipeline.add("config", lambda: _load_settings(config_path, debug))
+    pipeline.add("ready", lambda: load_ready_context(config_path))
+    pipeline.add("context", lambda: _load_context(pipeline.result("config")), deps=["config"])
+    # 简洁模式只用于命令生成，未指定模式时直接使用命令模式
+    if terse and not mode:
+        mode = "command"
+    pipeline.add("mode", lambda forced=mode: _select_modes(user_input, forced, pipeline.result("config")),
+                 deps=["config"])
+    pipeline.add("system_info",
+                 lambda: _probe_system_info(pipeline.result("mode")["modes"], pipeline.result("ready")),
+                 deps=["mode", "ready"])
+    pipeline.add("client", lambda: _create_client(pipeline.result("config"), not no_cache, refresh),
+                 deps=["config"])
+    # 连接预热不阻塞请求：请求发出时若握手已完成则直接复用连接
+    pipeline.add("connect", lambda: pipeline.result("client").warm_up(), deps=["client"])
+    pipeline.start()
+    
     try:
+        settings = pipeline.result("config")
+        
+        # 预热快照有效时直接使用快照中的上下文，完整上下文在后台加载，更新上下文时才等待
+        ready = pipeline.result("ready")
+        if ready:
+            context_manager = PrewarmedContextManager(ready, lambda: pipeline.result("context"))
+            awaited = ["config", "ready", "mode", "system_info", "client"]
+        else:
+            context_manager = pipeline.result("context")
+            awaited = ["config", "context", "mode", "system_info", "client"]
+        selection = pipeline.result("mode")
+        modes = selection["modes"]
+        pipeline.result("system_info")
+        
         # 初始化 LLM 客户端
-        llm_client = MistralClient(settings.get('api', {}))
+        llm_client = pipeline.result("client")
+        
+        if verbose:
+            if len(modes) > 1:
+                click.echo(f"运行模式: {' / '.join(modes)}（置信度 {selection['confidence']:.2f}，同时尝试）", err=True)
+            else:
+                click.echo(f"运行模式: {modes[0]}", err=True)
+            click.echo("初始化阶段:", err=True)
+            for line in pipeline.report(awaited):
+                click.echo(line, err=True)
+        
+        # 根据模式选择处理器（默认为对话模式）；投机时第二个处理器使用共用连接池的独立客户端
+        handlers = []
+        for index, candidate in enumerate(modes):
+            client = llm_client if index == 0 else _create_client(settings, not no_cache, refresh, shared=llm_client)
+            handler = load_handler_class(candidate)(client, context_manager, settings)
+            handler.cache_policy = "off" if no_cache else "refresh" if refresh else "use"
+            if terse and hasattr(handler, 'terse'):
+                handler.terse = True
+            handler.escalate = escalate
+            handlers.append((candidate, handler))
+        
+        # 处理请求并输出结果：流式模式下边生成边输出，同时收集完整文本用于更新上下文
+        timing = {"start": time.perf_counter(), "first_token": None}
+        
+        def on_token(chunk):
+            if timing["first_token"] is None:
+                timing["first_token"] = time.perf_counter()
+            click.echo(chunk, nl=False)
+        
+        if len(handlers) > 1:
+            mode, handler, response = selection["speculation"].run(handlers, user_input, on_token)
+            llm_client = handler.llm_client
+        else:
+            mode, handler = handlers[0]
+            handler.on_token = on_token
+            response = handler.handle(user_input)
+        if handler.streamed:
+            click.echo()
+        else:
+            click.echo(response)
+        
+        reused = getattr(handler, 'reused', None)
+        if reused:
+            click.echo(f"（复用了相似请求「{reused['query']}」的结果，相似度 {reused['similarity']:.2f}；"
+                       f"使用 --refresh 重新生成）", err=True)
         
-        # 如果没有指定模式，自动检测
-        if not mode:
-            mode = detect_mode(user_input, context_manager.build_context_for_mistral())
-            
         if verbose:
-            click.echo(f"运行模式: {mode}", err=True)
-        
-        # 根据模式选择处理器
-        if mode == 'command':
-            handler = CommandHandler(llm_client, context_manager, settings)
-        elif mode == 'document':
-            handler = DocumentHandler(llm_client, context_manager, settings)
-        else:  # 默认为对话模式
-            handler = ConversationHandler(llm_client, context_manager, settings)
-        
-        # 处理请求并输出结果
-        response = handler.handle(user_input)
-        click.echo(response)
+            _report_request_stats(llm_client, timing)
+            _report_cascade_stats(llm_client, handler)
+            _report_speculation_stats(selection["speculation"])
         
         # 更新上下文
         context_manager.update_context(user_input, response, mode)
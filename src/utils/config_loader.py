@@ -5,8 +5,13 @@
 """
 
 import os
-import yaml
-from pathlib import Path
+import hashlib
+import marshal
+
+
+# 编译后的配置快照：与 config.yaml 同目录，避免每次启动都用纯 Python 解析 YAML
+SNAPSHOT_SUFFIX = ".snapshot"
+SNAPSHOT_VERSION = 1
 
 
 def load_config(config_path=None):
@@ -19,23 +24,131 @@ def load_config(config_path=None):
     Returns:
         dict: 配置参数
     """
+    config, _ = load_config_snapshot(config_path)
+    return config
+
+
+def load_config_snapshot(config_path=None):
+    """
+    通过编译快照加载配置
+    
+    快照以 marshal 格式保存解析后（尚未替换环境变量）的配置树，以配置文件的
+    mtime/size/inode 和所引用环境变量取值的哈希作为键。键匹配时直接加载快照，
+    否则重新解析 YAML、执行 validate_config 并原子地重写快照。
+    
+    Args:
+        config_path (str, optional): 配置文件路径
+        
+    Returns:
+        tuple: (配置参数, 验证错误列表)
+    """
     # 默认配置路径
     if not config_path:
         config_path = os.path.expanduser("~/.ai_terminal/config.yaml")
     
     # 如果配置文件不存在，创建默认配置
-    config_file = Path(config_path)
-    if not config_file.exists():
+    try:
+        stat = os.stat(config_path)
+    except FileNotFoundError:
         create_default_config(config_path)
+        stat = os.stat(config_path)
+    file_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    snapshot_path = config_path + SNAPSHOT_SUFFIX
+    snapshot = _read_snapshot(snapshot_path)
+    if (snapshot
+            and snapshot.get("version") == SNAPSHOT_VERSION
+            and tuple(snapshot.get("file_key", ())) == file_key
+            and snapshot.get("env_hash") == _hash_env_vars(snapshot.get("env_names", []))):
+        config = snapshot["config"]
+        process_env_vars(config)
+        return config, snapshot.get("errors", [])
     
-    # 读取配置文件
+    # 快照缺失或已过期：重新解析
+    import yaml
     with open(config_path, "r") as f:
-        config = yaml.safe_load(f)
+        raw_config = yaml.safe_load(f)
     
-    # 处理环境变量
+    env_names = sorted(collect_env_vars(raw_config))
+    try:
+        serialized = marshal.dumps(raw_config)
+    except ValueError:
+        # 含有 marshal 不支持的类型（如 YAML 日期），不使用快照
+        serialized = None
+    
+    config = marshal.loads(serialized) if serialized is not None else raw_config
     process_env_vars(config)
+    if isinstance(config, dict):
+        _, errors = validate_config(config)
+    else:
+        errors = ["配置文件格式无效"]
     
-    return config
+    if serialized is not None:
+        _write_snapshot(snapshot_path, {
+            "version": SNAPSHOT_VERSION,
+            "file_key": file_key,
+            "env_names": env_names,
+            "env_hash": _hash_env_vars(env_names),
+            "config": raw_config,
+            "errors": errors
+        })
+    
+    return config, errors
+
+
+def _read_snapshot(snapshot_path):
+    """
+    读取配置快照
+    
+    Args:
+        snapshot_path (str): 快照文件路径
+        
+    Returns:
+        dict: 快照内容，不存在或已损坏时返回 None
+    """
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return snapshot if isinstance(snapshot, dict) else None
+
+
+def _write_snapshot(snapshot_path, snapshot):
+    """
+    原子地写入配置快照（先写临时文件再重命名），失败时忽略
+    
+    Args:
+        snapshot_path (str): 快照文件路径
+        snapshot (dict): 快照内容
+    """
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump(snapshot, f)
+        os.replace(tmp_path, snapshot_path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def _hash_env_vars(env_names):
+    """
+    计算所引用环境变量当前取值的哈希
+    
+    Args:
+        env_names (list): 环境变量名列表
+        
+    Returns:
+        str: 哈希值
+    """
+    digest = hashlib.sha256()
+    for name in env_names:
+        digest.update(repr((name, os.environ.get(name))).encode("utf-8", "surrogateescape"))
+    return digest.hexdigest()
 
 
 def create_default_config(config_path):
@@ -73,6 +186,7 @@ def create_default_config(config_path):
     }
     
     # 写入配置文件
+    import yaml
     with open(config_path, "w") as f:
         yaml.dump(default_config, f, default_flow_style=False)
 
@@ -97,6 +211,30 @@ def process_env_vars(config):
                 process_env_vars(item)
 
 
+def collect_env_vars(config):
+    """
+    收集配置中引用的环境变量名（与 process_env_vars 的替换规则一致）
+    
+    Args:
+        config (dict): 配置参数
+        
+    Returns:
+        set: 环境变量名集合
+    """
+    names = set()
+    if isinstance(config, dict):
+        for value in config.values():
+            if isinstance(value, str) and value.startswith("${") and value.endswith("}"):
+                names.add(value[2:-1])
+            elif isinstance(value, (dict, list)):
+                names |= collect_env_vars(value)
+    elif isinstance(config, list):
+        for item in config:
+            if isinstance(item, (dict, list)):
+                names |= collect_env_vars(item)
+    return names
+
+
 def validate_config(config):
     """
     验证配置是否有效
@@ -8,6 +8,34 @@ import os
 import re
 
 
+# 无其他迹象时对话模式的基础分
+CONVERSATION_BASE = 1.0
+# 引用了存在的文件：同时有文档动作词时为强证据
+DOCUMENT_FILE_SCORE = 1.0
+DOCUMENT_VERB_SCORE = 2.0
+# 命中命令模式的规则为强证据，每多命中一条再加一点
+COMMAND_PATTERN_SCORE = 2.5
+COMMAND_EXTRA_PATTERN_SCORE = 0.5
+# 只是像命令相关的弱迹象（不改变检测结果，只降低置信度），最多计 COMMAND_HINT_LIMIT 个
+COMMAND_HINT_SCORE = 0.5
+COMMAND_HINT_LIMIT = 3
+
+COMMAND_PATTERNS = [
+    r'如何.*命令', r'怎么用.*命令', r'解释.*命令',
+    r'生成.*命令', r'运行.*命令', r'执行.*命令',
+    r'命令.*什么意思', r'command', r'cmd', r'shell',
+    r'如何在终端', r'help me', r'how to .*在终端',
+    r'terminal', r'console', r'怎样才能', r'写一个脚本'
+]
+
+COMMAND_HINTS = [
+    r'查找', r'搜索', r'列出', r'删除', r'复制', r'移动', r'重命名', r'压缩', r'解压',
+    r'安装', r'卸载', r'权限', r'进程', r'端口', r'磁盘', r'目录', r'文件夹', r'大于\s*\d',
+    r'\bfind\b', r'\bgrep\b', r'\bls\b', r'\bgit\b', r'\bdocker\b', r'\bkill\b',
+    r'\bchmod\b', r'`[^`]+`'
+]
+
+
 def detect_mode(user_input, current_context=None):
     """
     检测用户输入应该使用哪种模式处理
@@ -19,20 +47,46 @@ def detect_mode(user_input, current_context=None):
     Returns:
         str: 模式名称 (conversation, command, document)
     """
+    return rank_modes(user_input, current_context)[0][0]
+
+
+def rank_modes(user_input, current_context=None):
+    """
+    检测用户输入应该使用哪种模式处理，并给出各模式的置信度
+    
+    Args:
+        user_input (str): 用户输入
+        current_context (dict): 当前上下文
+        
+    Returns:
+        list: [(模式, 置信度)]，第一项为检测结果，其余按置信度从高到低排列；置信度之和为 1
+    """
+    evidence = {"conversation": CONVERSATION_BASE, "command": 0.0, "document": 0.0}
+    
     # 如果包含文件路径并且文件存在，可能是文档模式
     file_paths = extract_potential_file_paths(user_input)
-    for file_path in file_paths:
-        if os.path.exists(file_path):
-            # 检查是否有文档相关的动作词
-            if has_document_action_verb(user_input):
-                return "document"
+    has_file = any(os.path.exists(file_path) for file_path in file_paths)
+    has_verb = has_file and has_document_action_verb(user_input)
+    if has_file:
+        evidence["document"] += DOCUMENT_FILE_SCORE + (DOCUMENT_VERB_SCORE if has_verb else 0.0)
     
     # 检测是否是命令相关的请求
-    if is_command_related(user_input):
-        return "command"
+    matched = count_command_patterns(user_input)
+    if matched:
+        evidence["command"] += COMMAND_PATTERN_SCORE + COMMAND_EXTRA_PATTERN_SCORE * (matched - 1)
+    evidence["command"] += COMMAND_HINT_SCORE * min(count_command_hints(user_input), COMMAND_HINT_LIMIT)
     
-    # 默认为对话模式
-    return "conversation"
+    # 检测结果：有文档动作词的文件引用优先，其次是命令相关的请求，默认为对话模式
+    if has_verb:
+        mode = "document"
+    elif matched:
+        mode = "command"
+    else:
+        mode = "conversation"
+    
+    total = sum(evidence.values())
+    others = sorted((name for name in evidence if name != mode), key=lambda name: -evidence[name])
+    return [(name, evidence[name] / total) for name in [mode] + others]
 
 
 def extract_potential_file_paths(text):
@@ -96,17 +150,33 @@ def is_command_related(text):
     Returns:
         bool: 是否与命令相关
     """
-    # 命令相关的模式
-    command_patterns = [
-        r'如何.*命令', r'怎么用.*命令', r'解释.*命令',
-        r'生成.*命令', r'运行.*命令', r'执行.*命令',
-        r'命令.*什么意思', r'command', r'cmd', r'shell',
-        r'如何在终端', r'help me', r'how to .*在终端',
-        r'terminal', r'console', r'怎样才能', r'写一个脚本'
-    ]
+    return count_command_patterns(text) > 0
+
+
+def count_command_patterns(text):
+    """
+    统计文本命中的命令相关模式数
     
+    Args:
+        text (str): 输入文本
+        
+    Returns:
+        int: 命中的模式数
+    """
     # 将文本转换为小写以进行不区分大小写的匹配
     text_lower = text.lower()
+    return sum(1 for pattern in COMMAND_PATTERNS if re.search(pattern, text_lower))
+
+
+def count_command_hints(text):
+    """
+    统计文本中像是命令相关的弱迹象（常见的文件、进程操作和命令名）
     
-    # 检查是否匹配任何命令相关的模式
-    return any(re.search(pattern, text_lower) for pattern in command_patterns)
+    Args:
+        text (str): 输入文本
+        
+    Returns:
+        int: 命中的迹象数
+    """
+    text_lower = text.lower()
+    return sum(1 for pattern in COMMAND_HINTS if re.search(pattern, text_lower))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+系统信息探测模块
+获取 macOS 和 zsh 版本等需要启动子进程才能得到的环境信息
+"""
+
+import subprocess
+from functools import lru_cache
+
+# 需要探测的系统信息及对应命令
+SYSTEM_PROBES = {
+    "macos_version": ["sw_vers", "-productVersion"],
+    "zsh_version": ["zsh", "--version"],
+}
+
+# 由预热快照等外部来源提供的结果，优先于实际探测
+_seeded = {}
+
+
+@lru_cache(maxsize=None)
+def _probe(key):
+    """
+    执行单个探测命令（每个进程只执行一次）
+
+    Args:
+        key (str): SYSTEM_PROBES 中的键
+
+    Returns:
+        str: 命令输出，失败时为 "Unknown"
+    """
+    try:
+        process = subprocess.run(SYSTEM_PROBES[key], capture_output=True, text=True, check=False)
+        return process.stdout.strip() if process.returncode == 0 else "Unknown"
+    except Exception:
+        return "Unknown"
+
+
+def get_system_versions():
+    """
+    获取系统版本信息
+
+    Returns:
+        dict: 包含 macos_version 和 zsh_version 的字典
+    """
+    return {key: _seeded.get(key) or _probe(key) for key in SYSTEM_PROBES}
+
+
+def seed_system_versions(versions):
+    """
+    使用已知的系统版本信息，避免再次启动子进程探测
+
+    Args:
+        versions (dict): 与 get_system_versions 返回值格式相同的字典
+    """
+    _seeded.update({key: value for key, value in versions.items() if key in SYSTEM_PROBES})
@@ -25,6 +25,10 @@ def install_zsh_integration():
 # AI Terminal 集成
 # 添加于 $(date)
 
+# 终端会话标识：每个终端（如 tmux 的每个窗格）的对话历史分开保存，ai 调用、守护进程和预热快照都使用它；
+# 不沿用继承的值（tmux 新窗格会继承启动它的 shell 的环境），需要自定义时在此之后重新设置
+export AI_TERMINAL_SESSION="$TTY"
+
 # AI 命令函数
 ai() {
   local ai_terminal_cmd
@@ -34,6 +38,15 @@ ai() {
     ai_terminal_cmd="python -m src.main"
   fi
   
+  # 守护进程运行时由瘦客户端转发请求，退出码 75 表示守护进程不可用
+  if [ -S "$HOME/.ai_terminal/daemon.sock" ] && [ -f "$HOME/.ai_terminal/bin/ai_client" ]; then
+    python3 -I -S "$HOME/.ai_terminal/bin/ai_client" "$@"
+    local ret=$?
+    if [ $ret -ne 75 ]; then
+      return $ret
+    fi
+  fi
+  
   if [ "$#" -eq 0 ]; then
     $ai_terminal_cmd
   else
@@ -41,6 +54,11 @@ ai() {
   fi
 }
 
+# 守护进程管理: ai_daemon start|stop|status
+ai_daemon() {
+  "$HOME/.ai_terminal/bin/ai_terminald" "$@"
+}
+
 # 命令捕获钩子
 # 用于收集历史命令和环境信息
 ai_terminal_preexec() {
@@ -53,6 +71,33 @@ if [[ ! " ${preexec_functions[@]} " =~ " ai_terminal_preexec " ]]; then
   preexec_functions+=(ai_terminal_preexec)
 fi
 
+# 预热上下文快照：每次提示符出现前在后台刷新（去抖），ai 调用时直接读取
+zmodload zsh/datetime 2>/dev/null
+ai_terminal_precmd() {
+  local refresh_cmd="$HOME/.ai_terminal/bin/ai_terminal"
+  [[ -x "$refresh_cmd" ]] || return
+  
+  # 工作目录未变且 2 秒内刚刷新过时跳过；刚执行过 ai 时历史已变化，总是刷新
+  if [[ -z "$_ai_terminal_force_refresh" && "$PWD" == "$_ai_terminal_ready_pwd" ]] && \\
+     (( EPOCHSECONDS - ${_ai_terminal_ready_time:-0} < 2 )); then
+    return
+  fi
+  _ai_terminal_ready_pwd="$PWD"
+  _ai_terminal_ready_time=$EPOCHSECONDS
+  unset _ai_terminal_force_refresh
+  
+  { "$refresh_cmd" --refresh-context } &>/dev/null &!
+}
+
+ai_terminal_mark_refresh() {
+  [[ "$1" == ai(| *) ]] && _ai_terminal_force_refresh=1
+}
+
+if [[ ! " ${precmd_functions[@]} " =~ " ai_terminal_precmd " ]]; then
+  precmd_functions+=(ai_terminal_precmd)
+  preexec_functions+=(ai_terminal_mark_refresh)
+fi
+
 # 环境信息收集
 ai_terminal_update_env() {
   # 每小时更新一次环境信息
@@ -202,3 +202,11 @@ def test_files(temp_dir):
         "config_file": config_file,
         "multilingual_file": multilingual_file
     }
+
+
+@pytest.fixture
+def fake_server():
+    """启动本地模拟的 Chat Completions 服务"""
+    from tests.fake_server import FakeChatServer
+    with FakeChatServer() as server:
+        yield server
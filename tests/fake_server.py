@@ -0,0 +1,237 @@
+"""
+本地模拟的 Chat Completions 服务
+兼容 Mistral / OpenAI 的 /v1/chat/completions 接口，可注入延迟、错误和连接中断，
+供需要真实 HTTP 往返的测试使用
+"""
+
+import gzip
+import json
+import time
+import socket
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeChatServer:
+    """在后台线程运行的模拟服务
+
+    属性:
+        reply: 回复文本，或接收请求体返回回复文本的函数
+        delay: 返回响应头之前的延迟(秒)
+        delays: 依次消耗的单次请求延迟(秒)，消耗完后使用 delay
+        chunk_delay: 流式响应中每个片段之间的延迟(秒)
+        chunk_size: 流式响应每个片段的字符数
+        fail_statuses: 依次消耗的错误状态码，消耗完后正常响应
+        retry_after: 注入的错误响应携带的 Retry-After 头（秒）
+        cut_after: 流式响应发送该数量的片段后直接断开连接（依次消耗的列表）
+        echo_prefix: 续传请求（末尾为 prefix=True 的 assistant 消息）是否先重复输出前缀
+        accept_encodings: 接受的请求体编码，其他编码返回 415 并在 Accept-Encoding 中列出；
+            为 None 时模拟忽略 Content-Encoding 的服务（压缩的请求体无法解析，返回 400）
+        connect_delay: 每个新连接建立时的延迟(秒)，用于模拟 TCP/TLS 握手的耗时
+        connections: 已建立的连接数
+        requests: 已收到的请求（headers 和解析后的 body）
+    """
+
+    def __init__(self, reply="你好，这是模拟回复。"):
+        self.reply = reply
+        self.delay = 0.0
+        self.delays = []
+        self.chunk_delay = 0.0
+        self.chunk_size = 4
+        self.fail_statuses = []
+        self.retry_after = None
+        self.cut_after = []
+        self.echo_prefix = True
+        # 按 max_tokens（每 4 个字符算一个 token）截断回复并返回 finish_reason "length"
+        self.enforce_max_tokens = False
+        self.accept_encodings = ("gzip", "deflate")
+        self.connect_delay = 0.0
+        self.connections = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _next(self, queue):
+        with self._lock:
+            return queue.pop(0) if queue else None
+
+    def render_reply(self, body):
+        return self.reply(body) if callable(self.reply) else self.reply
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                # 流式响应由许多小块组成，关闭 Nagle 算法避免与延迟确认叠加出额外延迟
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with server._lock:
+                    server.connections += 1
+                if server.connect_delay:
+                    time.sleep(server.connect_delay)
+
+            def do_HEAD(self):
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                encoding = self.headers.get("Content-Encoding", "identity")
+                if server.accept_encodings is not None and encoding not in ("identity",) + tuple(server.accept_encodings):
+                    server.requests.append({"headers": dict(self.headers), "body": None, "raw_size": len(raw)})
+                    self._send_json(415, {"message": f"unsupported encoding {encoding}"},
+                                    {"Accept-Encoding": ", ".join(server.accept_encodings) or "identity"})
+                    return
+                body = server.decode_body(self.headers, raw)
+                server.requests.append({"headers": dict(self.headers), "body": body, "raw_size": len(raw)})
+
+                delay = server._next(server.delays)
+                delay = server.delay if delay is None else delay
+                if delay:
+                    time.sleep(delay)
+
+                status = server._next(server.fail_statuses)
+                if status:
+                    headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else None
+                    self._send_json(status, {"message": f"injected error {status}"}, headers)
+                    return
+                if body is None:
+                    self._send_json(400, {"message": "invalid body"})
+                    return
+
+                text = server.continue_reply(body, server.render_reply(body))
+                finish_reason = "stop"
+                max_chars = (body.get("max_tokens") or 0) * 4
+                if server.enforce_max_tokens and max_chars and len(text) > max_chars:
+                    text, finish_reason = text[:max_chars], "length"
+                if body.get("stream"):
+                    self._stream(body, text, finish_reason)
+                else:
+                    self._send_json(200, server.completion(body, text, finish_reason))
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body, text, finish_reason="stop"):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                cut_after = server._next(server.cut_after)
+                pieces = [text[i:i + server.chunk_size] for i in range(0, len(text), server.chunk_size)]
+                for index, piece in enumerate(pieces):
+                    if cut_after is not None and index >= cut_after:
+                        # 不发送结束块直接断开，客户端会看到不完整的响应体
+                        self.close_connection = True
+                        self.wfile.flush()
+                        self.connection.shutdown(2)
+                        return
+                    if server.chunk_delay:
+                        time.sleep(server.chunk_delay)
+                    self._event(server.chunk(body, piece, None))
+                self._event(server.chunk(body, "", finish_reason, usage=server.usage(body, text)))
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _event(self, payload):
+                self._write_chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def continue_reply(self, body, text):
+        """续传请求只生成前缀之后的部分，按 echo_prefix 决定是否重复输出前缀"""
+        messages = body.get("messages") or [{}]
+        last = messages[-1]
+        if last.get("role") != "assistant" or not last.get("prefix"):
+            return text
+        prefix = last.get("content", "")
+        tail = text[len(prefix):] if text.startswith(prefix) else text
+        return prefix + tail if self.echo_prefix else tail
+
+    def decode_body(self, headers, raw):
+        """解析请求体，按 Content-Encoding 解压（accept_encodings 为 None 时忽略编码）"""
+        encoding = headers.get("Content-Encoding", "identity")
+        try:
+            if self.accept_encodings is not None and encoding == "gzip":
+                raw = gzip.decompress(raw)
+            elif self.accept_encodings is not None and encoding == "deflate":
+                raw = zlib.decompress(raw)
+            return json.loads(raw)
+        except (ValueError, OSError, zlib.error):
+            return None
+
+    @staticmethod
+    def usage(body, text):
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4 + 1
+        completion_tokens = len(text) // 4 + 1
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    def completion(self, body, text, finish_reason="stop"):
+        return {
+            "id": "cmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-model"),
+            "usage": self.usage(body, text),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": finish_reason
+            }]
+        }
+
+    @staticmethod
+    def chunk(body, piece, finish_reason, usage=None):
+        payload = {
+            "id": "cmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-model"),
+            "choices": [{
+                "index": 0,
+                "delta": {"role": "assistant", "content": piece},
+                "finish_reason": finish_reason
+            }]
+        }
+        if usage:
+            payload["usage"] = usage
+        return payload
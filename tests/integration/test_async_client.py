@@ -0,0 +1,77 @@
+import time
+import asyncio
+import pytest
+from src.core.async_llm_client import AsyncMistralClient
+from src.core.request_policy import LatencyTracker, RequestPolicy
+
+
+class TestAsyncMistralClient:
+    @pytest.fixture
+    def make_client(self, fake_server, temp_dir):
+        def make(**kwargs):
+            client = AsyncMistralClient({"api_key": "test_key", "server_url": fake_server.url}, **kwargs)
+            client.policy = RequestPolicy(timeout=5.0, max_retries=2, retry_delay=0.01,
+                                          latency=LatencyTracker(f"{temp_dir}/latency.json"))
+            return client
+        return make
+
+    def test_turns_reuse_one_connection(self, make_client, fake_server):
+        fake_server.connect_delay = 0.05
+
+        async def session():
+            async with make_client() as client:
+                replies = []
+                for _ in range(5):
+                    start = time.perf_counter()
+                    replies.append("".join([c async for c in client.stream([{"role": "user", "content": "你好"}])]))
+                    replies.append(time.perf_counter() - start)
+                return replies
+
+        results = asyncio.run(session())
+        assert results[0::2] == [fake_server.reply] * 5
+        assert fake_server.connections == 1
+        # 只有第一轮需要握手
+        assert max(results[3::2]) < 0.05
+
+    def test_concurrent_completions(self, make_client, fake_server):
+        fake_server.delay = 0.2
+
+        async def burst():
+            async with make_client(max_connections=4) as client:
+                messages = [[{"role": "user", "content": f"问题 {i}"}] for i in range(8)]
+                return await asyncio.gather(*(client.complete(m) for m in messages))
+
+        start = time.perf_counter()
+        replies = asyncio.run(burst())
+        assert replies == [fake_server.reply] * 8
+        assert time.perf_counter() - start < 1.2
+        assert fake_server.connections <= 4
+
+    def test_retries_and_resumes(self, make_client, fake_server):
+        fake_server.fail_statuses = [503]
+        fake_server.cut_after = [1]
+        fake_server.reply = "这是一段会在中途断开然后续传的回复。"
+
+        async def run():
+            async with make_client() as client:
+                text = "".join([c async for c in client.stream([{"role": "user", "content": "你好"}])])
+                return text, client.last_resumes
+
+        assert asyncio.run(run()) == (fake_server.reply, 1)
+        assert len(fake_server.requests) == 3
+
+    def test_hedged_completion(self, make_client, fake_server):
+        async def run():
+            async with make_client() as client:
+                client.policy.hedge = True
+                for _ in range(10):
+                    client.policy.latency.record("complete", 0.05)
+                start = time.perf_counter()
+                reply = await client.complete([{"role": "user", "content": "你好"}])
+                return reply, time.perf_counter() - start, client.policy.last_stats
+
+        fake_server.delays = [3.0]
+        reply, elapsed, stats = asyncio.run(run())
+        assert reply == fake_server.reply
+        assert elapsed < 1.5
+        assert stats["hedge_won"]
@@ -0,0 +1,88 @@
+import os
+import pytest
+from src.core.llm_client import MistralClient
+from src.core.endpoint_selector import EndpointSelector
+from tests.fake_server import FakeChatServer
+
+
+@pytest.fixture
+def servers():
+    """两个模拟服务：slow 的响应延迟 150ms，fast 的响应延迟 10ms"""
+    with FakeChatServer("慢速端点的回复") as slow, FakeChatServer("快速端点的回复") as fast:
+        slow.delay = 0.15
+        fast.delay = 0.01
+        yield slow, fast
+
+
+def make_client(servers, temp_dir):
+    slow, fast = servers
+    client = MistralClient({
+        "api_key": "test_key",
+        "endpoints": [
+            {"name": "slow", "type": "mistral", "server_url": slow.url},
+            {"name": "fast", "type": "openai", "base_url": fast.url + "/v1", "api_key": "gateway_key",
+             "model": "local-model"}
+        ]
+    })
+    client.policy.retry_delay = 0.01
+    client.selector = EndpointSelector(["slow", "fast"], path=os.path.join(temp_dir, "endpoints.json"))
+    return client
+
+
+class TestBackends:
+    def test_routes_to_fastest_endpoint(self, servers, temp_dir):
+        slow, fast = servers
+        client = make_client(servers, temp_dir)
+
+        # 前两次请求分别探测两个端点，之后都发往更快的端点
+        replies = [client.generate_response("你好") for _ in range(5)]
+        assert replies[0] == "慢速端点的回复"
+        assert replies[1:] == ["快速端点的回复"] * 4
+        assert (len(slow.requests), len(fast.requests)) == (1, 4)
+        assert client.last_backend == "fast"
+
+        request = fast.requests[-1]
+        assert request["headers"]["Authorization"] == "Bearer gateway_key"
+        assert request["body"]["model"] == "local-model"
+
+    def test_streaming_uses_openai_backend(self, servers, temp_dir):
+        slow, fast = servers
+        client = make_client(servers, temp_dir)
+        client.selector.record("fast", "stream", 0.01)
+        client.selector.record("slow", "stream", 0.15)
+
+        chunks = list(client.generate_streaming_response("你好"))
+        assert "".join(chunks) == "快速端点的回复"
+        assert len(chunks) > 1
+        assert client.last_finish_reason == "stop"
+        assert client.last_usage["completion_tokens"] > 0
+        body = fast.requests[-1]["body"]
+        assert body["stream"] is True and body["stream_options"] == {"include_usage": True}
+
+    def test_fails_over_without_waiting_for_retry(self, servers, temp_dir):
+        slow, fast = servers
+        client = make_client(servers, temp_dir)
+        client.selector.record("fast", "complete", 0.01)
+        client.selector.record("slow", "complete", 0.15)
+        fast.fail_statuses = [503, 503, 503]
+
+        # 每次请求都在快速端点失败后立即切换到慢速端点，不经过重试等待
+        for _ in range(3):
+            assert client.generate_response("你好") == "慢速端点的回复"
+            assert client.policy.last_stats["attempts"] == 1
+        # 持续出错使快速端点的得分高于慢速端点，后续请求先发往慢速端点
+        assert client.selector.ranked("complete") == ["slow", "fast"]
+
+    def test_continuation_prefix_is_sent_as_trailing_assistant_message(self, servers, temp_dir):
+        slow, fast = servers
+        client = make_client(servers, temp_dir)
+        client.selector.record("fast", "stream", 0.01)
+        client.selector.record("slow", "stream", 0.15)
+        fast.chunk_size = 2
+        fast.cut_after = [2]
+        fast.echo_prefix = False
+
+        assert "".join(client.generate_streaming_response("你好")) == "快速端点的回复"
+        messages = [r["body"]["messages"] for r in fast.requests]
+        assert messages[-1][-1]["role"] == "assistant"
+        assert "prefix" not in messages[-1][-1]
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import time
+import subprocess
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+CONFIG = """
+api:
+  provider: "mistral"
+  model: "mistral-small-latest"
+  api_key: "test_key"
+  server_url: "{url}"
+mistral:
+  stream: false
+advanced:
+  max_retries: 0
+  request_timeout: 10
+cascade:
+  enabled: false
+"""
+
+
+def reply(body):
+    """回答中带上问题的最后一部分，便于核对结果与记录的对应关系"""
+    return "回答：" + body["messages"][-1]["content"][-6:]
+
+
+class TestBatch:
+    @pytest.fixture
+    def env(self, fake_server, tmp_path):
+        fake_server.reply = reply
+        home = tmp_path / "home"
+        (home / ".ai_terminal").mkdir(parents=True)
+        config = tmp_path / "config.yaml"
+        config.write_text(CONFIG.format(url=fake_server.url), encoding="utf-8")
+        return {"env": dict(os.environ, HOME=str(home), PYTHONPATH=PROJECT_ROOT), "config": str(config)}
+
+    def run(self, env, tmp_path, records, *args):
+        batch = tmp_path / "requests.jsonl"
+        batch.write_text("".join(
+            (record if isinstance(record, str) else json.dumps(record, ensure_ascii=False)) + "\n" for record in records
+        ), encoding="utf-8")
+        return subprocess.run(
+            [sys.executable, "-m", "src.main", "--config", env["config"], "--batch", str(batch), *args],
+            cwd=PROJECT_ROOT, env=env["env"], capture_output=True, text=True, timeout=60
+        )
+
+    @staticmethod
+    def results(text):
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    def test_runs_concurrently_in_input_order(self, env, fake_server, tmp_path):
+        fake_server.delays = [0.6] + [0.3] * 7
+        records = [{"query": f"你好，第{i:02d}个问题", "id": f"q{i}"} for i in range(8)]
+
+        start = time.perf_counter()
+        result = self.run(env, tmp_path, records, "-j", "4", "--no-cache")
+        elapsed = time.perf_counter() - start
+        assert result.returncode == 0, result.stderr
+
+        results = self.results(result.stdout)
+        assert [r["index"] for r in results] == list(range(8))
+        assert [r["id"] for r in results] == [f"q{i}" for i in range(8)]
+        assert all(r["response"].startswith("回答：") and r["error"] is None for r in results)
+        assert all(r["mode"] == "conversation" and r["latency"] > 0 for r in results)
+        assert all(r["usage"]["completion_tokens"] > 0 for r in results)
+        # 8 个请求串行至少需要 2.7 秒；所有工作线程共用连接池
+        assert elapsed < 2.7 + 2.0
+        assert fake_server.connections <= 4
+        assert "成功 8" in result.stderr
+
+    def test_completion_order(self, env, fake_server, tmp_path):
+        fake_server.delays = [1.0, 0, 0]
+        records = [{"query": f"你好，第{i}个问题"} for i in range(3)]
+        result = self.run(env, tmp_path, records, "-j", "3", "--order", "completion", "--no-cache")
+        # 最先到达的请求最慢，完成顺序下最后写出
+        results = self.results(result.stdout)
+        assert sorted(r["index"] for r in results) == [0, 1, 2]
+        assert results[-1]["latency"] >= 1.0
+        assert all(r["latency"] < 1.0 for r in results[:-1])
+
+    def test_errors_are_recorded(self, env, fake_server, tmp_path):
+        fake_server.fail_statuses = [400]
+        records = [{"query": "你好"}, "不是 JSON", {"mode": "conversation"}, {"query": "再见"}]
+        result = self.run(env, tmp_path, records, "-j", "1", "--no-cache")
+        assert result.returncode == 1
+
+        results = self.results(result.stdout)
+        assert [r["error"] is None for r in results] == [False, False, False, True]
+        assert "400" in results[0]["error"]
+        assert "无效的记录" in results[1]["error"]
+
+    def test_resumes_from_existing_output(self, env, fake_server, tmp_path):
+        records = [{"query": f"你好，第{i}个问题"} for i in range(5)]
+        output = tmp_path / "results.jsonl"
+        # 模拟中途崩溃：两条成功、一条失败、最后一行只写了一半
+        output.write_text(
+            json.dumps({"index": 0, "query": records[0]["query"], "response": "旧结果", "error": None},
+                       ensure_ascii=False) + "\n" +
+            json.dumps({"index": 1, "query": records[1]["query"], "response": "旧结果", "error": None},
+                       ensure_ascii=False) + "\n" +
+            json.dumps({"index": 2, "query": records[2]["query"], "response": None, "error": "TimeoutError"},
+                       ensure_ascii=False) + "\n" +
+            '{"index": 3, "query": "你好',
+            encoding="utf-8"
+        )
+
+        result = self.run(env, tmp_path, records, "-o", str(output), "--no-cache")
+        assert result.returncode == 0, result.stderr
+        assert len(fake_server.requests) == 3
+        assert "跳过 2" in result.stderr
+
+        lines = output.read_text(encoding="utf-8").splitlines()
+        assert lines[3] == '{"index": 3, "query": "你好'
+        completed = [json.loads(line) for line in lines[4:]]
+        assert [r["index"] for r in completed] == [2, 3, 4]
+
+        # 全部完成后再次运行不发出任何请求
+        result = self.run(env, tmp_path, records, "-o", str(output), "--no-cache")
+        assert len(fake_server.requests) == 3
+        assert "跳过 5" in result.stderr
+
+    def test_file_records_use_document_mode(self, env, fake_server, tmp_path):
+        notes = tmp_path / "notes.txt"
+        notes.write_text("部署步骤：先构建镜像，再滚动更新。", encoding="utf-8")
+        result = self.run(env, tmp_path, [{"query": "总结", "file": str(notes)}], "--no-cache")
+        assert result.returncode == 0, result.stderr
+
+        [item] = self.results(result.stdout)
+        assert item["mode"] == "document" and item["file"] == str(notes)
+        assert "滚动更新" in json.dumps(fake_server.requests[-1]["body"], ensure_ascii=False)
@@ -0,0 +1,58 @@
+import os
+import sys
+import subprocess
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+CONFIG = """
+api:
+  api_key: "test_key"
+  server_url: "{url}"
+advanced:
+  max_retries: 0
+  single_flight: false
+cache:
+  enabled: true
+  directory: "{cache_dir}"
+"""
+
+
+class TestCachedRepeat:
+    @pytest.fixture
+    def run(self, fake_server, tmp_path):
+        fake_server.reply = "`ps aux` 列出所有用户的全部进程。"
+        home = tmp_path / "home"
+        (home / ".ai_terminal").mkdir(parents=True)
+        config = tmp_path / "config.yaml"
+        config.write_text(CONFIG.format(url=fake_server.url, cache_dir=tmp_path / "cache"), encoding="utf-8")
+
+        def run(session, *args):
+            env = dict(os.environ, HOME=str(home), PYTHONPATH=PROJECT_ROOT, AI_TERMINAL_SESSION=session)
+            result = subprocess.run([sys.executable, "-m", "src.main", "--config", str(config), *args],
+                                    cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=60)
+            assert result.returncode == 0, result.stderr
+            return result
+        return run
+
+    def test_repeated_query_is_served_from_cache(self, run, fake_server):
+        """历史相同（新会话）时重复同样的请求命中缓存，请求本身不同时不命中"""
+        run("pane-1", "解释", "ps", "aux")
+        second = run("pane-2", "解释", "ps", "aux")
+        assert len(fake_server.requests) == 1
+        assert "列出所有用户的全部进程" in second.stdout
+
+        run("pane-3", "解释", "top", "命令")
+        assert len(fake_server.requests) == 2
+
+    def test_same_input_with_different_history_misses(self, run, fake_server):
+        """依赖上下文的追问在不同的对话中回答不同，历史不同时不复用缓存"""
+        run("pane-1", "解释", "ps", "aux")
+        run("pane-2", "解释", "top", "命令")
+        fake_server.reply = "因为它读取 /proc 中的进程信息。"
+        run("pane-1", "为什么？")
+        run("pane-2", "为什么？")
+        assert len(fake_server.requests) == 4
+
+        last = [m["content"] for m in fake_server.requests[-1]["body"]["messages"] if m["role"] == "user"]
+        assert last[0] == "解释 top 命令"
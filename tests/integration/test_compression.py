@@ -0,0 +1,92 @@
+import pytest
+from src.core.compression import RequestCompressor
+from src.core.llm_client import MistralClient
+from src.core.request_policy import LatencyTracker, RequestPolicy
+
+# 约 300KB 的日志文本，重复度高，压缩后应远小于原始大小
+LOG = "".join(f"2024-01-01 12:00:{i % 60:02d} INFO worker-{i % 8} handled request {i}\n" for i in range(5000))
+
+
+class TestRequestCompression:
+    @pytest.fixture
+    def client(self, fake_server, temp_dir):
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+        client.policy = RequestPolicy(timeout=5.0, max_retries=0, latency=LatencyTracker(f"{temp_dir}/latency.json"))
+        client.compressor = RequestCompressor(threshold=64 * 1024, path=f"{temp_dir}/compression.json")
+        return client
+
+    def test_large_body_is_gzipped(self, client, fake_server):
+        assert client.generate_response(LOG) == fake_server.reply
+
+        request = fake_server.requests[-1]
+        assert request["headers"]["Content-Encoding"] == "gzip"
+        assert request["body"]["messages"][-1]["content"] == LOG
+        stats = client.compressor.last_stats
+        assert stats["encoding"] == "gzip"
+        assert stats["sent_bytes"] == request["raw_size"] < stats["raw_bytes"] / 5
+        assert client.compressor.stats["totals"]["gzip"]["requests"] == 1
+
+    def test_small_body_is_sent_as_is(self, client, fake_server):
+        client.generate_response("你好")
+        assert "Content-Encoding" not in fake_server.requests[-1]["headers"]
+        assert client.compressor.last_stats is None
+
+    def test_streaming_body_is_gzipped(self, client, fake_server):
+        assert "".join(client.generate_streaming_response(LOG)) == fake_server.reply
+        assert fake_server.requests[-1]["headers"]["Content-Encoding"] == "gzip"
+
+    def test_negotiates_encoding_from_415(self, client, fake_server, temp_dir):
+        fake_server.accept_encodings = ("deflate",)
+
+        assert client.generate_response(LOG) == fake_server.reply
+        encodings = [r["headers"].get("Content-Encoding") for r in fake_server.requests]
+        assert encodings == ["gzip", "deflate"]
+        assert client.compressor.last_stats["encoding"] == "deflate"
+
+        # 协商结果写入磁盘，新进程直接使用 deflate
+        compressor = RequestCompressor(threshold=64 * 1024, path=f"{temp_dir}/compression.json")
+        assert compressor.encoding_for(fake_server.url + "/v1/chat/completions", len(LOG)) == "deflate"
+
+    def test_falls_back_to_identity_when_nothing_accepted(self, client, fake_server):
+        fake_server.accept_encodings = ()
+
+        assert client.generate_response(LOG) == fake_server.reply
+        client.generate_response(LOG)
+        encodings = [r["headers"].get("Content-Encoding") for r in fake_server.requests]
+        assert encodings == ["gzip", None, None]
+
+    def test_server_ignoring_encoding_gets_uncompressed_retry(self, client, fake_server):
+        # 不认识 Content-Encoding 的服务无法解析压缩后的请求体，返回 400
+        fake_server.accept_encodings = None
+
+        assert client.generate_response(LOG) == fake_server.reply
+        client.generate_response(LOG)
+        encodings = [r["headers"].get("Content-Encoding") for r in fake_server.requests]
+        assert encodings == ["gzip", None, None]
+        assert client.compressor.last_stats["encoding"] == "identity"
+
+    def test_real_bad_request_does_not_disable_compression(self, client, fake_server):
+        fake_server.fail_statuses = [400, 400]
+
+        with pytest.raises(Exception):
+            client.generate_response(LOG)
+        client.generate_response(LOG)
+        assert fake_server.requests[-1]["headers"]["Content-Encoding"] == "gzip"
+
+    @pytest.mark.parametrize("endpoint", [
+        {"type": "mistral", "server_url": "http://api.upstream.invalid"},
+        {"type": "openai", "base_url": "http://api.upstream.invalid/v1"},
+    ])
+    def test_environment_proxy_is_used(self, fake_server, temp_dir, monkeypatch, endpoint):
+        """压缩请求体时仍然通过环境变量中的代理连接（模拟服务充当代理，API 地址本身无法解析）"""
+        for name in ("NO_PROXY", "no_proxy", "ALL_PROXY", "all_proxy", "http_proxy"):
+            monkeypatch.delenv(name, raising=False)
+        monkeypatch.setenv("HTTP_PROXY", fake_server.url)
+        client = MistralClient({"api_key": "test_key", "endpoints": [{"name": "upstream", **endpoint}]})
+        client.policy = RequestPolicy(timeout=5.0, max_retries=0, latency=LatencyTracker(f"{temp_dir}/latency.json"))
+        client.compressor = RequestCompressor(threshold=64 * 1024, path=f"{temp_dir}/compression.json")
+
+        assert client.generate_response(LOG) == fake_server.reply
+        request = fake_server.requests[-1]
+        assert request["headers"]["Content-Encoding"] == "gzip"
+        assert request["headers"]["Host"] == "api.upstream.invalid"
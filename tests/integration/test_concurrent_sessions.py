@@ -0,0 +1,142 @@
+import os
+import re
+import sys
+import json
+import time
+import subprocess
+import threading
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+CONFIG = """
+api:
+  api_key: "test_key"
+  server_url: "{url}"
+mistral:
+  stream: false
+terminal:
+  context_backend: "{backend}"
+advanced:
+  max_retries: 0
+cache:
+  enabled: false
+speculation:
+  enabled: false
+"""
+
+# 模拟一次 ai 调用的上下文读写：加载上下文、请求模拟服务、记录这一轮并保存，输出每轮读写上下文的耗时
+WRITER = """
+import sys, json, time, urllib.request
+from src.core.context_manager import ContextManager
+
+url, rounds, backend = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+timings = []
+for index in range(rounds):
+    start = time.perf_counter()
+    manager = ContextManager.from_config({"context_backend": backend, "max_history": 100})
+    context = manager.build_context_for_mistral("conversation")
+    loaded = time.perf_counter()
+
+    question = f"{manager.session} 的第 {index} 个问题"
+    messages = [{"role": "user", "content": entry["user"]} for entry in context["history"]]
+    body = json.dumps({"model": "test", "messages": messages + [{"role": "user", "content": question}]})
+    request = urllib.request.Request(url + "/v1/chat/completions", body.encode("utf-8"),
+                                     {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        answer = json.load(response)["choices"][0]["message"]["content"]
+
+    saving = time.perf_counter()
+    manager.update_context(question, answer, "conversation")
+    manager.save_context_to_disk()
+    timings.append(loaded - start + time.perf_counter() - saving)
+print(json.dumps(timings))
+"""
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+class TestConcurrentSessions:
+    @pytest.fixture
+    def home(self, tmp_path, monkeypatch):
+        home = tmp_path / "home"
+        (home / ".ai_terminal").mkdir(parents=True)
+        monkeypatch.setenv("HOME", str(home))
+        return home
+
+    def env(self, home, session):
+        return dict(os.environ, HOME=str(home), PYTHONPATH=PROJECT_ROOT, AI_TERMINAL_SESSION=session)
+
+    def stored_turns(self, backend):
+        from src.core.context_manager import ContextManager
+        manager = ContextManager.from_config({"context_backend": backend, "max_history": 1000,
+                                              "history_scope": "global"})
+        return manager.conversation_history
+
+    def test_ai_sessions_in_parallel_panes(self, fake_server, home, tmp_path):
+        """多个窗格同时运行 ai：每个窗格的请求只带本窗格的历史，所有对话都保存下来"""
+        fake_server.delay = 0.1
+        config = tmp_path / "config.yaml"
+        config.write_text(CONFIG.format(url=fake_server.url, backend="journal"), encoding="utf-8")
+        sessions, rounds = ["pane-0", "pane-1", "pane-2"], 2
+        errors = []
+
+        def pane(session):
+            for index in range(rounds):
+                result = subprocess.run(
+                    [sys.executable, "-m", "src.main", "--config", str(config), f"{session} 的第 {index} 个问题"],
+                    cwd=PROJECT_ROOT, env=self.env(home, session), capture_output=True, text=True, timeout=60)
+                if result.returncode != 0:
+                    errors.append(result.stderr)
+
+        threads = [threading.Thread(target=pane, args=(session,)) for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors, errors[0]
+
+        for request in fake_server.requests:
+            text = " ".join(m["content"] for m in request["body"]["messages"] if m["role"] == "user")
+            assert len(set(re.findall(r"pane-\d", text))) == 1, text
+
+        turns = self.stored_turns("journal")
+        assert len(turns) == len(sessions) * rounds
+        for session in sessions:
+            own = [entry["user"] for entry in turns if entry.get("session") == session]
+            assert own == [f"{session} 的第 {index} 个问题" for index in range(rounds)]
+
+    @pytest.mark.parametrize("backend", ["journal", "sqlite"])
+    def test_concurrent_writers_lose_no_turns(self, fake_server, home, backend):
+        """8 个进程同时循环读写上下文（期间日志会被压缩）：不丢失对话，读写耗时不随争用明显增加"""
+        fake_server.delay = 0.01
+        writers, rounds = 8, 40
+
+        def start(session, count):
+            return subprocess.Popen([sys.executable, "-c", WRITER, fake_server.url, str(count), backend],
+                                    cwd=PROJECT_ROOT, env=self.env(home, session),
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+        def finish(process):
+            stdout, stderr = process.communicate(timeout=120)
+            assert process.returncode == 0, stderr
+            return json.loads(stdout)
+
+        # 没有争用时的基准
+        solo = finish(start("solo", 10))
+        started = time.monotonic()
+        timings = [t for process in [start(f"pane-{i}", rounds) for i in range(writers)] for t in finish(process)]
+        elapsed = time.monotonic() - started
+
+        turns = self.stored_turns(backend)
+        assert len(turns) == 10 + writers * rounds
+        for i in range(writers):
+            own = [entry["user"] for entry in turns if entry.get("session") == f"pane-{i}"]
+            assert own == [f"pane-{i} 的第 {index} 个问题" for index in range(rounds)]
+
+        # 同一时间最多 writers 个进程分享 CPU，读写上下文的耗时按此放宽，而不是随争用无界增长
+        assert percentile(timings, 0.95) < max(percentile(solo, 0.5) * writers * 4, 0.25), (
+            f"p95 {percentile(timings, 0.95):.4f}s, solo p50 {percentile(solo, 0.5):.4f}s, total {elapsed:.1f}s")
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+import pytest
+
+from src.core.daemon import run_client
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+class TestDaemon:
+    @pytest.fixture
+    def daemon(self, tmp_path):
+        """在临时 HOME 下以前台模式启动守护进程"""
+        home = tmp_path / "home"
+        (home / ".ai_terminal").mkdir(parents=True)
+        socket_path = str(tmp_path / "daemon.sock")
+        env = dict(os.environ, HOME=str(home), MISTRAL_API_KEY="test_key", PYTHONPATH=PROJECT_ROOT)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "src.core.daemon", "run", "--socket", socket_path],
+            cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.1)
+        yield socket_path, env
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    def test_client_without_daemon_falls_back(self, tmp_path):
+        assert run_client(["--help"], socket_path=str(tmp_path / "missing.sock")) is None
+
+    def test_client_streams_output_from_daemon(self, daemon, tmp_path):
+        socket_path, env = daemon
+        script = (
+            "import sys; from src.core.daemon import run_client; "
+            "sys.exit(run_client(sys.argv[1:], socket_path=%r))" % socket_path
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script, "--help"],
+            cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=30
+        )
+        assert result.returncode == 0
+        assert "AI Terminal" in result.stdout
+
+    def test_socket_is_private(self, daemon):
+        socket_path, _ = daemon
+        assert os.stat(socket_path).st_mode & 0o077 == 0
@@ -0,0 +1,47 @@
+import os
+import sys
+import subprocess
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# 入口模块累计导入耗时预算(毫秒)，可通过环境变量调整
+IMPORT_BUDGET_MS = float(os.environ.get("AI_TERMINAL_IMPORT_BUDGET_MS", "150"))
+
+# 入口路径上不应出现的重量级模块
+HEAVY_MODULES = ["mistralai", "pydantic", "httpx", "yaml"]
+
+
+def run_importtime(module):
+    """以 -X importtime 导入模块，返回 {模块名: 累计耗时(微秒)}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+@pytest.fixture(scope="module")
+def timings():
+    return run_importtime("src.main")
+
+
+class TestImportBudget:
+    def test_entry_point_within_budget(self, timings):
+        cumulative_ms = timings["src.main"] / 1000
+        assert cumulative_ms <= IMPORT_BUDGET_MS, (
+            f"src.main 导入耗时 {cumulative_ms:.1f}ms，超出预算 {IMPORT_BUDGET_MS:.0f}ms"
+        )
+
+    def test_heavy_modules_are_deferred(self, timings):
+        loaded = [name for name in HEAVY_MODULES if name in timings]
+        assert loaded == []
+
+    def test_handlers_are_deferred(self, timings):
+        assert not any(name.startswith("src.handlers") for name in timings)
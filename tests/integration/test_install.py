@@ -0,0 +1,72 @@
+import os
+import sys
+import zipfile
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'scripts')))
+
+import install
+from install import (_include_in_zipapp, check_zipapp, collect_runtime_distributions, compute_build_stamp,
+                     create_executable_script, create_zipapp_launcher)
+
+
+class TestZipappLauncher:
+    def test_dependency_sources_are_excluded(self):
+        assert _include_in_zipapp(os.path.join("src", "main.py"))
+        assert _include_in_zipapp("__main__.py")
+        assert _include_in_zipapp(os.path.join("click", "core.pyc"))
+        assert not _include_in_zipapp(os.path.join("click", "core.py"))
+        assert not _include_in_zipapp(os.path.join("httpx", "_api.pyi"))
+        assert _include_in_zipapp(os.path.join("certifi", "cacert.pem"))
+
+    def test_dist_info_keeps_only_metadata(self):
+        assert _include_in_zipapp(os.path.join("click-8.1.0.dist-info", "METADATA"))
+        assert not _include_in_zipapp(os.path.join("click-8.1.0.dist-info", "RECORD"))
+
+    def test_build_stamp_tracks_source_changes(self, tmp_path):
+        src = tmp_path / "src"
+        src.mkdir()
+        module = src / "main.py"
+        module.write_text("print('v1')\n")
+        before = compute_build_stamp(str(src), [])
+        assert compute_build_stamp(str(src), []) == before
+
+        module.write_text("print('v2')\n")
+        assert compute_build_stamp(str(src), []) != before
+
+    def test_reinstall_keeps_launcher(self, tmp_path, monkeypatch):
+        """重新安装时启动包已是最新：跳过重建，但仍然重新写入启动脚本"""
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "main.py").write_text("print('v1')\n")
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        builds = []
+
+        def build_zipapp(zipapp_path, *args):
+            builds.append(zipapp_path)
+            open(zipapp_path, "wb").close()
+
+        monkeypatch.setattr(install, "collect_runtime_distributions", lambda: ([], []))
+        monkeypatch.setattr(install, "build_zipapp", build_zipapp)
+        monkeypatch.setattr(install, "check_zipapp", lambda *args: None)
+        monkeypatch.setattr(install, "measure_startup", lambda command: 0.05)
+
+        for _ in range(2):
+            create_executable_script(str(bin_dir))
+            assert create_zipapp_launcher(str(bin_dir), str(src))
+            assert "-I -S" in (bin_dir / "ai_terminal").read_text()
+        assert len(builds) == 1
+
+    def test_missing_dependency_fails_the_build(self, monkeypatch):
+        monkeypatch.setattr(install, "RUNTIME_REQUIREMENTS", ["click", "ai-terminal-missing-dependency"])
+        with pytest.raises(RuntimeError, match="ai-terminal-missing-dependency"):
+            collect_runtime_distributions()
+
+    def test_check_imports_runtime_dependencies(self, tmp_path):
+        """校验在隔离模式下导入运行时依赖：启动包缺少依赖时报告缺少的模块"""
+        zipapp_path = tmp_path / "ai_terminal.pyz"
+        with zipfile.ZipFile(zipapp_path, "w") as zf:
+            zf.writestr("src/__init__.py", "")
+            zf.writestr("src/main.py", "")
+        assert "click" in check_zipapp(str(zipapp_path), [])
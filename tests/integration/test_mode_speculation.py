@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+CONFIG = """
+api:
+  api_key: "test_key"
+  server_url: "{url}"
+mistral:
+  stream: true
+advanced:
+  max_retries: 0
+cache:
+  enabled: false
+speculation:
+  enabled: true
+"""
+
+COMMAND_REPLY = "可以使用：\n```zsh\nfind . -type f -size +100M\n```\n"
+PROSE_REPLY = "查找大文件有很多种方法，取决于你使用的系统和工具。" * 8
+
+
+def reply(body):
+    """命令模式的系统提示得到命令代码块，其他模式得到一段文字"""
+    system = body["messages"][0]["content"]
+    return COMMAND_REPLY if "命令专家" in system else PROSE_REPLY
+
+
+class TestSpeculation:
+    @pytest.fixture
+    def run(self, fake_server, tmp_path):
+        fake_server.reply = reply
+        fake_server.chunk_delay = 0.02
+        home = tmp_path / "home"
+        (home / ".ai_terminal").mkdir(parents=True)
+        config = tmp_path / "config.yaml"
+        config.write_text(CONFIG.format(url=fake_server.url), encoding="utf-8")
+        env = dict(os.environ, HOME=str(home), PYTHONPATH=PROJECT_ROOT)
+
+        def run(*args):
+            return subprocess.run([sys.executable, "-m", "src.main", "--config", str(config), "-v", *args],
+                                  cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, timeout=60)
+        run.stats_path = home / ".ai_terminal" / "speculation_stats.json"
+        return run
+
+    def test_ambiguous_query_commits_to_matching_mode(self, run, fake_server):
+        result = run("如何查找大于100MB的文件")
+        assert result.returncode == 0, result.stderr
+
+        # 只输出采用的一方，另一方的输出不出现
+        assert result.stdout.strip() == COMMAND_REPLY.strip()
+        assert "conversation / command" in result.stderr
+        assert "→ command（输出符合该模式" in result.stderr
+        assert len(fake_server.requests) == 2
+        assert {request["body"]["stream"] for request in fake_server.requests} == {True}
+
+        stats = json.loads(run.stats_path.read_text())
+        assert stats["fired"] == 1 and stats["alternative_won"] == 1
+        assert stats["extra_tokens"] > 0
+
+    def test_confident_query_runs_single_handler(self, run, fake_server):
+        result = run("你好")
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == PROSE_REPLY
+        assert len(fake_server.requests) == 1
+        assert "模式投机" not in result.stderr
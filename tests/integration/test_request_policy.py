@@ -0,0 +1,96 @@
+import time
+import pytest
+from src.core.llm_client import MistralClient
+from src.core.rate_limiter import RateLimiter
+from src.core.request_policy import LatencyTracker, RequestPolicy, RequestTimeoutError
+
+
+class TestRequestPolicy:
+    @pytest.fixture
+    def client(self, fake_server, temp_dir):
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+        client.policy = RequestPolicy(timeout=1.0, max_retries=2, retry_delay=0.01,
+                                      latency=LatencyTracker(f"{temp_dir}/latency.json"))
+        return client
+
+    def test_retries_transient_errors(self, client, fake_server):
+        fake_server.fail_statuses = [503, 502]
+        assert client.generate_response("你好") == fake_server.reply
+        assert len(fake_server.requests) == 3
+        assert client.policy.last_stats["attempts"] == 3
+
+    def test_does_not_retry_client_errors(self, client, fake_server):
+        fake_server.fail_statuses = [400]
+        with pytest.raises(Exception) as excinfo:
+            client.generate_response("你好")
+        assert getattr(excinfo.value, "status_code", None) == 400
+        assert len(fake_server.requests) == 1
+
+    def test_gives_up_after_deadline(self, client, fake_server):
+        fake_server.delay = 2.0
+        client.policy.max_retries = 1
+        start = time.perf_counter()
+        with pytest.raises(TimeoutError):
+            client.generate_response("你好")
+        assert time.perf_counter() - start < 3.0
+
+    def test_stream_retries_before_first_token(self, client, fake_server):
+        fake_server.fail_statuses = [500]
+        assert "".join(client.generate_streaming_response("你好")) == fake_server.reply
+        assert len(fake_server.requests) == 2
+
+    @pytest.mark.parametrize("stream", [False, True])
+    def test_hedged_request_wins_over_stalled_one(self, client, fake_server, stream):
+        client.policy.hedge = True
+        client.policy.timeout = 5.0
+        kind = "stream" if stream else "complete"
+        for _ in range(10):
+            client.policy.latency.record(kind, 0.05)
+
+        fake_server.delays = [3.0]
+        start = time.perf_counter()
+        if stream:
+            response = "".join(client.generate_streaming_response("你好"))
+        else:
+            response = client.generate_response("你好")
+        assert response == fake_server.reply
+        assert time.perf_counter() - start < 1.5
+        assert client.policy.last_stats == {"attempts": 2, "hedged": True, "hedge_won": True}
+
+    def test_backoff_is_jittered_and_capped(self):
+        policy = RequestPolicy(retry_delay=1, max_retry_delay=4)
+        delays = [policy.backoff(5) for _ in range(50)]
+        assert all(0 <= d <= 4 for d in delays)
+        assert len(set(delays)) > 1
+
+    def test_timeout_error_type(self):
+        policy = RequestPolicy(timeout=0.1, max_retries=0)
+        with pytest.raises(RequestTimeoutError):
+            policy.call(lambda timeout: time.sleep(1))
+
+    @pytest.mark.parametrize("stream", [False, True])
+    def test_rate_limited_retry_waits_for_retry_after(self, client, fake_server, temp_dir, stream):
+        client.policy.retry_delay = 5.0
+        client.policy.rate_limiter = RateLimiter(path=f"{temp_dir}/rate_limit.json")
+        fake_server.fail_statuses = [429]
+        fake_server.retry_after = 0.3
+
+        start = time.perf_counter()
+        if stream:
+            response = "".join(client.generate_streaming_response("你好"))
+        else:
+            response = client.generate_response("你好")
+        elapsed = time.perf_counter() - start
+        assert response == fake_server.reply
+        # 按 Retry-After 等待，而不是按 retry_delay 盲目退避
+        assert 0.3 <= elapsed < 2.0
+        assert client.policy.last_rate_wait >= 0.25
+        # 429 使速率减半，随后的成功加回一步
+        assert client.policy.rate_limiter.rate == pytest.approx(0.55)
+
+    def test_rate_limiter_refunds_unused_tokens(self, client, fake_server, temp_dir):
+        client.policy.rate_limiter = RateLimiter(tpm=5000, path=f"{temp_dir}/rate_limit.json")
+        # 每次预扣约 4096 个 token，不修正时第二次请求就要等待
+        for _ in range(3):
+            client.generate_response("你好", max_tokens=4096)
+        assert client.policy.last_rate_wait < 0.05
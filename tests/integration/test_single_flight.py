@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+from src.core.llm_client import MistralClient
+from src.core.request_policy import LatencyTracker, RequestPolicy
+from src.core.single_flight import SingleFlight
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+REPLY = "".join(f"第{i}行：error.log 中的错误摘要。" for i in range(8))
+
+# 子进程：与测试中的客户端配置相同，流式请求并输出结果
+WORKER = """
+import sys
+from src.core.llm_client import MistralClient
+from src.core.single_flight import SingleFlight
+client = MistralClient({"api_key": "test_key", "server_url": sys.argv[1]})
+client.single_flight = SingleFlight(directory=sys.argv[2])
+text = "".join(client.generate_streaming_response("总结 error.log"))
+print(("follower " if client.last_coalesced else "leader ") + text)
+"""
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+class TestSingleFlight:
+    @pytest.fixture
+    def client(self, fake_server, temp_dir):
+        fake_server.reply = REPLY
+        fake_server.chunk_size = 4
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+        client.policy = RequestPolicy(timeout=5.0, max_retries=0, latency=LatencyTracker(f"{temp_dir}/latency.json"))
+        client.single_flight = SingleFlight(directory=os.path.join(temp_dir, "inflight"))
+        return client
+
+    def flight_key(self, client, user_input):
+        messages, params = client._prepare_request(user_input, None, {})
+        return client._flight_key(messages, params, client.model)
+
+    def test_concurrent_processes_share_one_request(self, fake_server, temp_dir):
+        fake_server.reply = REPLY
+        fake_server.chunk_size = 4
+        # 首个片段前的延迟覆盖各进程启动时间的差异
+        fake_server.delay = 1.5
+        fake_server.chunk_delay = 0.02
+        workers = [
+            subprocess.Popen([sys.executable, "-c", WORKER, fake_server.url, os.path.join(temp_dir, "inflight")],
+                             cwd=PROJECT_ROOT, stdout=subprocess.PIPE, text=True)
+            for _ in range(4)
+        ]
+        outputs = sorted(worker.communicate(timeout=60)[0].strip() for worker in workers)
+
+        assert len(fake_server.requests) == 1
+        assert outputs == ["follower " + REPLY] * 3 + ["leader " + REPLY]
+        assert not [name for name in os.listdir(os.path.join(temp_dir, "inflight")) if name.endswith(".lock")]
+
+    def test_recovers_stale_lock_from_crashed_process(self, client, fake_server):
+        key = self.flight_key(client, "总结 error.log")
+        flight = client.single_flight
+        os.makedirs(flight.directory, exist_ok=True)
+        spool = os.path.join(flight.directory, f"{key}.crashed.spool")
+        open(spool, 'w').close()
+        with open(flight.lock_path(key), 'w') as f:
+            json.dump({"pid": dead_pid(), "host": os.uname().nodename, "spool": spool, "started": 0}, f)
+
+        assert client.generate_response("总结 error.log") == REPLY
+        assert len(fake_server.requests) == 1
+        assert not client.last_coalesced
+        assert not os.path.exists(flight.lock_path(key))
+
+    def test_takes_over_crashed_leader_mid_stream(self, client, fake_server):
+        key = self.flight_key(client, "总结 error.log")
+        flight = client.single_flight
+        lease = flight.begin(key)
+        lease.write(REPLY[:10])
+        fake_server.echo_prefix = False
+        chunks = client.generate_streaming_response("总结 error.log")
+        assert next(chunks) == REPLY[:10]
+        assert client.last_coalesced
+
+        # 模拟持锁进程输出一部分后崩溃
+        with open(flight.lock_path(key)) as f:
+            owner = json.load(f)
+        owner["pid"] = dead_pid()
+        with open(flight.lock_path(key), 'w') as f:
+            json.dump(owner, f)
+
+        assert REPLY[:10] + "".join(chunks) == REPLY
+        # 接手后以已输出的部分作为前缀续写
+        resumed = fake_server.requests[-1]["body"]["messages"][-1]
+        assert resumed == {"role": "assistant", "content": REPLY[:10], "prefix": True}
+        assert len(fake_server.requests) == 1
+
+    def test_follower_requests_itself_when_leader_fails(self, client, fake_server):
+        key = self.flight_key(client, "你好")
+        lease = client.single_flight.begin(key)
+        lease.write(REPLY[:10])
+        chunks = client.generate_streaming_response("你好")
+        assert next(chunks) == REPLY[:10]
+        lease.abort("RuntimeError: boom")
+
+        assert REPLY[:10] + "".join(chunks) == REPLY
+        assert len(fake_server.requests) == 1
+        assert not os.path.exists(client.single_flight.lock_path(key))
+
+    def test_leader_error_releases_lock(self, client, fake_server):
+        fake_server.fail_statuses = [400]
+        with pytest.raises(Exception):
+            client.generate_response("你好")
+        key = self.flight_key(client, "你好")
+        assert not os.path.exists(client.single_flight.lock_path(key))
+        assert client.generate_response("你好") == REPLY
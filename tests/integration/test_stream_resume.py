@@ -0,0 +1,69 @@
+import random
+import asyncio
+import pytest
+from src.core.llm_client import MistralClient
+from src.core.request_policy import LatencyTracker, RequestPolicy
+from src.core.stream_resume import EchoedPrefixFilter, StreamInterruptedError
+
+REPLY = "".join(f"第{i}段：这是一段用于测试续传的较长文本。" for i in range(20))
+
+
+class TestStreamResume:
+    @pytest.fixture
+    def client(self, fake_server, temp_dir, monkeypatch):
+        monkeypatch.setattr("src.core.llm_client.time.sleep", lambda seconds: None)
+        fake_server.reply = REPLY
+        fake_server.chunk_size = 3
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+        client.policy = RequestPolicy(timeout=5.0, max_retries=0, max_resumes=5,
+                                      latency=LatencyTracker(f"{temp_dir}/latency.json"))
+        return client
+
+    @pytest.mark.parametrize("echo_prefix", [True, False])
+    @pytest.mark.parametrize("seed", range(3))
+    def test_resumes_after_random_cuts(self, client, fake_server, echo_prefix, seed):
+        rng = random.Random(seed)
+        pieces = len(REPLY) // fake_server.chunk_size
+        fake_server.echo_prefix = echo_prefix
+        fake_server.cut_after = [rng.randint(1, pieces // 2) for _ in range(3)]
+
+        chunks = list(client.generate_streaming_response("写一篇长文"))
+        assert "".join(chunks) == REPLY
+        assert client.last_resumes == 3
+        assert client.last_finish_reason == "stop"
+
+        # 续传请求携带已收到的内容作为 assistant 前缀
+        resumed = fake_server.requests[-1]["body"]["messages"][-1]
+        assert resumed["role"] == "assistant" and resumed["prefix"] is True
+        assert REPLY.startswith(resumed["content"])
+
+    def test_gives_up_after_max_resumes(self, client, fake_server):
+        client.policy.max_resumes = 1
+        fake_server.cut_after = [2, 2]
+        with pytest.raises(ConnectionError):
+            "".join(client.generate_streaming_response("写一篇长文"))
+
+    def test_cli_assistant_resumes(self, fake_server, monkeypatch):
+        import cmd_ai
+        monkeypatch.setenv("MISTRAL_API_KEY", "test_key")
+        monkeypatch.setenv("MISTRAL_SERVER_URL", fake_server.url)
+        fake_server.reply = REPLY
+        fake_server.cut_after = [5, 12]
+
+        async def collect():
+            assistant = cmd_ai.CLIAssistant()
+            assistant.client.policy.max_resumes = 2
+            return "".join([chunk async for chunk in assistant.generate("写一篇长文", "general")])
+
+        assert asyncio.run(collect()) == REPLY
+        assert len(fake_server.requests) == 3
+
+    def test_echo_filter(self):
+        echo_filter = EchoedPrefixFilter("abc")
+        assert [echo_filter.feed(x) for x in ["a", "bc", "de"]] == ["", "", "de"]
+
+        echo_filter = EchoedPrefixFilter("abc")
+        assert [echo_filter.feed(x) for x in ["ab", "x", "y"]] == ["", "abx", "y"]
+
+        assert EchoedPrefixFilter("").feed("abc") == "abc"
+        assert issubclass(StreamInterruptedError, ConnectionError)
@@ -0,0 +1,111 @@
+import os
+import time
+from unittest.mock import MagicMock
+from src.core.llm_client import MistralClient
+from src.core.max_tokens import AdaptiveMaxTokens, MIN_USAGE_SAMPLES
+from src.handlers.command_handler import CommandHandler
+from src.handlers.conversation_handler import ConversationHandler
+
+
+class TestStreaming:
+    def test_client_streams_chunks_and_records_usage(self, fake_server):
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+
+        chunks = list(client.generate_streaming_response("你好"))
+        assert "".join(chunks) == fake_server.reply
+        assert len(chunks) > 1
+        assert client.last_finish_reason == "stop"
+        assert client.last_usage["total_tokens"] > 0
+        assert fake_server.requests[-1]["body"]["stream"] is True
+
+    def test_handler_emits_first_token_before_completion(self, fake_server):
+        fake_server.chunk_delay = 0.05
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+        context = MagicMock()
+        context.build_context_for_mistral.return_value = {}
+        handler = ConversationHandler(client, context, {"mistral": {"stream": True}})
+
+        arrivals = []
+        handler.on_token = lambda chunk: arrivals.append(time.perf_counter())
+        start = time.perf_counter()
+        response = handler.handle("你好")
+        total = time.perf_counter() - start
+
+        assert response == fake_server.reply
+        assert handler.streamed
+        assert arrivals[0] - start < total - 0.05
+
+    def test_handler_without_stream_setting_blocks(self, fake_server):
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+        context = MagicMock()
+        context.build_context_for_mistral.return_value = {}
+        handler = ConversationHandler(client, context)
+        handler.on_token = MagicMock()
+
+        assert handler.handle("你好") == fake_server.reply
+        assert not handler.streamed
+        handler.on_token.assert_not_called()
+        assert "stream" not in fake_server.requests[-1]["body"] or not fake_server.requests[-1]["body"]["stream"]
+
+    def test_terse_command_closes_stream_after_code_block(self, fake_server, temp_dir):
+        fake_server.reply = "```zsh\nls -la\n```\n" + "这个命令列出所有文件。" * 20
+        fake_server.chunk_delay = 0.02
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+        context = MagicMock()
+        context.build_context_for_mistral.return_value = {}
+        settings = {"mistral": {"stream": True}, "terminal": {"terse_commands": True},
+                    "cache": {"enabled": False}}
+        handler = CommandHandler(client, context, settings)
+        handler.on_token = MagicMock()
+
+        start = time.perf_counter()
+        response = handler.handle("如何列出所有文件")
+        elapsed = time.perf_counter() - start
+
+        assert response == "```zsh\nls -la\n```"
+        # 完整回复需要约 60 个片段，提前结束时只读取了前几个
+        assert elapsed < 0.02 * 30
+        body = fake_server.requests[-1]["body"]
+        assert "代码块" in body["messages"][-1]["content"]
+        assert body["max_tokens"] <= 256
+        assert client.last_finish_reason == "stop"
+        assert client.last_early_stop["saved_tokens"] > 0
+
+    def test_truncated_answer_continues_with_larger_budget(self, fake_server, temp_dir):
+        fake_server.reply = "".join(f"第{i}段" for i in range(80))
+        fake_server.enforce_max_tokens = True
+        fake_server.echo_prefix = False
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+        client.max_tokens_policy = AdaptiveMaxTokens(path=os.path.join(temp_dir, "usage.json"))
+        for _ in range(MIN_USAGE_SAMPLES):
+            client.max_tokens_policy.record("command/explain", 10)
+        context = {"mode": "command", "action": "explain"}
+
+        assert client.generate_response("解释", context, max_tokens=512) == fake_server.reply
+        budgets = [request["body"]["max_tokens"] for request in fake_server.requests]
+        assert budgets == [64, 64]
+        assert client.last_length_retries == 1
+        assert client.last_max_tokens == {"key": "command/explain", "max_tokens": 128}
+        assert fake_server.requests[-1]["body"]["messages"][-1]["prefix"] is True
+
+        chunks = list(client.generate_streaming_response("解释", context, max_tokens=512))
+        assert "".join(chunks) == fake_server.reply
+        assert client.last_finish_reason == "stop"
+        # 上一次完整回复的用量已经记录，上限随之提高，不再被截断
+        assert client.last_length_retries == 0
+        assert client.last_max_tokens["max_tokens"] > 64
+        assert len(client.max_tokens_policy.samples["command/explain"]) == MIN_USAGE_SAMPLES + 2
+
+    def test_truncated_stream_continues_with_larger_budget(self, fake_server, temp_dir):
+        fake_server.reply = "".join(f"{i:04d}" for i in range(100))
+        fake_server.enforce_max_tokens = True
+        fake_server.echo_prefix = False
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+        client.max_tokens_policy = AdaptiveMaxTokens(path=os.path.join(temp_dir, "usage.json"))
+
+        chunks = list(client.generate_streaming_response("你好", {}, max_tokens=50))
+        assert "".join(chunks) == fake_server.reply
+        assert [request["body"]["max_tokens"] for request in fake_server.requests] == [50, 50]
+        assert client.last_length_retries == 1
+        assert client.last_resumes == 0
+        assert client.max_tokens_policy.samples["conversation/default"]
@@ -0,0 +1,141 @@
+import os
+import time
+import pytest
+from unittest.mock import MagicMock
+from src.core.command_cache import CommandCache, features, guard_key, tokenize
+from src.handlers.command_handler import CommandHandler
+
+
+class TestCommandCache:
+    @pytest.fixture
+    def cache(self, temp_dir):
+        cache = CommandCache(os.path.join(temp_dir, "commands.db"))
+        cache.add("查找最近7天修改的py文件", "find . -name '*.py' -mtime -7")
+        yield cache
+        cache.close()
+
+    def test_tokenize_normalizes_aliases(self):
+        units = tokenize("找出7天内改过的 Python 文件")
+        assert units == ["find", "recent", "7d", "modified", "py", "file"]
+        assert guard_key(units) == guard_key(tokenize("查找最近7天修改的py文件"))
+        assert guard_key(tokenize("format disk")) == "disk format"
+
+    def test_paraphrase_is_reused(self, cache):
+        match = cache.lookup("找出7天内改过的 python 文件")
+        assert match["command"] == "find . -name '*.py' -mtime -7"
+        assert match["similarity"] >= cache.threshold
+
+    def test_different_key_terms_are_not_reused(self, cache):
+        assert cache.lookup("删除最近7天修改的py文件") is None
+        assert cache.lookup("查找最近7天修改的js文件") is None
+        assert cache.lookup("查找最近30天修改的py文件") is None
+        assert cache.lookup("显示磁盘使用情况") is None
+
+    @pytest.mark.parametrize("cached, command, query", [
+        ("查找大于100MB的文件", "find . -size +100M", "查找小于100MB的文件"),
+        ("查找最近7天修改的py文件", "find . -name '*.py' -mtime -7", "查找7天以前修改的py文件"),
+        ("查找最近7天修改的py文件", "find . -name '*.py' -mtime -7", "查找最近7天没有修改的py文件"),
+        ("查找最近7天修改的py文件", "find . -name '*.py' -mtime -7", "查找最近7小时修改的py文件"),
+        ("显示当前目录下的所有文件", "ls -a", "不显示当前目录下的隐藏文件"),
+        ("显示当前目录下的所有文件", "ls -a", "显示当前目录下的所有目录"),
+    ])
+    def test_opposite_meaning_is_not_reused(self, temp_dir, cached, command, query):
+        cache = CommandCache(os.path.join(temp_dir, "opposite.db"))
+        cache.add(cached, command)
+        assert cache.lookup(query) is None
+        cache.close()
+
+    def test_scopes_are_separate(self, cache):
+        assert cache.lookup("找出7天内改过的 python 文件", scope="terse") is None
+        cache.add("查找最近7天修改的py文件", "find . -name '*.py' -mtime -7 -print0", scope="terse")
+        assert cache.lookup("找出7天内改过的 python 文件", scope="terse")["command"].endswith("-print0")
+        assert cache.lookup("找出7天内改过的 python 文件")["command"].endswith("-mtime -7")
+
+    def test_disabled_by_default(self, temp_dir):
+        assert CommandCache.from_config({"enabled": True, "directory": temp_dir}) is None
+        cache = CommandCache.from_config({"enabled": True, "directory": temp_dir,
+                                          "similar_commands": {"enabled": True}})
+        assert cache.threshold == 0.75
+
+    def test_max_entries(self, temp_dir):
+        cache = CommandCache(os.path.join(temp_dir, "small.db"), max_entries=2)
+        for days in (1, 2, 3):
+            cache.add(f"查找最近{days}天修改的py文件", f"find . -mtime -{days}")
+        assert cache.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 2
+        assert cache.lookup("查找最近1天修改的py文件") is None
+        cache.close()
+
+    def test_lookup_latency(self, temp_dir):
+        """数万条近似重复的记录落入同样的桶：查找（含特征计算）仍在 1ms 以内"""
+        cache = CommandCache(os.path.join(temp_dir, "large.db"))
+        for filler in ("", "请", "帮我", "所有"):
+            cache.add(f"查找{filler}最近7天修改的py文件", "find . -name '*.py' -mtime -7")
+        # 复制已有的记录及其桶键直到超过 30000 条
+        with cache.conn:
+            while cache.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] < 30000:
+                offset = cache.conn.execute("SELECT MAX(id) FROM entries").fetchone()[0]
+                cache.conn.execute("INSERT INTO entries SELECT id + ?, query, command, shingles, created FROM entries",
+                                   (offset,))
+                cache.conn.execute("INSERT INTO bands SELECT key, entry_id + ? FROM bands", (offset,))
+
+        queries = [f"找出{filler}7天内改过的 python 文件" for filler in ("", "请", "帮我", "所有")] * 10
+        start = time.perf_counter()
+        for query in queries:
+            features.cache_clear()
+            assert cache.lookup(query)["command"] == "find . -name '*.py' -mtime -7"
+        assert (time.perf_counter() - start) / len(queries) < 0.001
+        cache.close()
+
+    def test_old_feature_version_is_cleared(self, temp_dir):
+        path = os.path.join(temp_dir, "old.db")
+        cache = CommandCache(path)
+        cache.add("查找最近7天修改的py文件", "find . -mtime -7")
+        cache.conn.execute("PRAGMA user_version = 1")
+        cache.close()
+
+        cache = CommandCache(path)
+        assert cache.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0
+        cache.close()
+
+    def test_handler_reuses_without_llm_call(self, temp_dir):
+        settings = {"cache": {"enabled": True, "directory": temp_dir, "similar_commands": {"enabled": True}}}
+        llm = MagicMock()
+        llm.generate_response.return_value = "find . -name '*.py' -mtime -7"
+        llm.last_finish_reason = "stop"
+        context = MagicMock()
+        context.build_context_for_mistral.return_value = {}
+
+        first = CommandHandler(llm, context, settings)
+        first.handle("生成命令：查找最近7天修改的py文件")
+        second = CommandHandler(llm, context, settings)
+        assert second.handle("生成命令：找出7天内改过的 python 文件") == "find . -name '*.py' -mtime -7"
+        assert second.reused
+        assert llm.generate_response.call_count == 1
+
+        second.cache_policy = "refresh"
+        second.handle("生成命令：找出7天内改过的 python 文件")
+        assert llm.generate_response.call_count == 2
+
+    def test_handler_does_not_reuse_across_modes_or_directories(self, temp_dir, monkeypatch):
+        """简洁模式和完整模式、不同工作目录下生成的命令不互相复用"""
+        settings = {"cache": {"enabled": True, "directory": temp_dir, "similar_commands": {"enabled": True}}}
+        llm = MagicMock()
+        llm.generate_response.return_value = "find . -name '*.py' -mtime -7"
+        llm.last_finish_reason = "stop"
+        context = MagicMock()
+        context.build_context_for_mistral.return_value = {}
+        for name in ("project", "other"):
+            os.makedirs(os.path.join(temp_dir, name))
+
+        monkeypatch.chdir(os.path.join(temp_dir, "project"))
+        CommandHandler(llm, context, settings).handle("生成命令：查找最近7天修改的py文件")
+        terse = CommandHandler(llm, context, {**settings, "terminal": {"terse_commands": True}})
+        terse.handle("生成命令：查找最近7天修改的py文件")
+        assert not terse.reused
+        assert llm.generate_response.call_count == 2
+
+        monkeypatch.chdir(os.path.join(temp_dir, "other"))
+        other = CommandHandler(llm, context, settings)
+        other.handle("生成命令：查找最近7天修改的py文件")
+        assert not other.reused
+        assert llm.generate_response.call_count == 3
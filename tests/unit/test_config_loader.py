@@ -0,0 +1,43 @@
+import os
+import pytest
+from unittest.mock import patch
+from src.utils import config_loader
+from src.utils.config_loader import load_config, load_config_snapshot, SNAPSHOT_SUFFIX
+
+
+class TestConfigSnapshot:
+    @pytest.fixture
+    def config_path(self, temp_config_file, monkeypatch):
+        monkeypatch.setenv("MISTRAL_API_KEY", "test_key")
+        return temp_config_file
+
+    def test_snapshot_is_written_on_first_load(self, config_path):
+        config = load_config(config_path)
+        assert config["api"]["api_key"] == "test_key"
+        assert os.path.exists(config_path + SNAPSHOT_SUFFIX)
+
+    def test_valid_snapshot_skips_yaml_and_validation(self, config_path):
+        load_config(config_path)
+        with patch("yaml.safe_load", side_effect=AssertionError("不应重新解析")), \
+             patch.object(config_loader, "validate_config", side_effect=AssertionError("不应重新验证")):
+            config, errors = load_config_snapshot(config_path)
+        assert config["api"]["model"] == "mistral-small-latest"
+        assert errors == []
+
+    def test_modified_file_rebuilds_snapshot(self, config_path):
+        load_config(config_path)
+        with open(config_path, "a") as f:
+            f.write("extra:\n  value: 1\n")
+        assert load_config(config_path)["extra"] == {"value": 1}
+
+    def test_env_change_rebuilds_and_revalidates(self, config_path, monkeypatch):
+        load_config(config_path)
+        monkeypatch.setenv("MISTRAL_API_KEY", "")
+        config, errors = load_config_snapshot(config_path)
+        assert config["api"]["api_key"] == ""
+        assert "缺少 API 密钥" in errors
+
+    def test_corrupt_snapshot_is_ignored(self, config_path):
+        with open(config_path + SNAPSHOT_SUFFIX, "wb") as f:
+            f.write(b"\x00garbage")
+        assert load_config(config_path)["api"]["provider"] == "mistral"
@@ -0,0 +1,148 @@
+import os
+import json
+import pytest
+from unittest.mock import MagicMock
+from src.core.llm_client import MistralClient
+from src.core.context_budget import ContextAssembler, TokenEstimator, TRUNCATION_MARK
+
+
+def conversation(turns, reply_size=10):
+    messages = [{"role": "system", "content": "系统提示"}]
+    for index in range(turns):
+        messages.append({"role": "user", "content": f"问题{index}"})
+        messages.append({"role": "assistant", "content": f"回答{index} " + "x" * reply_size})
+    messages.append({"role": "user", "content": "新问题"})
+    return messages
+
+
+class TestTokenEstimator:
+    @pytest.fixture
+    def estimator(self, temp_dir):
+        return TokenEstimator(path=os.path.join(temp_dir, "calibration.json"))
+
+    def test_count_weights_cjk_and_ascii(self, estimator):
+        assert estimator.count("你好世界") == 4
+        assert estimator.count("x" * 40) == 12
+        assert estimator.count("") == 0
+
+    def test_truncate_keeps_head_and_tail(self, estimator):
+        text = "开头" + "x" * 1000 + "结尾"
+        assert estimator.truncate(text, 1000) == text
+        truncated = estimator.truncate(text, 50, keep_tail=True)
+        assert truncated.startswith("开头") and truncated.endswith("结尾")
+        assert TRUNCATION_MARK in truncated
+        assert estimator.count(truncated) <= 50
+
+    def test_calibrate_moves_toward_actual_and_persists(self, estimator):
+        # 实际 token 数是初始估算的两倍
+        for _ in range(30):
+            estimator.calibrate("m", estimator.count("x" * 100, "m"), 60)
+        assert estimator.count("x" * 100, "m") == pytest.approx(60, abs=3)
+        assert estimator.count("x" * 100, "other") == 30
+
+        # 变化小于 1% 时不写盘，磁盘上的值可能略有滞后
+        with open(estimator.path) as f:
+            assert json.load(f)["m"] == pytest.approx(estimator.scales["m"], rel=0.05)
+        assert TokenEstimator(path=estimator.path).count("x" * 100, "m") == pytest.approx(60, abs=3)
+
+    def test_calibrate_ignores_invalid_usage(self, estimator):
+        estimator.calibrate("m", 0, 100)
+        estimator.calibrate("m", 100, MagicMock())
+        assert estimator.scales == {}
+        assert not os.path.exists(estimator.path)
+
+
+class TestContextAssembler:
+    @pytest.fixture
+    def assembler(self, temp_dir):
+        estimator = TokenEstimator(path=os.path.join(temp_dir, "calibration.json"))
+        return ContextAssembler(
+            budgets={"conversation": {"total": 200, "recent_turns": 2, "recent": 0.35, "older": 0.15,
+                                      "older_turn_tokens": 10}},
+            estimator=estimator
+        )
+
+    def test_small_context_is_unchanged(self, assembler):
+        messages = conversation(2)
+        assert assembler.assemble(messages) == messages
+        assert assembler.last_stats["truncated"] == assembler.last_stats["dropped"] == 0
+
+    def test_drops_oldest_turns_first(self, assembler):
+        messages = conversation(12, reply_size=20)
+        result = assembler.assemble(messages)
+
+        assert result[0] == messages[0] and result[-1] == messages[-1]
+        assert result[-3:-1] == messages[-3:-1]
+        assert result[-5:-3] == messages[-5:-3]
+        assert assembler.last_stats["dropped"] > 0
+        kept_users = [m["content"] for m in result if m["role"] == "user"]
+        assert kept_users == sorted(kept_users, key=lambda q: int(q[2:]) if q != "新问题" else 99)
+        assert "问题0" not in kept_users
+        assert assembler.last_stats["tokens"] <= 200
+
+    def test_truncates_long_recent_reply(self, assembler):
+        messages = conversation(1, reply_size=2000)
+        result = assembler.assemble(messages)
+
+        assert [m["role"] for m in result] == ["system", "user", "assistant", "user"]
+        assert result[2]["content"].startswith("回答0")
+        assert result[2]["content"].endswith(TRUNCATION_MARK)
+        assert assembler.last_stats["tokens"] <= 200
+
+    def test_long_input_is_sent_whole(self, assembler):
+        messages = conversation(3)
+        messages[-1] = {"role": "user", "content": "开始" + "y" * 3000 + "结束"}
+        result = assembler.assemble(messages)
+
+        assert result[-1] == messages[-1]
+        assert assembler.last_stats["truncated"] == 0
+        # 历史仍保留其份额，新输入不会挤掉全部历史
+        assert any(m["role"] == "assistant" for m in result)
+        assert assembler.estimator.count_messages(result[1:-1]) <= 200 * 0.5
+
+    def test_is_deterministic(self, assembler):
+        messages = conversation(12, reply_size=50)
+        assert assembler.assemble(messages) == assembler.assemble(messages)
+        assert messages == conversation(12, reply_size=50)
+
+
+class TestClientIntegration:
+    def test_history_turns_include_replies_and_are_budgeted(self, temp_dir):
+        client = MistralClient({"api_key": "test"})
+        client.assembler = ContextAssembler(
+            budgets={"command": {"total": 60}},
+            estimator=TokenEstimator(path=os.path.join(temp_dir, "calibration.json"))
+        )
+        context = {
+            "mode": "command",
+            "system_prompt": "生成命令",
+            "history": [{"user": f"问题{i}", "system": "回答" * 20} for i in range(10)]
+        }
+        messages, _ = client._prepare_request("新问题", context, {})
+
+        assert messages[0]["role"] == "system"
+        assert messages[-1]["content"] == "新问题"
+        assert messages[-2]["role"] == "assistant"
+        assert len(messages) < 22
+        assert client.assembler.last_stats["tokens"] <= 60
+
+        client.last_usage = {"prompt_tokens": client._prompt_estimate * 2, "completion_tokens": 1, "total_tokens": 1}
+        client._calibrate_estimator()
+        assert client.assembler.estimator.scales["mistral-small-latest"] > 1.0
+
+    def test_large_document_is_not_cut(self, temp_dir):
+        """默认预算下分析大文档：文档完整发送，只有历史受预算限制"""
+        client = MistralClient({"api_key": "test"})
+        client.assembler = ContextAssembler(estimator=TokenEstimator(path=os.path.join(temp_dir, "calibration.json")))
+        document = "\n".join(f"2024-01-01 12:00:{i % 60:02d} ERROR 服务 {i} 请求超时" for i in range(60000))
+        assert len(document) > 1_900_000
+        context = {
+            "mode": "document",
+            "system_prompt": "分析文档",
+            "history": [{"user": f"问题{i}", "system": "分析结果" * 500} for i in range(5)]
+        }
+        messages, _ = client._prepare_request(document, context, {})
+
+        assert messages[-1]["content"] == document
+        history_tokens = client.assembler.estimator.count_messages(messages[1:-1])
+        assert 0 < history_tokens <= 12000 * 0.2
@@ -0,0 +1,136 @@
+import os
+import json
+import shutil
+import pytest
+from src.core import context_manager as context_module
+from src.core.context_manager import ContextManager
+
+
+class TestContextJournal:
+    @pytest.fixture
+    def home(self, tmp_path, monkeypatch):
+        home = tmp_path / "home"
+        home.mkdir()
+        monkeypatch.setenv("HOME", str(home))
+        return home / ".ai_terminal"
+
+    def save_turn(self, index, max_history=20):
+        manager = ContextManager(max_history=max_history)
+        manager.update_environment(env_vars={"HOME": "/Users/me"}, cwd="/tmp/work")
+        manager.update_context(f"问题 {index}", f"回答 {index}", "conversation")
+        manager.save_context_to_disk()
+        return manager
+
+    def test_round_trip(self, home):
+        manager = ContextManager()
+        manager.update_environment(env_vars={"SHELL": "/bin/zsh"}, cwd="/tmp/work", command="ls -la")
+        manager.update_context("什么是 Git？", "Git 是分布式版本控制系统", "conversation")
+        manager.add_document_context("/tmp/notes.txt", summary="摘要")
+        manager.save_context_to_disk()
+        manager.update_context("git log 怎么用", "git log --oneline", "command")
+        manager.save_context_to_disk()
+
+        loaded = ContextManager()
+        assert loaded.conversation_history == manager.conversation_history
+        assert loaded.environment_state == {"SHELL": "/bin/zsh"}
+        assert loaded.current_directory == "/tmp/work"
+        assert loaded.recent_commands == manager.recent_commands
+        assert loaded.document_context["/tmp/notes.txt"]["summary"] == "摘要"
+
+    def test_save_appends_only_new_turn(self, home):
+        for index in range(3):
+            self.save_turn(index)
+        snapshot = os.stat(home / "context.json")
+
+        journal_size = os.path.getsize(home / "context.journal")
+        self.save_turn(3)
+        # 快照不变，日志只多了新的一轮（环境没有变化，不记录）
+        assert os.stat(home / "context.json").st_mtime_ns == snapshot.st_mtime_ns
+        with open(home / "context.journal") as f:
+            lines = f.readlines()
+        assert json.loads(lines[-1])["entry"]["user"] == "问题 3"
+        assert os.path.getsize(home / "context.journal") - journal_size == len(lines[-1].encode("utf-8"))
+        assert [entry["user"] for entry in ContextManager().conversation_history] == [f"问题 {i}" for i in range(4)]
+
+    def test_save_cost_is_flat_with_long_history(self, home, monkeypatch):
+        monkeypatch.setattr(context_module, "COMPACT_RECORDS", 10000)
+        manager = ContextManager(max_history=5000)
+        for index in range(3000):
+            manager.update_context(f"问题 {index}", f"回答 {index}", "conversation")
+        manager.save_context_to_disk()
+        snapshot_size = os.path.getsize(home / "context.json")
+
+        journal_size = os.path.getsize(home / "context.journal")
+        manager = ContextManager(max_history=5000)
+        assert len(manager.conversation_history) == 3000
+        manager.update_context("新问题", "新回答", "conversation")
+        manager.save_context_to_disk()
+        written = os.path.getsize(home / "context.journal") - journal_size
+        assert written < 300 < snapshot_size
+        assert os.path.getsize(home / "context.json") == snapshot_size
+
+    def test_torn_last_record_is_recovered(self, home):
+        for index in range(2):
+            self.save_turn(index)
+        # 模拟写最后一条记录时崩溃
+        with open(home / "context.journal", "a") as f:
+            f.write('{"op": "turn", "entry": {"user": "问题 2", "mo')
+
+        assert [entry["user"] for entry in ContextManager().conversation_history] == ["问题 0", "问题 1"]
+        self.save_turn(3)
+        with open(home / "context.journal") as f:
+            assert all(json.loads(line) for line in f)
+        assert [entry["user"] for entry in ContextManager().conversation_history] == ["问题 0", "问题 1", "问题 3"]
+
+    def test_compaction(self, home, monkeypatch):
+        monkeypatch.setattr(context_module, "COMPACT_RECORDS", 5)
+        for index in range(12):
+            self.save_turn(index, max_history=10)
+
+        with open(home / "context.journal") as f:
+            assert len(f.readlines()) <= 5
+        history = ContextManager(max_history=10).conversation_history
+        assert [entry["user"] for entry in history] == [f"问题 {i}" for i in range(2, 12)]
+
+    def test_crash_during_compaction_does_not_replay_twice(self, home, monkeypatch):
+        for index in range(3):
+            self.save_turn(index)
+        old_journal = home / "old.journal"
+        shutil.copy(home / "context.journal", old_journal)
+
+        # 压缩时替换了快照、还没替换日志就崩溃
+        monkeypatch.setattr(context_module, "COMPACT_RECORDS", 1)
+        self.save_turn(3)
+        shutil.copy(old_journal, home / "context.journal")
+
+        history = ContextManager().conversation_history
+        assert [entry["user"] for entry in history] == [f"问题 {i}" for i in range(4)]
+        monkeypatch.setattr(context_module, "COMPACT_RECORDS", 256)
+        self.save_turn(4)
+        assert len(ContextManager().conversation_history) == 5
+
+    def test_concurrent_sessions_keep_both_turns(self, home):
+        self.save_turn(0)
+        first, second = ContextManager(), ContextManager()
+        first.update_context("第一个会话", "回答", "conversation")
+        second.update_context("第二个会话", "回答", "conversation")
+        first.save_context_to_disk()
+        second.save_context_to_disk()
+        users = [entry["user"] for entry in ContextManager().conversation_history]
+        assert users == ["问题 0", "第一个会话", "第二个会话"]
+
+    def test_migrates_legacy_context_file(self, home):
+        home.mkdir()
+        legacy = {"conversation_history": [{"user": "旧问题", "mode": "conversation", "timestamp": "t"}],
+                  "environment_state": {}, "current_directory": "/tmp", "recent_commands": [],
+                  "document_context": {}}
+        with open(home / "context.json", "w") as f:
+            json.dump(legacy, f, ensure_ascii=False, indent=2)
+
+        manager = ContextManager()
+        assert manager.conversation_history == legacy["conversation_history"]
+        manager.update_context("新问题", "新回答", "conversation")
+        manager.save_context_to_disk()
+        assert [entry["user"] for entry in ContextManager().conversation_history] == ["旧问题", "新问题"]
+        with open(home / "context.json") as f:
+            assert json.load(f)["journal"]
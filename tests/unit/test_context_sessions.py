@@ -0,0 +1,119 @@
+import json
+import sqlite3
+import pytest
+from src.core import context_manager as context_module
+from src.core.context_manager import ContextManager, current_session
+from src.core.context_store import SQLiteContextManager
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setenv("HOME", str(home))
+    return home / ".ai_terminal"
+
+
+def save_turn(manager_class, session, user, history_scope="session", max_history=20):
+    manager = manager_class(max_history=max_history, session=session, history_scope=history_scope)
+    manager.update_context(user, "回答", "conversation")
+    manager.save_context_to_disk()
+    return manager
+
+
+def users(history):
+    return [entry["user"] for entry in history]
+
+
+class TestSessionHistory:
+    @pytest.mark.parametrize("manager_class", [ContextManager, SQLiteContextManager])
+    def test_session_and_global_views(self, home, manager_class):
+        save_turn(manager_class, "pane-1", "窗格 1 的问题")
+        save_turn(manager_class, "pane-2", "窗格 2 的问题")
+        save_turn(manager_class, "pane-1", "窗格 1 的第二个问题")
+
+        manager = manager_class(session="pane-1")
+        assert users(manager.build_context_for_mistral("conversation")["history"]) == [
+            "窗格 1 的问题", "窗格 1 的第二个问题"]
+        assert users(manager_class(session="pane-2")._get_relevant_history("conversation")) == ["窗格 2 的问题"]
+
+        shared = manager_class(session="pane-2", history_scope="global")
+        assert users(shared._get_relevant_history("conversation")) == [
+            "窗格 1 的问题", "窗格 2 的问题", "窗格 1 的第二个问题"]
+
+    def test_trimming_is_per_session(self, home):
+        for index in range(5):
+            save_turn(ContextManager, "pane-1", f"窗格 1 的问题 {index}", max_history=3)
+        save_turn(ContextManager, "pane-2", "窗格 2 的问题", max_history=3)
+
+        manager = ContextManager(max_history=3, session="pane-2")
+        assert users(manager._get_relevant_history("conversation")) == ["窗格 2 的问题"]
+        assert users(manager.conversation_history) == [f"窗格 1 的问题 {i}" for i in (2, 3, 4)] + ["窗格 2 的问题"]
+
+    def test_total_history_is_bounded(self, home, monkeypatch):
+        monkeypatch.setattr(context_module, "MAX_SESSIONS", 1)
+        for index in range(4):
+            save_turn(ContextManager, f"pane-{index}", f"问题 {index}", max_history=2)
+        assert users(ContextManager(max_history=2).conversation_history) == ["问题 2", "问题 3"]
+
+    def test_current_session(self, monkeypatch):
+        monkeypatch.setenv("AI_TERMINAL_SESSION", "pane-7")
+        assert current_session() == "pane-7"
+        monkeypatch.delenv("AI_TERMINAL_SESSION")
+        monkeypatch.setattr(context_module.os, "ttyname", lambda fd: "/dev/pts/3")
+        assert current_session() == "/dev/pts/3"
+        assert ContextManager.from_config({"history_scope": "global"}).history_scope == "global"
+        with pytest.raises(ValueError):
+            ContextManager.from_config({"history_scope": "pane"})
+
+    def test_read_during_compaction_is_consistent(self, home, monkeypatch):
+        """读取不加锁：打开日志和读快照之间其他进程压缩了上下文，仍然读到全部对话"""
+        for index in range(3):
+            save_turn(ContextManager, "pane-1", f"问题 {index}")
+
+        read = ContextManager._read_snapshot_and_journal
+
+        def compact_in_between(self, state, journal):
+            monkeypatch.setattr(ContextManager, "_read_snapshot_and_journal", read)
+            monkeypatch.setattr(context_module, "COMPACT_RECORDS", 1)
+            save_turn(ContextManager, "pane-2", "压缩时的问题")
+            return read(self, state, journal)
+
+        monkeypatch.setattr(ContextManager, "_read_snapshot_and_journal", compact_in_between)
+        manager = ContextManager(session="pane-1", history_scope="global")
+        assert users(manager.conversation_history) == ["问题 0", "问题 1", "问题 2", "压缩时的问题"]
+
+    def test_sqlite_schema_upgrade(self, home):
+        home.mkdir()
+        conn = sqlite3.connect(str(home / "history.db"))
+        conn.execute("CREATE TABLE turns (id INTEGER PRIMARY KEY, timestamp TEXT NOT NULL, mode TEXT NOT NULL, "
+                     "cwd TEXT, user TEXT NOT NULL, system TEXT)")
+        conn.execute("INSERT INTO turns (timestamp, mode, user) "
+                     "VALUES ('2020-01-01T00:00:00', 'conversation', '升级前的问题')")
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+        conn.close()
+
+        manager = SQLiteContextManager()
+        assert users(manager.conversation_history) == ["升级前的问题"]
+        save_turn(SQLiteContextManager, "pane-1", "升级后的问题")
+        save_turn(SQLiteContextManager, "pane-2", "其他窗格的问题")
+        assert users(SQLiteContextManager(session="pane-1").conversation_history) == ["升级前的问题", "升级后的问题"]
+        assert users(SQLiteContextManager(history_scope="global").conversation_history) == [
+            "升级前的问题", "升级后的问题", "其他窗格的问题"]
+
+    @pytest.mark.parametrize("manager_class", [ContextManager, SQLiteContextManager])
+    def test_pre_upgrade_history_is_visible_in_every_session(self, home, manager_class):
+        """升级前的 context.json 没有会话标识：这些对话在每个会话中都可见，新对话仍按会话分开"""
+        home.mkdir()
+        legacy = [{"user": f"升级前的问题 {i}", "timestamp": f"2020-01-0{i + 1}T00:00:00", "mode": "conversation",
+                   "system": "回答"} for i in range(2)]
+        (home / "context.json").write_text(json.dumps({"conversation_history": legacy}), encoding="utf-8")
+
+        save_turn(manager_class, "pane-1", "窗格 1 的问题")
+        save_turn(manager_class, "pane-2", "窗格 2 的问题")
+
+        for session in ("pane-1", "pane-2", "pane-3"):
+            history = manager_class(session=session).build_context_for_mistral("conversation")["history"]
+            own = [f"窗格 {session[-1]} 的问题"] if session != "pane-3" else []
+            assert users(history) == ["升级前的问题 0", "升级前的问题 1"] + own
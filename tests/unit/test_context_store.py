@@ -0,0 +1,129 @@
+import copy
+import sqlite3
+import pytest
+from src.core.context_manager import ContextManager
+from src.core.context_store import SQLiteContextManager
+
+
+class TestSQLiteContextStore:
+    @pytest.fixture
+    def home(self, tmp_path, monkeypatch):
+        home = tmp_path / "home"
+        home.mkdir()
+        monkeypatch.setenv("HOME", str(home))
+        return home / ".ai_terminal"
+
+    def save_turn(self, user, mode="conversation", cwd="/tmp/work"):
+        manager = SQLiteContextManager()
+        manager.update_environment(cwd=cwd)
+        manager.update_context(user, f"{user} 的回答", mode)
+        manager.save_context_to_disk()
+        return manager
+
+    def test_round_trip(self, home):
+        manager = SQLiteContextManager()
+        manager.update_environment(env_vars={"SHELL": "/bin/zsh"}, cwd="/tmp/work", command="ls -la")
+        manager.update_context("什么是 Git？", "Git 是分布式版本控制系统", "conversation")
+        manager.add_document_context("/tmp/notes.txt", summary="摘要")
+        # 保存前也能读到本次调用的变化
+        assert manager.conversation_history[-1]["user"] == "什么是 Git？"
+        manager.save_context_to_disk()
+
+        loaded = SQLiteContextManager()
+        assert loaded.conversation_history == manager.conversation_history
+        assert loaded.environment_state == {"SHELL": "/bin/zsh"}
+        assert loaded.current_directory == "/tmp/work"
+        assert loaded.recent_commands == manager.recent_commands
+        assert loaded.document_context["/tmp/notes.txt"]["summary"] == "摘要"
+        assert not (home / "context.json").exists()
+
+    def test_wal_mode(self, home):
+        self.save_turn("问题")
+        conn = sqlite3.connect(str(home / "history.db"))
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0] == 1
+
+    def test_migrates_json_store_once(self, home):
+        journal = ContextManager()
+        journal.update_environment(env_vars={"LANG": "zh_CN.UTF-8"}, cwd="/tmp/old")
+        journal.update_context("旧问题", "旧回答", "conversation")
+        journal.save_context_to_disk()
+        # 日志中尚未压缩进快照的一轮也会导入
+        journal.update_context("旧命令问题", "ls", "command")
+        journal.save_context_to_disk()
+
+        manager = SQLiteContextManager()
+        assert [entry["user"] for entry in manager.conversation_history] == ["旧问题", "旧命令问题"]
+        assert manager.environment_state == {"LANG": "zh_CN.UTF-8"}
+        assert manager.current_directory == "/tmp/old"
+
+        manager.update_context("新问题", "新回答", "conversation")
+        manager.save_context_to_disk()
+        users = [entry["user"] for entry in SQLiteContextManager().conversation_history]
+        assert users == ["旧问题", "旧命令问题", "新问题"]
+
+    def test_relevant_history_uses_indexes(self, home):
+        manager = SQLiteContextManager(max_history=1000)
+        for index in range(300):
+            manager.update_context(f"对话 {index:03d}", "回答", "conversation")
+        manager.update_context("命令 0", "ls", "command")
+        manager.save_context_to_disk()
+
+        manager = SQLiteContextManager()
+        assert len(manager.conversation_history) == 20
+        relevant = manager._get_relevant_history("command", max_entries=4)
+        # 同模式只有一条，用最近的其他对话补足，结果按时间顺序
+        assert [entry["user"] for entry in relevant] == ["对话 297", "对话 298", "对话 299", "命令 0"]
+
+        conn = sqlite3.connect(str(home / "history.db"))
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM turns WHERE mode = ? ORDER BY timestamp DESC, id DESC LIMIT 5",
+            ("command",)))
+        assert "turns_mode_time" in plan
+
+    def test_relevant_history_prefers_current_directory(self, home):
+        self.save_turn("项目里的问题", cwd="/tmp/project")
+        self.save_turn("别处的问题", cwd="/tmp/other")
+        manager = SQLiteContextManager()
+        manager.update_environment(cwd="/tmp/project")
+        manager.update_context("未保存的问题", "回答", "conversation")
+
+        relevant = manager._get_relevant_history("command", max_entries=4)
+        assert [entry["user"] for entry in relevant] == ["项目里的问题", "别处的问题", "未保存的问题"]
+        # 名额不够时先取未保存的，再取当前目录中的
+        relevant = manager._get_relevant_history("command", max_entries=2)
+        assert [entry["user"] for entry in relevant] == ["项目里的问题", "未保存的问题"]
+
+    def test_concurrent_sessions_keep_both_turns(self, home):
+        self.save_turn("问题 0")
+        first, second = SQLiteContextManager(), SQLiteContextManager()
+        first.update_context("第一个会话", "回答", "conversation")
+        second.update_context("第二个会话", "回答", "conversation")
+        first.save_context_to_disk()
+        second.save_context_to_disk()
+        users = [entry["user"] for entry in SQLiteContextManager().conversation_history]
+        assert users == ["问题 0", "第一个会话", "第二个会话"]
+
+    def test_deepcopy_and_cleared_history(self, home):
+        self.save_turn("已保存的问题")
+        manager = SQLiteContextManager()
+        # 批量模式：每条记录使用清空历史的副本
+        clone = copy.deepcopy(manager)
+        clone.conversation_history = []
+        clone.update_context("批量问题", "回答", "conversation")
+        assert [entry["user"] for entry in clone.conversation_history] == ["批量问题"]
+        assert [entry["user"] for entry in manager.conversation_history] == ["已保存的问题"]
+        users = [entry["user"] for entry in clone.build_context_for_mistral("conversation")["history"]]
+        assert users == ["批量问题"]
+
+    def test_from_config_and_storage_signature(self, home):
+        assert type(ContextManager.from_config(None)) is ContextManager
+        manager = ContextManager.from_config({"context_backend": "sqlite", "max_history": 5})
+        assert isinstance(manager, SQLiteContextManager) and manager.max_history == 5
+        with pytest.raises(ValueError):
+            ContextManager.from_config({"context_backend": "redis"})
+
+        before = manager.storage_signature()
+        manager.update_context("问题", "回答", "conversation")
+        manager.save_context_to_disk()
+        assert manager.storage_signature() != before
@@ -0,0 +1,34 @@
+from src.core.early_stop import EarlyStop
+
+
+def feed_all(detector, pieces):
+    output = []
+    for piece in pieces:
+        text, stopped = detector.feed(piece)
+        output.append(text)
+        if stopped:
+            return "".join(output), True
+    return "".join(output) + detector.flush(), False
+
+
+class TestEarlyStop:
+    def test_stops_when_first_code_block_closes(self):
+        reply = "```zsh\nfind . -size +100M\n```\n这个命令会查找大于 100MB 的文件。"
+        pieces = [reply[i:i + 3] for i in range(0, len(reply), 3)]
+        assert feed_all(EarlyStop(), pieces) == ("```zsh\nfind . -size +100M\n```", True)
+
+    def test_fence_split_across_chunks(self):
+        pieces = ["说明：\n`", "``bash\nls -la\n`", "`", "`\n后面的文字"]
+        assert feed_all(EarlyStop(), pieces) == ("说明：\n```bash\nls -la\n```", True)
+
+    def test_stop_sequence_is_not_emitted(self):
+        detector = EarlyStop(["\n\n说明"], code_block=False)
+        assert feed_all(detector, ["ls -la", "\n\n说", "明：列出文件"]) == ("ls -la", True)
+
+    def test_partial_marker_is_released_when_stream_ends(self):
+        detector = EarlyStop(["END"], code_block=False)
+        assert feed_all(detector, ["ls -la E", "N"]) == ("ls -la EN", False)
+
+    def test_truncate_full_response(self):
+        assert EarlyStop().truncate("```\nls\n```\n解释") == "```\nls\n```"
+        assert EarlyStop().truncate("没有代码块") == "没有代码块"
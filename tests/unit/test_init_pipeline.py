@@ -0,0 +1,41 @@
+import time
+import pytest
+from src.core.init_pipeline import InitPipeline
+
+
+class TestInitPipeline:
+    def test_independent_steps_overlap(self):
+        pipeline = InitPipeline()
+        pipeline.add("a", lambda: time.sleep(0.2) or "a")
+        pipeline.add("b", lambda: time.sleep(0.2) or "b")
+
+        start = time.perf_counter()
+        pipeline.start()
+        assert pipeline.result("a") == "a"
+        assert pipeline.result("b") == "b"
+        assert time.perf_counter() - start < 0.35
+
+    def test_dependencies_and_critical_path(self):
+        pipeline = InitPipeline()
+        pipeline.add("config", lambda: time.sleep(0.05) or {"api": {}})
+        pipeline.add("context", lambda: "ctx")
+        pipeline.add("client", lambda: ("client", pipeline.result("config")), deps=["config"])
+        pipeline.start()
+
+        assert pipeline.result("client") == ("client", {"api": {}})
+        pipeline.result("context")
+        assert pipeline.critical_path(["config", "context", "client"]) == ["config", "client"]
+        assert any("关键路径" in line for line in pipeline.report(["client"]))
+
+    def test_failure_propagates_to_dependents(self):
+        pipeline = InitPipeline()
+
+        def fail():
+            raise ValueError("缺少 API 密钥")
+
+        pipeline.add("client", fail)
+        pipeline.add("connect", lambda: "connected", deps=["client"])
+        pipeline.start()
+
+        with pytest.raises(ValueError):
+            pipeline.result("connect", timeout=5)
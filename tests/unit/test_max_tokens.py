@@ -0,0 +1,43 @@
+import os
+import pytest
+from src.core.max_tokens import AdaptiveMaxTokens, MIN_USAGE_SAMPLES
+
+
+class TestAdaptiveMaxTokens:
+    @pytest.fixture
+    def policy(self, temp_dir):
+        return AdaptiveMaxTokens(path=os.path.join(temp_dir, "usage.json"), ceiling=2048)
+
+    def test_key_from_context(self):
+        assert AdaptiveMaxTokens.key({"mode": "command", "action": "explain"}) == "command/explain"
+        assert AdaptiveMaxTokens.key({}) == "conversation/default"
+
+    def test_uses_default_until_enough_samples(self, policy):
+        for _ in range(MIN_USAGE_SAMPLES - 1):
+            policy.record("command/generate", 40)
+        assert policy.limit("command/generate", 512) == 512
+
+        policy.record("command/generate", 40)
+        assert policy.limit("command/generate", 512) == 64  # 40 * 1.5 低于下限
+        assert policy.limit("command/explain", 512) == 512
+
+    def test_limit_follows_high_percentile(self, policy):
+        for tokens in range(100, 300, 10):
+            policy.record("document/summarize", tokens)
+        assert policy.limit("document/summarize", 2048) == int(280 * 1.5)
+
+        # 用量超过默认值时可以提高上限，但不超过 ceiling
+        for _ in range(100):
+            policy.record("document/summarize", 3000)
+        assert policy.limit("document/summarize", 1024) == 2048
+
+    def test_samples_persist(self, policy):
+        for _ in range(MIN_USAGE_SAMPLES):
+            policy.record("command/explain", 200)
+        reloaded = AdaptiveMaxTokens(path=policy.path, ceiling=2048)
+        assert reloaded.limit("command/explain", 512) == 300
+
+    def test_expand_doubles_up_to_ceiling(self, policy):
+        assert policy.expand(300) == 600
+        assert policy.expand(1500) == 2048
+        assert policy.expand(2048) is None
@@ -0,0 +1,105 @@
+import os
+import pytest
+from unittest.mock import MagicMock
+from src.core.model_cascade import ModelCascade
+from src.handlers.command_handler import CommandHandler
+from src.handlers.conversation_handler import ConversationHandler
+
+
+@pytest.fixture
+def cascade(temp_dir):
+    return ModelCascade(rungs=["small", "medium", "large"], path=os.path.join(temp_dir, "cascade.json"))
+
+
+def make_client(cascade, answers):
+    """按模型返回预设回答的 LLM 客户端"""
+    client = MagicMock()
+    client.cascade = cascade
+    client.last_finish_reason = "stop"
+    client.generate_response.side_effect = lambda prompt, context, model=None, **kwargs: answers[model]
+    return client
+
+
+def make_context_manager(mode):
+    context_manager = MagicMock()
+    context_manager.build_context_for_mistral.return_value = {"mode": mode}
+    return context_manager
+
+
+class TestModelCascade:
+    def test_check_reasons(self):
+        generate = {"mode": "command", "action": "generate"}
+        assert ModelCascade.check("") == "empty"
+        assert ModelCascade.check("部分回答", finish_reason="length") == "truncated"
+        assert ModelCascade.check("```zsh\nls -la\n") == "malformed_code"
+        assert ModelCascade.check("```zsh\n\n```") == "empty_code"
+        assert ModelCascade.check("你可以用 find 命令", generate) == "no_code"
+        assert ModelCascade.check("抱歉，我无法回答这个问题") == "refusal"
+        assert ModelCascade.check("I'm not sure, but maybe") == "refusal"
+        assert ModelCascade.check("```zsh\nls -la\n```", generate) is None
+        assert ModelCascade.check("使用 `ls -la` 列出文件", generate) is None
+
+    def test_applies_to_short_requests_in_configured_modes(self, cascade):
+        assert cascade.applies("command", "列出文件")
+        assert not cascade.applies("document", "总结文件")
+        assert not cascade.applies("conversation", "很长的问题" * 100)
+
+    def test_from_config(self):
+        assert ModelCascade.from_config(None) is None
+        assert ModelCascade.from_config({"enabled": True, "rungs": ["only"]}) is None
+        assert ModelCascade.from_config({"enabled": True, "rungs": ["a", "b"]}).rungs == ["a", "b"]
+
+    def test_records_answers_and_saved_latency(self, cascade):
+        cascade.record("large", [{"model": "large", "seconds": 2.0, "reason": None}])
+        saved = cascade.record("small", [{"model": "small", "seconds": 0.5, "reason": None}])
+        assert saved == pytest.approx(1.5)
+
+        reloaded = ModelCascade(rungs=cascade.rungs, path=cascade.path)
+        assert reloaded.stats["answered"] == {"large": 1, "small": 1}
+        assert reloaded.stats["saved_seconds"] == pytest.approx(1.5)
+        assert reloaded.summary()[0] == "small: 回答 1 次"
+
+
+class TestCascadedHandler:
+    def test_small_model_answer_is_used(self, cascade):
+        client = make_client(cascade, {"small": "你好！", "medium": "x", "large": "x"})
+        handler = ConversationHandler(client, make_context_manager("conversation"))
+
+        assert handler.handle("你好") == "你好！"
+        assert client.generate_response.call_count == 1
+        assert handler.cascade_result["model"] == "small"
+
+    def test_escalates_on_failed_check_and_error(self, cascade):
+        answers = {"small": "抱歉，我无法回答", "large": "```zsh\nfind . -size +100M\n```"}
+        client = make_client(cascade, answers)
+
+        def generate(prompt, context, model=None, **kwargs):
+            if model == "medium":
+                raise ConnectionError("unavailable")
+            return answers[model]
+        client.generate_response.side_effect = generate
+
+        handler = CommandHandler(client, make_context_manager("command"), {"cache": {"enabled": False}})
+        assert handler.handle("生成查找大文件的命令") == answers["large"]
+        assert [a["reason"] for a in handler.cascade_result["attempts"]] == ["refusal", "error", None]
+        assert cascade.stats["escalations"] == {"refusal": 1, "error": 1}
+        assert handler.cascade_result["saved"] < 0
+
+    def test_escalate_flag_uses_top_rung(self, cascade):
+        client = make_client(cascade, {"small": "x", "medium": "x", "large": "大模型回答"})
+        handler = ConversationHandler(client, make_context_manager("conversation"))
+        handler.escalate = True
+
+        assert handler.handle("你好") == "大模型回答"
+        assert client.generate_response.call_args.kwargs["model"] == "large"
+
+    def test_streams_only_the_accepted_answer(self, cascade):
+        client = make_client(cascade, {"small": "", "medium": "中等模型回答", "large": "x"})
+        handler = ConversationHandler(client, make_context_manager("conversation"), {"mistral": {"stream": True}})
+        tokens = []
+        handler.on_token = tokens.append
+
+        assert handler.handle("你好") == "中等模型回答"
+        assert tokens == ["中等模型回答"]
+        assert handler.streamed
+        client.generate_streaming_response.assert_not_called()
@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+import pytest
+from types import SimpleNamespace
+from src.core.rate_limiter import RateLimiter, retry_after
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# 子进程：从共享状态中尽量多地取令牌（不等待补充），输出成功次数
+WORKER = """
+import sys
+from src.core.rate_limiter import RateLimiter
+limiter = RateLimiter(rpm=10, path=sys.argv[1])
+granted = 0
+for _ in range(5):
+    try:
+        limiter.acquire(timeout=0.05)
+        granted += 1
+    except TimeoutError:
+        pass
+print(granted)
+"""
+
+
+class TestRateLimiter:
+    @pytest.fixture
+    def path(self, temp_dir):
+        return f"{temp_dir}/rate_limit.json"
+
+    def test_requests_per_minute(self, path):
+        limiter = RateLimiter(rpm=2, path=path)
+        limiter.acquire(timeout=0.1)
+        limiter.acquire(timeout=0.1)
+        with pytest.raises(TimeoutError):
+            limiter.acquire(timeout=0.1)
+
+    def test_tokens_per_minute_and_settle(self, path):
+        limiter = RateLimiter(tpm=1000, path=path)
+        limiter.acquire(800, timeout=0.1)
+        with pytest.raises(TimeoutError):
+            limiter.acquire(800, timeout=0.1)
+        # 实际只用了 100 个 token，退还其余部分
+        limiter.settle(800, 100)
+        limiter.acquire(800, timeout=0.1)
+
+    def test_oversized_request_is_not_starved(self, path):
+        limiter = RateLimiter(tpm=1000, path=path)
+        assert limiter.acquire(5000, timeout=0.1) < 0.1
+
+    def test_state_is_shared_between_instances(self, path):
+        RateLimiter(rpm=3, path=path).acquire(timeout=0.1)
+        RateLimiter(rpm=3, path=path).acquire(timeout=0.1)
+        RateLimiter(rpm=3, path=path).acquire(timeout=0.1)
+        with pytest.raises(TimeoutError):
+            RateLimiter(rpm=3, path=path).acquire(timeout=0.1)
+
+    def test_state_is_shared_between_processes(self, path):
+        workers = [subprocess.Popen([sys.executable, "-c", WORKER, path], cwd=PROJECT_ROOT,
+                                    stdout=subprocess.PIPE, text=True)
+                   for _ in range(4)]
+        granted = sum(int(worker.communicate(timeout=30)[0]) for worker in workers)
+        # 10 个初始令牌，加上进程运行期间补充的至多一两个
+        assert 10 <= granted <= 12
+
+    def test_aimd(self, path):
+        limiter = RateLimiter(path=path)
+        limiter.throttle()
+        assert limiter.rate == 0.5
+        # 同一批并发请求的多个 429 只减速一次
+        limiter.throttle()
+        assert limiter.rate == 0.5
+        for _ in range(5):
+            limiter.succeeded()
+        assert limiter.rate == pytest.approx(0.75)
+        for _ in range(10):
+            limiter.succeeded()
+        assert limiter.rate == 1.0
+
+    def test_retry_after_blocks_all_instances(self, path):
+        RateLimiter(path=path).throttle(0.3)
+        assert RateLimiter(path=path).acquire() >= 0.25
+
+    def test_background_leaves_reserve_for_interactive(self, path):
+        background = RateLimiter(rpm=10, reserve=0.2, path=path, priority="background")
+        granted = 0
+        for _ in range(10):
+            try:
+                background.acquire(timeout=0.01)
+                granted += 1
+            except TimeoutError:
+                break
+        assert granted == 8
+        interactive = RateLimiter(rpm=10, reserve=0.2, path=path)
+        interactive.acquire(timeout=0.01)
+        interactive.acquire(timeout=0.01)
+
+    def test_interactive_waiter_goes_first(self, path):
+        # 每秒补充一个令牌
+        interactive = RateLimiter(rpm=60, reserve=0, path=path)
+        background = RateLimiter(rpm=60, reserve=0, path=path, priority="background")
+        for _ in range(60):
+            interactive.acquire()
+        order = []
+        threads = [
+            threading.Thread(target=lambda: (background.acquire(), order.append("background"))),
+            threading.Thread(target=lambda: (interactive.acquire(), order.append("interactive")))
+        ]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join(timeout=10)
+        assert order == ["interactive", "background"]
+
+    def test_invalid_priority(self, path):
+        with pytest.raises(ValueError):
+            RateLimiter(path=path, priority="urgent")
+
+    def test_retry_after_parsing(self):
+        assert retry_after(SimpleNamespace(headers={"Retry-After": "2"})) == 2.0
+        sdk_error = SimpleNamespace(raw_response=SimpleNamespace(headers={"retry-after": "1.5"}))
+        assert retry_after(sdk_error) == 1.5
+        date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+        assert 25 < retry_after(SimpleNamespace(headers={"Retry-After": date})) <= 30
+        assert retry_after(SimpleNamespace(headers={})) is None
+        assert retry_after(ValueError("no headers")) is None
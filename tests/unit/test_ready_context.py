@@ -0,0 +1,80 @@
+import os
+import pytest
+from src.core.context_manager import ContextManager
+from src.core.ready_context import (
+    PrewarmedContextManager, load_ready_context, refresh_ready_context
+)
+
+
+class TestReadyContext:
+    @pytest.fixture
+    def env(self, tmp_path, monkeypatch):
+        """隔离 HOME 和工作目录，准备一条历史记录"""
+        home = tmp_path / "home"
+        home.mkdir()
+        monkeypatch.setenv("HOME", str(home))
+        monkeypatch.setenv("AI_TERMINAL_SESSION", "pane-1")
+        workdir = tmp_path / "work"
+        workdir.mkdir()
+        monkeypatch.chdir(workdir)
+
+        config_path = str(tmp_path / "config.yaml")
+        with open(config_path, "w") as f:
+            f.write("terminal:\n  max_history: 20\n")
+
+        manager = ContextManager(session="pane-1")
+        manager.update_context("什么是 Git？", "Git 是分布式版本控制系统", "conversation")
+        manager.save_context_to_disk()
+        return config_path
+
+    def test_refresh_then_load(self, env):
+        assert refresh_ready_context(env)
+        snapshot = load_ready_context(env)
+        assert snapshot is not None
+        history = snapshot["contexts"]["conversation"]["history"]
+        assert history[-1]["user"] == "什么是 Git？"
+        assert set(snapshot["system_versions"]) == {"macos_version", "zsh_version"}
+
+    def test_refresh_is_skipped_while_valid(self, env):
+        assert refresh_ready_context(env)
+        assert not refresh_ready_context(env)
+
+    def test_history_change_invalidates(self, env):
+        refresh_ready_context(env)
+        manager = ContextManager()
+        manager.update_context("新问题", "新回答", "conversation")
+        manager.save_context_to_disk()
+        assert load_ready_context(env) is None
+
+    def test_cwd_and_config_change_invalidate(self, env, tmp_path, monkeypatch):
+        refresh_ready_context(env)
+        assert load_ready_context(env, cwd=str(tmp_path)) is None
+
+        with open(env, "a") as f:
+            f.write("ui:\n  theme: dark\n")
+        assert load_ready_context(env) is None
+
+    def test_prewarmed_manager_returns_copies_and_delegates(self, env):
+        refresh_ready_context(env)
+        loaded = []
+        real = ContextManager()
+        manager = PrewarmedContextManager(load_ready_context(env), lambda: loaded.append(1) or real)
+
+        context = manager.build_context_for_mistral("command")
+        context["action"] = "generate"
+        assert "action" not in manager.build_context_for_mistral("command")
+        assert loaded == []
+
+        assert manager.conversation_history == real.conversation_history
+        assert loaded
+
+    def test_sessions_use_separate_snapshots(self, env, monkeypatch):
+        assert refresh_ready_context(env)
+        monkeypatch.setenv("AI_TERMINAL_SESSION", "pane-2")
+        assert load_ready_context(env) is None
+        assert refresh_ready_context(env)
+        assert load_ready_context(env)["contexts"]["conversation"]["history"] == []
+
+        # 另一个会话的快照仍然有效
+        monkeypatch.setenv("AI_TERMINAL_SESSION", "pane-1")
+        assert load_ready_context(env)["contexts"]["conversation"]["history"][-1]["user"] == "什么是 Git？"
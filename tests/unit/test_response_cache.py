@@ -0,0 +1,53 @@
+import os
+import time
+import pytest
+from src.core.llm_client import MistralClient
+from src.core.response_cache import ResponseCache
+
+
+class TestResponseCache:
+    @pytest.fixture
+    def cache(self, temp_dir):
+        return ResponseCache(directory=os.path.join(temp_dir, "cache"), ttl=3600, max_size=10 * 1024)
+
+    def test_key_normalizes_messages(self):
+        params = {"temperature": 0.7, "max_tokens": 100, "top_p": 0.9}
+        key = ResponseCache.make_key("m", [{"role": "user", "content": "ls\r\n"}], params)
+        assert key == ResponseCache.make_key("m", [{"role": "user", "content": " ls"}], params)
+        assert key != ResponseCache.make_key("m", [{"role": "user", "content": "ls"}], {**params, "temperature": 0.2})
+        assert key != ResponseCache.make_key("other", [{"role": "user", "content": "ls"}], params)
+
+    def test_put_get_and_ttl(self, cache):
+        cache.put("ab" * 32, "结果", {"total_tokens": 3}, "stop")
+        assert cache.get("ab" * 32)["content"] == "结果"
+        assert os.path.isfile(os.path.join(cache.directory, "ab", "ab" * 31 + ".json"))
+
+        cache.ttl = -1
+        assert cache.get("ab" * 32) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_eviction_removes_least_recently_used(self, cache):
+        keys = [f"{i:02x}" * 32 for i in range(6)]
+        for index, key in enumerate(keys):
+            cache.put(key, "x" * 1500)
+            os.utime(cache._path(key), (time.time() - 100 + index, time.time() - 100 + index))
+        # 访问最早写入的条目，使其成为最近使用
+        assert cache.get(keys[0]) is not None
+
+        cache.put("ff" * 32, "x" * 1500)
+        assert cache.get(keys[0]) is not None
+        assert cache.get(keys[1]) is None
+        assert cache.get("ff" * 32) is not None
+
+    def test_client_round_trips_once(self, cache, fake_server):
+        client = MistralClient({"api_key": "test_key", "server_url": fake_server.url})
+        client.cache = cache
+
+        assert client.generate_response("解释 ps aux") == fake_server.reply
+        assert "".join(client.generate_streaming_response("解释 ps aux")) == fake_server.reply
+        assert len(fake_server.requests) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        client.refresh_cache = True
+        client.generate_response("解释 ps aux")
+        assert len(fake_server.requests) == 2
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import pytest
+from unittest.mock import MagicMock
+from src.core.speculation import SpeculativeDispatcher, fits_mode
+from src.utils.mode_detector import detect_mode, rank_modes
+
+PROSE = "这是一段比较长的说明文字，用来回答用户的一般性问题。" * 6
+COMMAND = "可以使用：\n```zsh\nfind . -size +100M\n```\n"
+
+
+class FakeHandler:
+    """按固定间隔逐段输出的处理器"""
+
+    def __init__(self, text, delay=0.01, error=None):
+        self.text = text
+        self.delay = delay
+        self.error = error
+        self.on_token = None
+        self.emitted = 0
+        self.llm_client = MagicMock(last_usage={"prompt_tokens": 50, "completion_tokens": 20})
+
+    def handle(self, user_input):
+        for i in range(0, len(self.text), 4):
+            time.sleep(self.delay)
+            self.on_token(self.text[i:i + 4])
+            self.emitted += 1
+        if self.error:
+            raise self.error
+        return self.text
+
+
+@pytest.fixture
+def dispatcher(temp_dir):
+    return SpeculativeDispatcher(path=os.path.join(temp_dir, "speculation.json"))
+
+
+class TestModeConfidence:
+    def test_rank_modes(self):
+        ranking = rank_modes("你好")
+        assert ranking[0] == ("conversation", 1.0)
+        assert abs(sum(confidence for _, confidence in ranking) - 1.0) < 1e-9
+
+        # 像命令请求但没有命中规则：检测结果不变，置信度降低
+        ranking = rank_modes("如何查找大于100MB的文件")
+        assert detect_mode("如何查找大于100MB的文件") == ranking[0][0] == "conversation"
+        assert ranking[1][0] == "command"
+        assert ranking[0][1] < 0.6
+
+        ranking = rank_modes("解释 ls -la 命令")
+        assert ranking[0][0] == "command" and ranking[0][1] >= 0.6
+
+    def test_fits_mode(self):
+        assert fits_mode("command", COMMAND)
+        assert not fits_mode("command", "可以使用 `find` 命令")
+        assert fits_mode("command", "可以使用 `find` 命令", finished=True)
+        assert fits_mode("conversation", PROSE)
+        assert not fits_mode("conversation", PROSE[:20])
+        assert fits_mode("conversation", PROSE[:20], finished=True)
+        assert not fits_mode("document", PROSE + COMMAND)
+
+
+class TestSpeculativeDispatcher:
+    def test_disabled_by_default(self):
+        assert SpeculativeDispatcher.from_config(None) is None
+        assert SpeculativeDispatcher.from_config({"threshold": 0.5}) is None
+        assert SpeculativeDispatcher.from_config({"enabled": True}) is not None
+
+    def test_plan_respects_limits(self, dispatcher):
+        ambiguous = rank_modes("如何查找大于100MB的文件")
+        assert dispatcher.plan(rank_modes("你好"), "你好", stream=True) is None
+        assert dispatcher.plan(ambiguous, "如何查找大于100MB的文件", stream=True) == ["conversation", "command"]
+        assert dispatcher.plan(ambiguous, "如何查找大于100MB的文件", stream=False) is None
+        assert dispatcher.plan(ambiguous, "如何查找" * 100, stream=True) is None
+
+        dispatcher.stats["today"] = {"date": time.strftime("%Y-%m-%d"), "tokens": dispatcher.daily_token_budget}
+        assert dispatcher.plan(ambiguous, "如何查找大于100MB的文件", stream=True) is None
+        assert dispatcher.stats["ambiguous"] == 4
+        assert dispatcher.stats["skipped"] == {"no_stream": 1, "long_input": 1, "budget": 1}
+
+    def test_alternative_wins_and_loser_is_cancelled(self, dispatcher):
+        primary, alternative = FakeHandler(PROSE), FakeHandler(COMMAND)
+        output = []
+        mode, handler, response = dispatcher.run(
+            [("conversation", primary), ("command", alternative)], "如何查找大于100MB的文件", output.append)
+
+        assert (mode, handler, response) == ("command", alternative, COMMAND)
+        assert "".join(output) == COMMAND
+        time.sleep(0.05)
+        assert primary.emitted < len(PROSE) // 4
+        assert dispatcher.last_result["reason"] == "fit"
+        # 被取消的一方：输入按采用一方的实际用量计，再加已输出的部分
+        assert dispatcher.last_result["extra_tokens"] > 50
+
+        with open(dispatcher.path) as f:
+            stats = json.load(f)
+        assert stats["fired"] == 1 and stats["alternative_won"] == 1
+        assert stats["today"]["tokens"] == dispatcher.last_result["extra_tokens"]
+        assert "备选模式胜出 1 次（100%）" in dispatcher.summary()[0]
+
+    def test_falls_back_to_primary_when_undecided(self, dispatcher):
+        primary, alternative = FakeHandler("```python\nprint(1)\n```"), FakeHandler("没有代码")
+        output = []
+        mode, _, response = dispatcher.run([("conversation", primary), ("command", alternative)], "问题",
+                                           output.append)
+        assert mode == "conversation" and "".join(output) == response
+        assert dispatcher.last_result["reason"] == "fallback"
+        assert dispatcher.stats["alternative_won"] == 0
+
+    def test_primary_error_uses_alternative(self, dispatcher):
+        primary = FakeHandler("", error=RuntimeError("boom"))
+        alternative = FakeHandler(PROSE, delay=0.001)
+        mode, _, _ = dispatcher.run([("command", primary), ("conversation", alternative)], "问题")
+        assert mode == "conversation"
+
+        primary = FakeHandler("```zsh\nls", error=RuntimeError("stream broken"))
+        alternative = FakeHandler("", error=ValueError("bad request"))
+        with pytest.raises(RuntimeError):
+            dispatcher.run([("conversation", primary), ("document", alternative)], "问题")